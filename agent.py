@@ -1,140 +1,639 @@
-import os
-import google.generativeai as genai
-import datetime
-import logging
-from prompts import SYSTEM_PROMPT, ADMIN_PROMPT, CUSTOMER_PROMPT
-from google_services import GoogleServices
-
-# Load logger
-logger = logging.getLogger(__name__)
-
-class BarberAgent:
-    def __init__(self, api_key: str, google_services: GoogleServices, is_admin: bool = False, notify_admin_callback=None):
-        genai.configure(api_key=api_key)
-        self.services = google_services
-        self.sessions = {} # user_id -> chat_session
-        self.is_admin = is_admin
-        self.notify_admin_callback = notify_admin_callback
-
-        # Environment variables for IDs
-        self.CALENDAR_ID = os.getenv('GOOGLE_CALENDAR_ID', 'primary')
-        self.SPREADSHEET_ID = os.getenv('GOOGLE_SPREADSHEET_ID')
-
-        # Define tools list for Gemini
-        self.tools = [
-            self.create_event,
-            self.delete_event,
-            self.check_availability,
-            self.log_to_sheet
-        ]
-        
-        # Select prompt based on role
-        if is_admin:
-            prompt_template = ADMIN_PROMPT
-            logger.info("Agent initialized in ADMIN mode")
-        else:
-            prompt_template = CUSTOMER_PROMPT
-            logger.info("Agent initialized in CUSTOMER mode")
-        
-        formatted_prompt = prompt_template.format(current_time=datetime.datetime.now())
-        
-        self.model = genai.GenerativeModel(
-            model_name=os.getenv('GENAI_MODEL', 'gemini-1.5-flash'),
-            tools=self.tools,
-            system_instruction=formatted_prompt
-        )
-
-    def get_session(self, user_id):
-        # Prefix with role to separate admin/customer conversations
-        session_key = f"{'admin' if self.is_admin else 'customer'}_{user_id}"
-        if session_key not in self.sessions:
-            self.sessions[session_key] = self.model.start_chat(enable_automatic_function_calling=True)
-        return self.sessions[session_key]
-
-    # --- Tool Wrappers ---
-
-    def create_event(self, summary: str, description: str, start_time: str, end_time: str):
-        """
-        Creates a new calendar event.
-        Args:
-            summary: Title of the event (e.g., "Corte de pelo - Juan").
-            description: Details about the appointment.
-            start_time: Start time in ISO 8601 format (YYYY-MM-DDTHH:MM:SS).
-            end_time: End time in ISO 8601 format.
-        """
-        # Append Telegram ID reference to description for the scheduler
-        if hasattr(self, 'current_user_id') and self.current_user_id:
-            description = f"{description}\n\nRef: {self.current_user_id}"
-            
-        result = self.services.create_event(self.CALENDAR_ID, summary, description, start_time, end_time)
-        
-        # Immediate notification for the barber
-        if self.notify_admin_callback and not self.is_admin:
-            try:
-                # We can't await inside the tool if it's called synchronously by Gemini in a loop,
-                # but process_message is where it's called. Wait, send_message is synchronous in the current setup.
-                # Actually, our notify_admin_callback will be a regular function that eventually uses asyncio.create_task or equivalent.
-                self.notify_admin_callback(summary, start_time)
-            except Exception as e:
-                logger.error(f"Error in notify_admin_callback: {e}")
-                
-        return result
-
-    def delete_event(self, event_id: str):
-        """
-        Deletes a calendar event by its ID.
-        Args:
-            event_id: The unique identifier of the event to delete.
-        """
-        logger.info(f"Tool Call: delete_event {event_id}")
-        return self.services.delete_event(self.CALENDAR_ID, event_id)
-
-    def check_availability(self, time_min: str, time_max: str):
-        """
-        Checks calendar availability between two times.
-        Args:
-            time_min: Start of the range to check (ISO 8601).
-            time_max: End of the range to check (ISO 8601).
-        Returns:
-            List of events found in that range.
-        """
-        logger.info(f"Tool Call: check_availability {time_min} to {time_max}")
-        return self.services.check_availability(self.CALENDAR_ID, time_min, time_max)
-
-    def log_to_sheet(self, nombre: str, servicio: str, precio: str, hora: str, estatus: str, dia: str, celular: str, event_id: str):
-        """
-        Logs an action (appointment, cancellation, etc.) to Google Sheets.
-        Args:
-            nombre: Customer name.
-            servicio: Service name.
-            precio: Price of the service.
-            hora: Time of service (HH:mm:ss).
-            estatus: Status ('agendado', 'eliminado', 'actualizado').
-            dia: Date of service (YYYY-MM-DD).
-            celular: Customer phone number (Telegram ID).
-            event_id: Google Calendar Event ID.
-        """
-        logger.info(f"Tool Call: log_to_sheet {nombre} - {estatus}")
-        if not self.SPREADSHEET_ID:
-            return "Error: SPREADSHEET_ID not configured."
-            
-        RANGE = "Hoja 1!A:I" # Adjust if your sheet name is different
-        values = [nombre, servicio, precio, hora, estatus, dia, celular, event_id, "Python-Bot"]
-        return self.services.log_to_sheet(self.SPREADSHEET_ID, RANGE, values)
-
-    def process_message(self, user_id: str, text: str):
-        """
-        Process a user message and return the agent's response.
-        """
-        self.current_user_id = user_id
-        session = self.get_session(user_id)
-        
-        # Inject current time and User ID context
-        current_context = f"[System: Current Time: {datetime.datetime.now()}, User_ID: {user_id}]\nUser: {text}"
-        
-        try:
-            response = session.send_message(current_context)
-            return response.text
-        except Exception as e:
-            logger.error(f"Error in chat session: {e}")
-            return "Lo siento, tuve un problema procesando tu mensaje. Intenta de nuevo."
+import os
+import time
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from prompts import SYSTEM_PROMPT, ADMIN_PROMPT, CUSTOMER_PROMPT
+from google_services import GoogleServices, LOG_SHEET_RANGE
+from services.history_service import ConversationHistory
+from services.appointment_index import AppointmentIndex, to_utc_iso, to_local_dt
+from services.barbers import load_barbers, find_barber, pick_chair, business_bounds
+from services import resilience
+from services.resilience import CircuitOpenError
+from services.tool_results import to_model
+from services.metrics import span, timed_tool, DEGRADED_RESPONSES, DEPENDENCY_RETRIES
+
+# Load logger
+logger = logging.getLogger(__name__)
+
+# Herramientas que usan el resultado de otra pedida en el mismo paso del modelo:
+# tool -> (herramienta previa, argumento a completar, campo de su resultado)
+TOOL_DEPENDENCIES = {'log_to_sheet': ('create_event', 'event_id', 'id')}
+# Tope de idas y vueltas con el modelo en un turno (evita bucles de herramientas)
+MAX_TOOL_ROUNDS = int(os.getenv('MAX_TOOL_ROUNDS', 6))
+# Pool compartido para las llamadas a herramientas independientes de un mismo paso
+_tool_pool = ThreadPoolExecutor(max_workers=int(os.getenv('TOOL_WORKERS', 8)), thread_name_prefix='tool')
+
+GEMINI_UNAVAILABLE_REPLY = "⏳ Estoy con mucha demanda en este momento. Escríbeme de nuevo en un minuto, por favor."
+
+class BarberAgent:
+    # Historial compartido entre instancias: handle_message crea un agente por mensaje
+    history = ConversationHistory()
+    # Las herramientas independientes corren en paralelo (_tool_pool): += no es atómico entre hilos
+    _writes_lock = threading.Lock()
+
+    def __init__(self, api_key: str, google_services: GoogleServices, is_admin: bool = False, notify_admin_callback=None, intent_router=None, appointment_index: AppointmentIndex = None, analytics=None, agenda=None, waitlist=None, recurrences=None, booking_queue=None, booking_keys=None, ledger=None):
+        # Import diferido: el SDK de Gemini tarda ~0.7s en cargar y no hace falta para arrancar
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._protos = genai.protos
+        self.services = google_services
+        self.is_admin = is_admin
+        self.notify_admin_callback = notify_admin_callback
+        self.intent_router = intent_router
+        self.appointment_index = appointment_index
+        self.analytics = analytics
+        self.agenda = agenda
+        self.waitlist = waitlist
+        self.recurrences = recurrences
+        self.booking_queue = booking_queue
+        self.booking_keys = booking_keys
+        self.ledger = ledger
+        # Escrituras hechas en el turno actual: si hubo alguna, el turno no se reintenta
+        self._writes = 0
+        # Reserva del turno actual que quedó en cola (Calendar caído); la cola la registra al crearla
+        self._queued_booking = None
+
+        # Environment variables for IDs (one calendar per barber/chair; the first one is the default)
+        self.barbers = load_barbers()
+        self.CALENDAR_ID = self.barbers[0]['calendar_id']
+        self.SPREADSHEET_ID = os.getenv('GOOGLE_SPREADSHEET_ID')
+
+        # Define tools list for Gemini
+        self.tools = [
+            self.create_event,
+            self.delete_event,
+            self.check_availability,
+            self.log_to_sheet
+        ]
+        if is_admin:
+            # Aggregated business stats over the local booking history
+            self.tools += [self.get_agenda, self.get_business_stats]
+        else:
+            # Self-service lookups over the appointments index (customers only)
+            self.tools += [self.my_appointments, self.cancel_my_appointment]
+            if waitlist:
+                self.tools += [self.join_waitlist, self.leave_waitlist]
+            if recurrences:
+                self.tools += [self.create_recurring_appointment, self.skip_recurring_appointment,
+                               self.stop_recurring_appointment]
+        
+        # Select prompt based on role
+        if is_admin:
+            prompt_template = ADMIN_PROMPT
+            logger.info("Agent initialized in ADMIN mode")
+        else:
+            prompt_template = CUSTOMER_PROMPT
+            logger.info("Agent initialized in CUSTOMER mode")
+        
+        formatted_prompt = prompt_template.format(current_time=datetime.datetime.now())
+        
+        self.model = genai.GenerativeModel(
+            model_name=os.getenv('GENAI_MODEL', 'gemini-1.5-flash'),
+            tools=self.tools,
+            system_instruction=formatted_prompt
+        )
+
+    def get_session_key(self, user_id):
+        # Prefix with role to separate admin/customer conversations
+        return f"{'admin' if self.is_admin else 'customer'}_{user_id}"
+
+    def get_session(self, user_id):
+        # The stored history is already compacted (recent turns + summary of known facts).
+        # Tool calls are run by _run_turn (independent calls in parallel), not by the SDK.
+        history = self.history.get(self.get_session_key(user_id))
+        return self.model.start_chat(history=history, enable_automatic_function_calling=False)
+
+    # --- Function calling ---
+
+    def _call_tool(self, name, args):
+        tool = next((t for t in self.tools if t.__name__ == name), None)
+        if not tool:
+            return f"Error: unknown tool {name}."
+        try:
+            return tool(**args)
+        except Exception as e:
+            logger.error(f"Error in tool {name}: {e}")
+            return f"Error: {e}"
+
+    def _run_tools(self, calls):
+        """
+        Runs the tool calls of one model step. Independent calls run concurrently; a call that
+        depends on another one of the same step (TOOL_DEPENDENCIES) runs after it, with the
+        missing argument taken from its result. Returns the results in the order of calls.
+        """
+        names = [call.name for call in calls]
+        args = [dict(call.args) for call in calls]
+        results = [None] * len(calls)
+        sources = self._pair_dependencies(names, args)
+
+        for wave in ([i for i in range(len(calls)) if i not in sources], sorted(sources)):
+            runnable = []
+            for i in wave:
+                if i in sources:
+                    source, arg, field = TOOL_DEPENDENCIES[names[i]]
+                    result = results[sources[i]]
+                    if not isinstance(result, dict):
+                        results[i] = f"Skipped: {source} did not succeed."
+                        continue
+                    args[i][arg] = result.get(field) or ''
+                runnable.append(i)
+            if len(runnable) == 1:
+                results[runnable[0]] = self._call_tool(names[runnable[0]], args[runnable[0]])
+            elif runnable:
+                futures = {i: _tool_pool.submit(self._call_tool, names[i], args[i]) for i in runnable}
+                for i, future in futures.items():
+                    results[i] = future.result()
+        return results
+
+    @staticmethod
+    def _pair_dependencies(names, args):
+        """
+        {index of the dependent call: index of its source}. Only calls missing the argument
+        depend (an event_id the model already passed is kept), and the n-th of them is paired
+        with the n-th source call. If the counts differ the pairing is ambiguous and they run
+        as they are.
+        """
+        pairs = {}
+        for name, (source, arg, _) in TOOL_DEPENDENCIES.items():
+            waiting = [i for i, n in enumerate(names) if n == name and not args[i].get(arg)]
+            producers = [i for i, n in enumerate(names) if n == source]
+            if waiting and len(waiting) == len(producers):
+                pairs.update(zip(waiting, producers))
+            elif waiting and producers:
+                logger.warning(f"{len(waiting)} {name} calls for {len(producers)} {source} calls: running them without {arg}.")
+        return pairs
+
+    def _function_response(self, name, result):
+        # Registros mínimos en JSON plano (sin descripciones ni Refs para clientes)
+        result = to_model(name, result, customer=not self.is_admin)
+        return self._protos.Part(function_response=self._protos.FunctionResponse(name=name, response={'result': result}))
+
+    def _run_turn(self, circuit, session, content):
+        """Sends the user message and answers the model's tool calls until it replies with text."""
+        options = {'timeout': resilience.GEMINI_TIMEOUT}
+        response = circuit.call(session.send_message, content, request_options=options)
+        for _ in range(MAX_TOOL_ROUNDS):
+            calls = [part.function_call for part in response.parts if part.function_call.name]
+            if not calls:
+                return response
+            with span('tool_step'):
+                results = self._run_tools(calls)
+            # All the results of the step go back in a single message (one round trip)
+            response = circuit.call(session.send_message,
+                                    [self._function_response(c.name, r) for c, r in zip(calls, results)],
+                                    request_options=options)
+        return response
+
+    # --- Barbers / chairs ---
+
+    @property
+    def multi_chair(self):
+        return len(self.barbers) > 1
+
+    def free_barber(self, start_time, end_time, barber=''):
+        """
+        Barber free for [start_time, end_time): the requested one, or the one that leaves
+        the fewest dead gaps (one freeBusy call for every chair). None if nobody is free.
+        """
+        if not self.multi_chair:
+            busy = self.services.free_busy([self.CALENDAR_ID], to_utc_iso(start_time), to_utc_iso(end_time))
+            return None if busy.get(self.CALENDAR_ID) else self.barbers[0]
+        candidates = [find_barber(self.barbers, barber)] if barber else self.barbers
+        if candidates == [None]:
+            return None
+        start, end = to_local_dt(start_time), to_local_dt(end_time)
+        opening, closing = business_bounds(start.date())
+        busy = self.services.free_busy([b['calendar_id'] for b in self.barbers],
+                                       to_utc_iso(min(opening, start).isoformat()), to_utc_iso(max(closing, end).isoformat()))
+        return pick_chair(candidates, busy, start, end)
+
+    def _calendar_of(self, event_id):
+        if not self.multi_chair:
+            return self.CALENDAR_ID
+        known = self.appointment_index.calendar_of(event_id) if self.appointment_index else None
+        if known:
+            return known
+        # Evento que no está en el índice (p. ej. creado a mano): buscarlo en cada silla
+        for barber in self.barbers:
+            if self.services.get_event(barber['calendar_id'], event_id):
+                return barber['calendar_id']
+        return self.CALENDAR_ID
+
+    # --- Tool Wrappers ---
+
+    @timed_tool
+    def create_event(self, summary: str, description: str, start_time: str, end_time: str, barber: str = ""):
+        """
+        Creates a new calendar event.
+        Args:
+            summary: Title of the event (e.g., "Corte de pelo - Juan").
+            description: Details about the appointment.
+            start_time: Start time in ISO 8601 format (YYYY-MM-DDTHH:MM:SS).
+            end_time: End time in ISO 8601 format.
+            barber: Barber the customer asked for. Empty string lets the system pick a free chair.
+        """
+        calendar_id, chosen = self.CALENDAR_ID, None
+        user_id = getattr(self, 'current_user_id', None)
+        if self.multi_chair and self.booking_keys and user_id:
+            # Antes de elegir silla: un "sí, agéndame" repetido vería ocupada la silla de su propia cita
+            try:
+                existing = self.booking_keys.find(self.services, calendar_id, user_id, summary, start_time)
+            except Exception as e:
+                logger.warning(f"Could not look up the booking key: {e}")
+                existing = None
+            if existing:
+                return {**existing, 'duplicate': True}
+        if self.multi_chair:
+            if barber and not find_barber(self.barbers, barber):
+                return f"Error: unknown barber. Options: {', '.join(b['name'] for b in self.barbers)}."
+            try:
+                chosen = self.free_barber(start_time, end_time, barber)
+            except Exception as e:
+                logger.error(f"Error checking barbers' availability: {e}")
+                return "Error: could not check the barbers' availability."
+            if not chosen:
+                return "Error: no barber is free at that time."
+            calendar_id = chosen['calendar_id']
+            description = f"{description}\n\nBarbero: {chosen['name']}"
+
+        # Append Telegram ID reference to description for the scheduler
+        if hasattr(self, 'current_user_id') and self.current_user_id:
+            description = f"{description}\n\nRef: {self.current_user_id}"
+            
+        try:
+            if self.booking_keys and user_id:
+                # Same customer + start + service -> same event ID: a repeated call returns the existing event
+                result, duplicate = self.booking_keys.create_once(self.services, calendar_id, user_id, summary,
+                                                                  description, start_time, end_time)
+            else:
+                result, duplicate = self.services.create_event(calendar_id, summary, description, start_time, end_time), False
+        except Exception as e:
+            # Calendar caído o lento: la reserva queda en cola y se crea cuando vuelva
+            logger.error(f"Calendar unavailable in create_event: {e}")
+            return self._queue_booking(calendar_id, summary, description, start_time, end_time)
+        if not result:
+            return "Error: Google Calendar rejected the event."
+        if duplicate:
+            return {**result, 'duplicate': True}
+        self._count_write()
+        if chosen:
+            result['barber'] = chosen['name']
+
+        if self.appointment_index and getattr(self, 'current_user_id', None):
+            self.appointment_index.record_created(self.current_user_id, result, calendar_id)
+        if self.agenda:
+            self.agenda.apply_created(result, calendar_id)
+        if self.ledger:
+            self.ledger.record_created(result, user_id, calendar_id)
+        
+        # Immediate notification for the barber
+        if self.notify_admin_callback and not self.is_admin:
+            try:
+                # We can't await inside the tool if it's called synchronously by Gemini in a loop,
+                # but process_message is where it's called. Wait, send_message is synchronous in the current setup.
+                # Actually, our notify_admin_callback will be a regular function that eventually uses asyncio.create_task or equivalent.
+                self.notify_admin_callback(summary, start_time)
+            except Exception as e:
+                logger.error(f"Error in notify_admin_callback: {e}")
+                
+        return result
+
+    def _count_write(self):
+        """Cuenta una escritura del turno (cita, cancelación, hoja); se llama solo después de que salió bien."""
+        with self._writes_lock:
+            self._writes += 1
+
+    def _queue_booking(self, calendar_id, summary, description, start_time, end_time):
+        if not self.booking_queue:
+            return "Error: Google Calendar is not responding. Ask the customer to try again in a few minutes."
+        booking = self.booking_queue.enqueue(getattr(self, 'current_user_id', None), calendar_id, summary,
+                                             description, start_time, end_time)
+        if not booking:
+            return "Error: Google Calendar is not responding. Ask the customer to try again in a few minutes."
+        self._count_write()
+        self._queued_booking = booking['id']
+        DEGRADED_RESPONSES.labels(fallback='queued_booking').inc()
+        return {'status': 'queued', 'id': None,
+                'message': "Calendar is temporarily unavailable. The booking was saved and will be confirmed to the customer automatically as soon as it is created. Tell the customer that."}
+
+    @timed_tool
+    def delete_event(self, event_id: str):
+        """
+        Deletes a calendar event by its ID.
+        Args:
+            event_id: The unique identifier of the event to delete.
+        """
+        logger.info(f"Tool Call: delete_event {event_id}")
+        calendar_id = self._calendar_of(event_id)
+        # Con lista de espera hace falta saber qué espacio queda libre: el índice ya tiene inicio y fin
+        # (una cita creada a mano, sin Ref:, no está en el índice y no se ofrece)
+        freed = self.appointment_index.get(event_id) if self.waitlist and self.appointment_index else None
+        result = self.services.delete_event(calendar_id, event_id)
+        if result:
+            self._count_write()
+        if result and self.appointment_index:
+            self.appointment_index.record_deleted(event_id)
+        if result and self.agenda:
+            self.agenda.apply_deleted(event_id)
+        if result and self.ledger:
+            self.ledger.record_deleted(event_id)
+        if result and freed and freed.get('end_time'):
+            self.waitlist.slot_freed(freed['start_time'], freed['end_time'])
+        return result
+
+    @timed_tool
+    def my_appointments(self):
+        """
+        Lists the current customer's upcoming appointments (no date range needed).
+        Returns:
+            List of appointments with id, start (UTC), end and title.
+        """
+        logger.info("Tool Call: my_appointments")
+        if not self.appointment_index:
+            return "Error: appointments index not available."
+        return self.appointment_index.get_upcoming(self.current_user_id)
+
+    @timed_tool
+    def cancel_my_appointment(self, event_id: str):
+        """
+        Cancels one of the current customer's own appointments.
+        Args:
+            event_id: ID returned by my_appointments. Use an empty string if the customer has a single upcoming appointment.
+        """
+        logger.info(f"Tool Call: cancel_my_appointment {event_id}")
+        if not self.appointment_index:
+            return "Error: appointments index not available."
+        upcoming = self.appointment_index.get_upcoming(self.current_user_id)
+        if not event_id and len(upcoming) == 1:
+            event_id = upcoming[0]['event_id']
+        if event_id not in {a['event_id'] for a in upcoming}:
+            return "Error: the customer has no upcoming appointment with that ID."
+        return self.delete_event(event_id)
+
+    @timed_tool
+    def get_agenda(self, day: str = ""):
+        """
+        Returns the ready-made agenda (time and title of every appointment, per barber) for one day. Prefer it over check_availability for "what do I have today/tomorrow?".
+        Args:
+            day: Date in YYYY-MM-DD format. Empty string means today.
+        """
+        logger.info(f"Tool Call: get_agenda {day}")
+        if not self.agenda:
+            return "Error: agenda cache not available."
+        try:
+            target = datetime.date.fromisoformat(day) if day else None
+        except ValueError:
+            return "Error: invalid date. Use YYYY-MM-DD."
+        return self.agenda.get_combined(self.services, self.barbers, target) or "Error: could not load the agenda."
+
+    @timed_tool
+    def get_business_stats(self, period: str = "mes", start_date: str = "", end_date: str = ""):
+        """
+        Business statistics: bookings, revenue by service, busiest day and hours, no-shows and top customers.
+        Args:
+            period: 'hoy', 'semana', 'mes', 'mes_pasado' or 'ano'. Ignored if start_date is given.
+            start_date: Optional start date (YYYY-MM-DD) for a custom range.
+            end_date: Optional end date (YYYY-MM-DD, inclusive) for a custom range.
+        """
+        logger.info(f"Tool Call: get_business_stats {period} {start_date} {end_date}")
+        if not self.analytics:
+            return "Error: analytics not available."
+        try:
+            return self.analytics.report(period, start_date or None, end_date or None)
+        except ValueError as e:
+            return f"Error: invalid date ({e}). Use YYYY-MM-DD."
+
+    @timed_tool
+    def join_waitlist(self, day: str, start_time: str = "", end_time: str = "", service: str = "", name: str = ""):
+        """
+        Puts the current customer on the waitlist for a day when the slot they wanted is taken.
+        If a matching slot frees up, the customer gets a message and can accept it by replying "sí".
+        Args:
+            day: Date in YYYY-MM-DD format.
+            start_time: Earliest acceptable time (HH:MM, 24h). Empty string means any time that day.
+            end_time: Latest acceptable end time (HH:MM, 24h). Empty string means any time that day.
+            service: Requested service name.
+            name: Customer name.
+        """
+        logger.info(f"Tool Call: join_waitlist {day} {start_time}-{end_time}")
+        try:
+            entry = self.waitlist.join(self.current_user_id, day, start_time, end_time, service, name)
+        except ValueError as e:
+            return f"Error: {e}. Use day YYYY-MM-DD and times HH:MM."
+        if not entry:
+            return "Error: could not save the waitlist entry."
+        return {'status': 'waiting', 'day': entry['day'], 'from': entry['start_time'], 'to': entry['end_time']}
+
+    @timed_tool
+    def leave_waitlist(self):
+        """
+        Removes the current customer from the waitlist.
+        """
+        logger.info("Tool Call: leave_waitlist")
+        return {'removed': self.waitlist.leave(self.current_user_id)}
+
+    @timed_tool
+    def create_recurring_appointment(self, summary: str, description: str, start_time: str, end_time: str, every_weeks: int, barber: str = ""):
+        """
+        Books a repeating appointment for the current customer (same weekday and time every N weeks).
+        All upcoming instances are created at once; instances that clash with existing appointments are skipped and returned as conflicts.
+        Args:
+            summary: Title of the event (e.g., "Corte de pelo - Juan").
+            description: Details about the appointment.
+            start_time: Start of the first appointment in ISO 8601 format (YYYY-MM-DDTHH:MM:SS).
+            end_time: End of the first appointment in ISO 8601 format.
+            every_weeks: Repeat every this many weeks (e.g. 2 or 3).
+            barber: Barber the customer asked for. Empty string lets the system pick a free chair.
+        """
+        logger.info(f"Tool Call: create_recurring_appointment every {every_weeks} weeks from {start_time}")
+        calendar_id = self.CALENDAR_ID
+        if self.multi_chair:
+            # La serie queda en la silla libre para la primera cita
+            try:
+                chosen = self.free_barber(start_time, end_time, barber)
+            except Exception as e:
+                logger.error(f"Error checking barbers' availability: {e}")
+                return "Error: could not check the barbers' availability."
+            if not chosen:
+                return "Error: no barber is free for the first appointment."
+            calendar_id = chosen['calendar_id']
+        try:
+            result = self.recurrences.create(self.services, calendar_id, self.current_user_id, summary,
+                                             description, start_time, end_time, every_weeks)
+        except ValueError as e:
+            return f"Error: {e}."
+        except Exception as e:
+            logger.error(f"Error creating recurring appointment: {e}")
+            return "Error: Google Calendar is not responding. Ask the customer to try again in a few minutes."
+        self._count_write()
+        if result['booked'] and self.notify_admin_callback:
+            try:
+                self.notify_admin_callback(f"{summary} (cada {result['every_weeks']} semanas)", result['booked'][0])
+            except Exception as e:
+                logger.error(f"Error in notify_admin_callback: {e}")
+        return result
+
+    @timed_tool
+    def skip_recurring_appointment(self, day: str):
+        """
+        Skips one occurrence of the current customer's repeating appointment (cancels it if already booked).
+        Args:
+            day: Date of the occurrence to skip (YYYY-MM-DD).
+        """
+        logger.info(f"Tool Call: skip_recurring_appointment {day}")
+        try:
+            result = self.recurrences.skip(self, self.current_user_id, day)
+        except ValueError:
+            return "Error: invalid date. Use YYYY-MM-DD."
+        if not result:
+            return "Error: the customer has no repeating appointment on that day."
+        self._count_write()
+        return result
+
+    @timed_tool
+    def stop_recurring_appointment(self):
+        """
+        Stops the current customer's repeating appointments and cancels their upcoming occurrences.
+        """
+        logger.info("Tool Call: stop_recurring_appointment")
+        result = self.recurrences.stop(self, self.current_user_id)
+        if result['stopped']:
+            self._count_write()
+        return result
+
+    @timed_tool
+    def check_availability(self, time_min: str, time_max: str):
+        """
+        Checks calendar availability between two times.
+        Args:
+            time_min: Start of the range to check (ISO 8601).
+            time_max: End of the range to check (ISO 8601).
+        Returns:
+            Admin: list of events found in that range. Customers: busy intervals (per barber if there are several) and whether the range is free.
+        """
+        logger.info(f"Tool Call: check_availability {time_min} to {time_max}")
+        if self.is_admin:
+            # El dueño necesita ver qué cliente tiene cada cita
+            if not self.multi_chair:
+                return self.services.check_availability(self.CALENDAR_ID, time_min, time_max)
+            return [{'barber': b['name'], 'events': self.services.check_availability(b['calendar_id'], time_min, time_max)}
+                    for b in self.barbers]
+        # Para saber si hay espacio bastan los intervalos ocupados (freeBusy, sin cargar eventos)
+        try:
+            busy = self.services.free_busy([b['calendar_id'] for b in self.barbers], to_utc_iso(time_min), to_utc_iso(time_max))
+        except Exception as e:
+            logger.error(f"Error in free_busy: {e}")
+            return self._cached_availability(time_min, time_max)
+        if not self.multi_chair:
+            return {'free': not busy.get(self.CALENDAR_ID), 'busy': busy.get(self.CALENDAR_ID, [])}
+        return [{'barber': b['name'], 'free': not busy.get(b['calendar_id']), 'busy': busy.get(b['calendar_id'], [])}
+                for b in self.barbers]
+
+    def _cached_availability(self, time_min, time_max):
+        """Calendar no responde: ocupación según el índice de citas local (puede no incluir eventos creados a mano)."""
+        if not self.appointment_index:
+            return "Error: could not check availability."
+        start, end = to_utc_iso(time_min), to_utc_iso(time_max)
+        # Citas que empiezan hasta un día antes pueden cruzarse con el rango
+        earlier = to_utc_iso((to_local_dt(time_min) - datetime.timedelta(days=1)).isoformat())
+        booked = [a for a in self.appointment_index.db.get_appointments_between(earlier, end)
+                  if (a.get('end_time') or a['start_time']) > start]
+        DEGRADED_RESPONSES.labels(fallback='cached_availability').inc()
+        busy = {}
+        for a in booked:
+            busy.setdefault(a.get('calendar_id') or self.CALENDAR_ID, []).append({'start': a['start_time'], 'end': a.get('end_time') or a['start_time']})
+        if not self.multi_chair:
+            intervals = [i for intervals in busy.values() for i in intervals]
+            return {'free': not intervals, 'busy': intervals, 'source': 'cache'}
+        return [{'barber': b['name'], 'free': not busy.get(b['calendar_id']), 'busy': busy.get(b['calendar_id'], []),
+                 'source': 'cache'} for b in self.barbers]
+
+    @timed_tool
+    def log_to_sheet(self, nombre: str, servicio: str, precio: str, hora: str, estatus: str, dia: str, celular: str, event_id: str):
+        """
+        Logs an action (appointment, cancellation, etc.) to Google Sheets.
+        Args:
+            nombre: Customer name.
+            servicio: Service name.
+            precio: Price of the service.
+            hora: Time of service (HH:mm:ss).
+            estatus: Status ('agendado', 'eliminado', 'actualizado', 'no asistió').
+            dia: Date of service (YYYY-MM-DD).
+            celular: Customer phone number (Telegram ID).
+            event_id: Google Calendar Event ID.
+        """
+        logger.info(f"Tool Call: log_to_sheet - {estatus}")
+        if not self.SPREADSHEET_ID:
+            return "Error: SPREADSHEET_ID not configured."
+        if estatus == 'agendado' and event_id and self.booking_keys and not self.booking_keys.first_log(event_id):
+            return "Already logged: this appointment is already in the sheet."
+        if estatus == 'agendado' and not event_id and getattr(self, '_queued_booking', None):
+            # BookingQueue.flush records it under the real event id once Calendar creates it:
+            # logging it now would leave a second, id-less row in the sheet and count it twice
+            return {'status': 'queued', 'message': "Nothing to log yet: the queued booking is logged automatically once it is created."}
+            
+        values = [nombre, servicio, precio, hora, estatus, dia, celular, event_id, "Python-Bot"]
+        if self.ledger:
+            # Write-behind: the local ledger is the record; the reconciler copies it to the sheet in batches
+            entry = self.ledger.record_values(values)
+            if not entry:
+                return "Error: could not save the record."
+            result = {'status': 'logged', 'event_id': entry['event_id']}
+        else:
+            result = self.services.log_to_sheet(self.SPREADSHEET_ID, LOG_SHEET_RANGE, values)
+        self._count_write()
+        if self.analytics:
+            self.analytics.record(values)
+        return result
+
+    def process_message(self, user_id: str, text: str):
+        """
+        Process a user message and return the agent's response.
+        """
+        self.current_user_id = user_id
+        self._queued_booking = None
+
+        # Fast-path: intenciones comunes de clientes sin pasar por Gemini
+        if self.intent_router and not self.is_admin:
+            with span('fast_path'):
+                fast_reply = self.intent_router.route(self, user_id, text)
+            if fast_reply:
+                self.history.append_exchange(self.get_session_key(user_id), text, fast_reply)
+                return fast_reply
+
+        # Gemini marcado como caído: responder de inmediato en vez de esperar el timeout
+        circuit = resilience.breaker('gemini')
+        if circuit.is_open():
+            DEGRADED_RESPONSES.labels(fallback='gemini_unavailable').inc()
+            return GEMINI_UNAVAILABLE_REPLY
+
+        started = time.perf_counter()
+        
+        # Inject current time and User ID context
+        current_context = f"[System: Current Time: {datetime.datetime.now()}, User_ID: {user_id}]\nUser: {text}"
+        
+        self._writes = 0
+        for attempt in range(resilience.RETRY_ATTEMPTS):
+            # Sesión nueva en cada intento: la fallida pudo quedar con el turno a medias
+            session = self.get_session(user_id)
+            try:
+                with span('gemini_turn'):
+                    response = self._run_turn(circuit, session, current_context)
+                self.history.save(self.get_session_key(user_id), session.history)
+                if self.intent_router:
+                    self.intent_router.record_llm_latency(time.perf_counter() - started)
+                return response.text
+            except Exception as e:
+                # Solo se reintenta si el turno no alcanzó a escribir nada (cita, cancelación, hoja)
+                if resilience.is_transient(e) and self._writes == 0 and attempt + 1 < resilience.RETRY_ATTEMPTS \
+                        and not circuit.is_open():
+                    DEPENDENCY_RETRIES.labels(dependency='gemini').inc()
+                    logger.warning(f"Gemini: error transitorio (intento {attempt + 1}): {e}")
+                    time.sleep(resilience.backoff_delay(attempt))
+                    continue
+                logger.error(f"Error in chat session: {e}")
+                if isinstance(e, CircuitOpenError) or (resilience.is_transient(e) and circuit.is_open()):
+                    return GEMINI_UNAVAILABLE_REPLY
+                return "Lo siento, tuve un problema procesando tu mensaje. Intenta de nuevo."
@@ -0,0 +1,300 @@
+"""
+Backends falsos en proceso para medir el bot sin red ni credenciales reales:
+Telegram (Update/Context/Bot), Gemini (modelo guionado que llama herramientas)
+y Google Calendar/Sheets (transporte HTTP con latencia configurable).
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import datetime
+import itertools
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs, unquote
+
+import httpx
+import httplib2
+
+
+# --- Google Calendar / Sheets ---
+
+class FakeGoogleBackend:
+    """Calendar + Sheets en memoria, servido por HTTP falso (httplib2 y httpx)."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.events = {}  # event_id -> event
+        self.sheet_rows = []
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def add_event(self, summary, start, end, description=''):
+        event_id = uuid.uuid4().hex
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        # Mismos campos que devuelve Calendar para un evento normal (sin fields=)
+        self.events[event_id] = {
+            'kind': 'calendar#event', 'etag': f'"{uuid.uuid4().int % 10 ** 16}"', 'id': event_id,
+            'status': 'confirmed', 'htmlLink': f"https://www.google.com/calendar/event?eid={event_id}",
+            'created': now, 'updated': now, 'summary': summary, 'description': description,
+            'creator': {'email': 'barberia@example.com', 'self': True},
+            'organizer': {'email': 'barberia@example.com', 'self': True},
+            'start': {'dateTime': start, 'timeZone': 'America/Bogota'},
+            'end': {'dateTime': end, 'timeZone': 'America/Bogota'},
+            'iCalUID': f"{event_id}@google.com", 'sequence': 0, 'reminders': {'useDefault': True},
+            'eventType': 'default',
+        }
+        return self.events[event_id]
+
+    def handle(self, method, url, body=None):
+        """Devuelve (status, payload) para una petición a las APIs de Google."""
+        self.requests += 1
+        parsed = urlparse(url)
+        path = unquote(parsed.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        data = json.loads(body) if body else {}
+
+        if path.endswith(':append'):
+            self.sheet_rows.extend(data.get('values', []))
+            return 200, {'updates': {'updatedCells': sum(len(r) for r in data.get('values', []))}}
+
+        if method == 'GET' and '/values/' in path:
+            return 200, {'range': path.rsplit('/values/', 1)[1], 'majorDimension': 'ROWS', 'values': self.sheet_rows}
+
+        if path.endswith('/freeBusy'):
+            calendars = {}
+            for item in data.get('items', []):
+                busy = [{'start': e['start']['dateTime'], 'end': e['end']['dateTime']}
+                        for e in self._in_range(data.get('timeMin'), data.get('timeMax'))]
+                calendars[item['id']] = {'busy': busy}
+            return 200, partial_response({'kind': 'calendar#freeBusy', 'timeMin': data.get('timeMin'),
+                                          'timeMax': data.get('timeMax'), 'calendars': calendars}, query.get('fields'))
+
+        match = re.search(r"/calendars/([^/]+)/events(?:/([^/]+))?$", path)
+        if not match:
+            return 404, {'error': {'code': 404, 'message': f"Not found: {path}"}}
+        event_id = match.group(2)
+
+        if method == 'GET' and not event_id:
+            items = sorted(self._in_range(query.get('timeMin'), query.get('timeMax')), key=lambda e: e['start']['dateTime'])
+            size, offset = int(query.get('maxResults', 250)), int(query.get('pageToken', 0))
+            page = {'kind': 'calendar#events', 'summary': 'barberia@example.com', 'timeZone': 'America/Bogota',
+                    'accessRole': 'owner', 'items': items[offset:offset + size]}
+            if offset + size < len(items):
+                page['nextPageToken'] = str(offset + size)
+            return 200, partial_response(page, query.get('fields'))
+        if method == 'POST':
+            if data.get('id') and data['id'] in self.events:
+                return 409, {'error': {'code': 409, 'message': 'The requested identifier already exists.'}}
+            event = self.add_event(data.get('summary'), data['start']['dateTime'], data['end']['dateTime'], data.get('description', ''))
+            if data.get('id'):
+                self.events[data['id']] = dict(self.events.pop(event['id']), id=data['id'])
+                event = self.events[data['id']]
+            for key in ('recurrence', 'extendedProperties'):
+                if key in data:
+                    event[key] = data[key]
+            return 200, event
+        if event_id not in self.events:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        if method == 'GET':
+            return 200, partial_response(self.events[event_id], query.get('fields'))
+        if method == 'DELETE':
+            del self.events[event_id]
+            return 204, None
+        if method in ('PUT', 'PATCH'):
+            event = self.events[event_id]
+            event.update(data)
+            return 200, event
+        return 405, {'error': {'code': 405, 'message': 'Method not allowed'}}
+
+    def _in_range(self, time_min, time_max):
+        def parse(value):
+            dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))
+
+        low = parse(time_min) if time_min else None
+        high = parse(time_max) if time_max else None
+        for event in list(self.events.values()):
+            start = parse(event['start']['dateTime'])
+            if (low is None or start >= low) and (high is None or start < high):
+                yield event
+
+    # Adaptadores de transporte
+
+    def httplib2_http(self):
+        return FakeHttplib2(self)
+
+    def httpx_transport(self):
+        async def handler(request):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            status, payload = self.handle(request.method, str(request.url), request.content or None)
+            content = b'' if payload is None else json.dumps(payload).encode()
+            self.bytes_sent += len(content)
+            return httpx.Response(status, content=content, headers={'content-type': 'application/json'})
+        return httpx.MockTransport(handler)
+
+
+def _split_fields(spec):
+    parts, depth, current = [], 0, ''
+    for char in spec:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += (char == '(') - (char == ')')
+        current += char
+    return parts + [current]
+
+
+def partial_response(value, fields):
+    """Aplica un `fields=` ('a,b(c,d)') como lo hacen las APIs de Google."""
+    if not fields:
+        return value
+    if isinstance(value, list):
+        return [partial_response(v, fields) for v in value]
+    if not isinstance(value, dict):
+        return value
+    masked = {}
+    for part in _split_fields(fields):
+        name, _, sub = part.partition('(')
+        if name in value:
+            masked[name] = partial_response(value[name], sub[:-1] if sub else None)
+    return masked
+
+
+class FakeHttplib2:
+    """Sustituto de httplib2.Http para googleapiclient (camino síncrono)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.timeout = None
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        status, payload = self.backend.handle(method, uri, body)
+        content = b'' if payload is None else json.dumps(payload).encode()
+        self.backend.bytes_sent += len(content)
+        return httplib2.Response({'status': status, 'content-type': 'application/json'}), content
+
+    def close(self):
+        pass
+
+
+# --- Gemini ---
+
+BOOKING_RE = re.compile(r"agend|reserv", re.IGNORECASE)
+
+
+def _response(text='', calls=()):
+    """Respuesta con la forma de GenerateContentResponse que usa el agente (.text y .parts)."""
+    parts = [SimpleNamespace(function_call=SimpleNamespace(name=name, args=args)) for name, args in calls]
+    if text:
+        parts.append(SimpleNamespace(function_call=SimpleNamespace(name='', args={}), text=text))
+    return SimpleNamespace(text=text, parts=parts)
+
+
+class ScriptedChatSession:
+    """
+    Imita ChatSession sin function calling automático: para mensajes de agendado pide
+    check_availability y luego create_event + log_to_sheet en un mismo paso, como pide
+    CUSTOMER_PROMPT; el agente ejecuta las herramientas y devuelve los resultados.
+    """
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+        self._steps = []
+
+    def _round_trip(self):
+        type(self.model).calls += 1
+        if self.model.latency:
+            time.sleep(self.model.latency)
+
+    def _booking_steps(self):
+        # Un día distinto por reserva: con las claves de idempotencia la misma hora sería un duplicado
+        days = 1 + next(self.model.booking_days)
+        start = (datetime.datetime.now() + datetime.timedelta(days=days)).replace(hour=15, minute=0, second=0, microsecond=0)
+        end = start + datetime.timedelta(minutes=45)
+        return [
+            [('check_availability', {'time_min': start.isoformat(), 'time_max': end.isoformat()})],
+            [('create_event', {'summary': "Corte para caballero - Juan", 'description': "Corte",
+                               'start_time': start.isoformat(), 'end_time': end.isoformat()}),
+             ('log_to_sheet', {'nombre': 'Juan', 'servicio': 'Corte para caballero', 'precio': '17000',
+                               'hora': start.strftime('%H:%M:%S'), 'estatus': 'agendado',
+                               'dia': start.strftime('%Y-%m-%d'), 'celular': 'bench', 'event_id': ''})],
+        ]
+
+    def send_message(self, content, **kwargs):
+        self._round_trip()
+        if isinstance(content, str):
+            self.history.append({'role': 'user', 'parts': [{'text': content}]})
+            self._steps = self._booking_steps() if BOOKING_RE.search(content) else []
+            self._reply = "¡Vientos! Ya quedó listo tu espacio. 💈" if self._steps else \
+                "¡Claro que sí! ¿Para qué día te gustaría la cita? 📅"
+        else:
+            # Resultados de herramientas (Parts con function_response)
+            self.history.append({'role': 'user', 'parts': [type(part).to_dict(part) for part in content]})
+        if self._steps:
+            calls = self._steps.pop(0)
+            self.history.append({'role': 'model', 'parts': [{'function_call': {'name': n, 'args': a}} for n, a in calls]})
+            return _response(calls=calls)
+        self.history.append({'role': 'model', 'parts': [{'text': self._reply}]})
+        return _response(self._reply)
+
+
+class ScriptedModel:
+    """Sustituto de genai.GenerativeModel con latencia por round trip configurable."""
+    latency = 0.0
+    calls = 0
+    booking_days = itertools.count()
+
+    def __init__(self, model_name=None, tools=None, system_instruction=None, **kwargs):
+        self.tools = {t.__name__: t for t in (tools or [])}
+
+    def start_chat(self, history=None, enable_automatic_function_calling=False):
+        return ScriptedChatSession(self, history)
+
+
+# --- Telegram ---
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.voice = None
+        self.audio = None
+        self.photo = None
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+_update_ids = itertools.count(1)
+
+
+def make_update(user_id, text):
+    """Update de texto mínimo con la forma que usa handle_message."""
+    return SimpleNamespace(
+        update_id=next(_update_ids),
+        effective_user=SimpleNamespace(id=int(user_id), username='bench', first_name='Bench'),
+        effective_chat=SimpleNamespace(id=int(user_id)),
+        message=FakeMessage(text),
+    )
+
+
+def make_context(bot=None):
+    bot = bot or FakeBot()
+    return SimpleNamespace(bot=bot, application=SimpleNamespace(bot=bot), user_data={})
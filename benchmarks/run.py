@@ -0,0 +1,308 @@
+"""
+Benchmark y prueba de carga offline del bot.
+
+Ejecuta el hot path real (bot.handle_message, BarberAgent.process_message,
+SchedulerService.check_reminders y Database) contra backends falsos en proceso
+y reporta throughput y percentiles de latencia. El escenario cold_import mide el
+arranque en frío (`import main` en un proceso nuevo) y lista los imports más costosos.
+
+Uso:
+    python -m benchmarks.run
+    python -m benchmarks.run --iterations 200 --google-latency-ms 80 --gemini-latency-ms 400
+    python -m benchmarks.run --write-baseline bench_baseline.json
+    python -m benchmarks.run --baseline bench_baseline.json --tolerance 0.25   # exit 1 si hay regresión
+"""
+import os
+import sys
+import re
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+import contextlib
+from unittest import mock
+
+# Permitir `python benchmarks/run.py` además de `python -m benchmarks.run`
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ADMIN_ID = '1000'
+CUSTOMER_ID = '2000'
+FAST_PATH_TEXT = "¿Cuánto cuesta el corte y barba?"
+BOOKING_TEXT = "Quiero agendar un corte para mañana a las 3pm, soy Juan"
+
+SCENARIOS = ('database', 'process_message', 'handle_message_fast_path', 'handle_message_booking', 'check_reminders',
+             'business_stats', 'cold_import')
+STATS_ROWS = 5000  # ~un año de historial de una barbería con mucho movimiento
+# Cada arranque en frío es un subproceso: se limitan las repeticiones
+COLD_IMPORT_RUNS = 5
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _prepare_env(tmp_dir):
+    """Entorno aislado: SQLite temporal, sin Supabase y sin claves reales."""
+    os.environ['DB_DIR'] = tmp_dir
+    os.environ.pop('SUPABASE_URL', None)
+    os.environ.pop('SUPABASE_KEY', None)
+    os.environ['GEMINI_API_KEY'] = 'bench'
+    os.environ['GOOGLE_SPREADSHEET_ID'] = 'bench-sheet'
+    os.environ.setdefault('GOOGLE_CALENDAR_ID', 'primary')
+
+
+@contextlib.contextmanager
+def fake_backends(google_latency=0.0, gemini_latency=0.0):
+    """Sustituye los transportes de Google y el modelo de Gemini por fakes en proceso."""
+    import httpx
+    import google.generativeai as genai
+    from services import http_client
+    from benchmarks.fakes import FakeGoogleBackend, ScriptedModel
+
+    backend = FakeGoogleBackend(latency=google_latency)
+    model_cls = type('BenchModel', (ScriptedModel,), {'latency': gemini_latency, 'calls': 0})
+    async_client = httpx.AsyncClient(transport=backend.httpx_transport())
+
+    with mock.patch('googleapiclient.http.build_http', backend.httplib2_http), \
+            mock.patch.object(http_client, '_client', async_client), \
+            mock.patch.object(genai, 'GenerativeModel', model_cls), \
+            mock.patch.object(genai, 'configure', lambda **kwargs: None):
+        yield backend, model_cls
+
+
+def _summarize(latencies, total_seconds):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'iterations': len(ordered),
+        'throughput_per_s': len(ordered) / total_seconds if total_seconds else 0.0,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+    }
+
+
+def _measure(fn, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return _summarize(latencies, time.perf_counter() - started)
+
+
+async def _measure_async(fn, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await fn()
+        latencies.append(time.perf_counter() - t0)
+    return _summarize(latencies, time.perf_counter() - started)
+
+
+def profile_imports(module='main', top=10):
+    """
+    Importa `module` en un proceso nuevo con `python -X importtime` (arranque en frío).
+    Devuelve (segundos de pared, [(módulo de primer nivel, ms acumulados)] ordenado de mayor a menor).
+    """
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    env = dict(os.environ, TELEGRAM_TOKEN='')  # sin token no se construye la aplicación de Telegram
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                          cwd=root, env=env, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - t0
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        # Profundidad 1 = imports directos del módulo medido
+        if match and len(match.group(3)) // 2 == 1:
+            modules.append((match.group(4), int(match.group(2)) / 1000))
+    return elapsed, sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+
+
+def run_benchmarks(iterations=50, google_latency=0.0, gemini_latency=0.0, scenarios=SCENARIOS):
+    """Ejecuta los escenarios pedidos y devuelve {escenario: métricas}."""
+    tmp_dir = tempfile.mkdtemp(prefix='barberbot-bench-')
+    _prepare_env(tmp_dir)
+
+    import bot
+    from agent import BarberAgent
+    from google_services import GoogleServices
+    from services.auth_service import AuthService
+    from services.scheduler_service import SchedulerService
+    from services.rate_limiter import RateLimiter
+    from benchmarks.fakes import FakeBot, make_update, make_context
+
+    # El benchmark manda cientos de mensajes del mismo cliente: sin límites
+    bot.rate_limiter = RateLimiter(user_rate=1e9, user_burst=1e9, global_rate=1e9, global_burst=1e9)
+    db = bot.db
+    db.set_admin_id(ADMIN_ID, 'bench', 'Kevin', barberia_name='Barbería Bench')
+    db.update_owner_info(owner_phone='+57 300 000 0000', owner_address='Calle 1 #2-3')
+    db.save_user_credentials(ADMIN_ID, {
+        'token': 'bench-token', 'refresh_token': None, 'token_uri': 'https://oauth2.googleapis.com/token',
+        'client_id': 'bench', 'client_secret': 'bench', 'scopes': ['https://www.googleapis.com/auth/calendar'],
+    })
+
+    results = {}
+    if 'cold_import' in scenarios:
+        runs = [profile_imports() for _ in range(min(iterations, COLD_IMPORT_RUNS))]
+        results['cold_import'] = _summarize([elapsed for elapsed, _ in runs], sum(elapsed for elapsed, _ in runs))
+        results['_imports'] = dict(runs[-1][1])
+
+    tool_bytes_before = _tool_result_bytes()
+    with fake_backends(google_latency, gemini_latency) as (backend, model_cls):
+        creds = AuthService().get_credentials(ADMIN_ID)
+
+        if 'database' in scenarios:
+            def db_reads():
+                # Lectura consolidada del turno (admin + dueño + credenciales), sin la caché
+                db._invalidate_tenant()
+                db.get_tenant_context()
+            results['database'] = _measure(db_reads, iterations)
+
+        if 'business_stats' in scenarios:
+            import datetime
+            from prompts import SERVICES
+            from services.analytics_service import row_from_values
+            today = datetime.date.today()
+            db.replace_booking_log([row_from_values([
+                f"Cliente {i % 300}", SERVICES[i % len(SERVICES)]['nombre'], SERVICES[i % len(SERVICES)]['precio'],
+                f"{9 + i % 10}:00:00", 'eliminado' if i % 11 == 0 else 'agendado',
+                (today - datetime.timedelta(days=i % 365)).isoformat(), str(i % 300), f"bench-{i}",
+            ]) for i in range(STATS_ROWS)])
+            bot.analytics.frame()  # construir el DataFrame (y cargar pandas) fuera de la medición
+            results['business_stats'] = _measure(lambda: bot.analytics.report('mes'), iterations)
+
+        if 'process_message' in scenarios:
+            def agent_turn():
+                agent_controller = BarberAgent(api_key='bench', google_services=GoogleServices(credentials_object=creds),
+                                               appointment_index=bot.appointment_index)
+                agent_controller.process_message(CUSTOMER_ID, BOOKING_TEXT)
+            results['process_message'] = _measure(agent_turn, iterations)
+
+        async def run_async():
+            bot_instance = FakeBot()
+            context = make_context(bot_instance)
+            # Los avisos al dueño salen por la cola de salida
+            bot.outbox.start(bot_instance)
+
+            if 'handle_message_fast_path' in scenarios:
+                results['handle_message_fast_path'] = await _measure_async(
+                    lambda: bot.handle_message(make_update(CUSTOMER_ID, FAST_PATH_TEXT), context), iterations)
+
+            if 'handle_message_booking' in scenarios:
+                results['handle_message_booking'] = await _measure_async(
+                    lambda: bot.handle_message(make_update(CUSTOMER_ID, BOOKING_TEXT), context), iterations)
+
+            if 'check_reminders' in scenarios:
+                import datetime
+                now = datetime.datetime.now().replace(microsecond=0)
+                for minutes in range(5, 120, 5):
+                    start = now + datetime.timedelta(minutes=minutes)
+                    backend.add_event(f"Cliente {minutes}", start.isoformat(), (start + datetime.timedelta(minutes=30)).isoformat(),
+                                      description=f"Corte\n\nRef: {CUSTOMER_ID}")
+                scheduler = SchedulerService(make_context(bot_instance).application, db, AuthService(), bot.appointment_index)
+
+                async def reminders():
+                    scheduler.notified_events.clear()
+                    await scheduler.check_reminders()
+                results['check_reminders'] = await _measure_async(reminders, iterations)
+
+            await bot.outbox.stop(timeout=1)
+
+        asyncio.run(run_async())
+
+        results['_backend'] = {'google_requests': backend.requests, 'google_bytes': backend.bytes_sent,
+                               'gemini_round_trips': model_cls.calls,
+                               **{f"tool_result_bytes_{stage}": int(total - tool_bytes_before[stage])
+                                  for stage, total in _tool_result_bytes().items()}}
+    return results
+
+
+def _tool_result_bytes():
+    """Bytes acumulados de resultados de herramientas devueltos a Gemini: {'raw': n, 'projected': n}."""
+    from prometheus_client import REGISTRY
+    totals = {'raw': 0, 'projected': 0}
+    for metric in REGISTRY.collect():
+        if metric.name == 'barberbot_tool_result_bytes':
+            for sample in metric.samples:
+                if sample.name.endswith('_sum'):
+                    totals[sample.labels['stage']] += sample.value
+    return totals
+
+
+def find_regressions(results, baseline, tolerance):
+    """Escenarios cuyo p95 empeoró más que `tolerance` respecto al baseline."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if name.startswith('_') or not base:
+            continue
+        limit = base['p95_ms'] * (1 + tolerance)
+        if metrics['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {metrics['p95_ms']:.2f}ms > {limit:.2f}ms (baseline {base['p95_ms']:.2f}ms)")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'escenario':<28}{'ops/s':>10}{'media':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, m in results.items():
+        if name.startswith('_'):
+            continue
+        print(f"{name:<28}{m['throughput_per_s']:>10.1f}{m['mean_ms']:>9.2f}ms{m['p50_ms']:>8.2f}ms"
+              f"{m['p95_ms']:>8.2f}ms{m['p99_ms']:>8.2f}ms")
+    extra = results.get('_backend', {})
+    if extra:
+        print(f"\nGoogle: {extra['google_requests']} peticiones, {extra['google_bytes']} bytes | "
+              f"Gemini: {extra['gemini_round_trips']} round trips | "
+              f"Resultados de herramientas: {extra['tool_result_bytes_raw']} -> {extra['tool_result_bytes_projected']} bytes")
+    imports = results.get('_imports', {})
+    if imports:
+        print("\nImports más costosos de main (ms acumulados): " +
+              ", ".join(f"{name} {ms:.0f}" for name, ms in imports.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline del BarberBot")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--google-latency-ms', type=float, default=0.0)
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Repetible; por defecto todos")
+    parser.add_argument('--json', help="Guardar resultados en este archivo")
+    parser.add_argument('--baseline', help="Comparar contra un baseline y fallar si hay regresión")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Margen permitido sobre el p95 del baseline")
+    parser.add_argument('--write-baseline', help="Guardar los resultados como nuevo baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        iterations=args.iterations,
+        google_latency=args.google_latency_ms / 1000,
+        gemini_latency=args.gemini_latency_ms / 1000,
+        scenarios=tuple(args.scenario or SCENARIOS),
+    )
+    print_report(results)
+
+    for path in (args.json, args.write_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regresiones detectadas:\n" + "\n".join(f"- {r}" for r in regressions))
+            return 1
+        print("\n✅ Sin regresiones respecto al baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,255 +1,1154 @@
-import os
-import sqlite3
-import json
-import logging
-from supabase import create_client, Client
-
-# Configuración
-logger = logging.getLogger(__name__)
-
-class Database:
-    def __init__(self):
-        self.url = os.getenv("SUPABASE_URL")
-        self.key = os.getenv("SUPABASE_KEY")
-        self.supabase: Client = None
-        
-        if self.url and self.key:
-            try:
-                self.supabase = create_client(self.url, self.key)
-                logger.info("✅ Conexión a Supabase establecida.")
-                self._check_and_migrate()
-            except Exception as e:
-                logger.error(f"❌ Error conectando a Supabase: {e}")
-        else:
-            logger.warning("⚠️ SUPABASE_URL o SUPABASE_KEY no configuradas. Usando SQLite local.")
-
-        # Mantener referencia a SQLite para migración y backup
-        self.sqlite_db = os.path.join(os.getenv('DB_DIR', '.'), "ultron_memory.db")
-
-    def _get_sqlite_conn(self):
-        return sqlite3.connect(self.sqlite_db)
-
-    def _check_and_migrate(self):
-        """Migra datos de SQLite a Supabase si es necesario."""
-        if not os.path.exists(self.sqlite_db):
-            return
-
-        try:
-            # Verificar si ya hay admin en Supabase
-            res = self.supabase.table("config").select("value").eq("key", "admin_id").execute()
-            if not res.data:
-                logger.info("🚀 Iniciando migración de SQLite a Supabase...")
-                with self._get_sqlite_conn() as conn:
-                    cursor = conn.cursor()
-                    
-                    # 1. Migrar Config
-                    cursor.execute("SELECT key, value FROM config")
-                    configs = cursor.fetchall()
-                    for k, v in configs:
-                        self.supabase.table("config").upsert({"key": k, "value": v}).execute()
-                    
-                    # 2. Migrar Users
-                    cursor.execute("SELECT telegram_id, username, first_name, credentials_json FROM users")
-                    users = cursor.fetchall()
-                    for tid, uname, fname, creds in users:
-                        self.supabase.table("users").upsert({
-                            "telegram_id": str(tid),
-                            "username": uname,
-                            "first_name": fname,
-                            "credentials_json": creds
-                        }).execute()
-                    
-                    # 3. Migrar Bot Info
-                    cursor.execute("SELECT bot_name, owner_telegram_id, owner_name, owner_username, barberia_name, owner_phone, owner_address FROM bot_info")
-                    bots = cursor.fetchall()
-                    for bn, otid, on, ou, bname, oph, oad in bots:
-                        self.supabase.table("bot_info").insert({
-                            "bot_name": bn,
-                            "owner_telegram_id": str(otid),
-                            "owner_name": on,
-                            "owner_username": ou,
-                            "barberia_name": bname,
-                            "owner_phone": oph,
-                            "owner_address": oad
-                        }).execute()
-                
-                logger.info("✅ Migración completada con éxito.")
-        except Exception as e:
-            logger.error(f"❌ Error durante la migración: {e}")
-
-    # --- Config Methods ---
-    def get_admin_id(self):
-        if self.supabase:
-            try:
-                res = self.supabase.table("config").select("value").eq("key", "admin_id").execute()
-                return res.data[0]['value'] if res.data else None
-            except Exception as e:
-                logger.error(f"Error en get_admin_id (Supabase): {e}")
-        
-        # Fallback a SQLite si Supabase falla o no está configurado
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT value FROM config WHERE key = ?', ('admin_id',))
-                row = cursor.fetchone()
-                return row[0] if row else None
-        except: return None
-
-    def set_admin_id(self, telegram_id, username=None, first_name=None, barberia_name=None):
-        if self.get_admin_id(): return False
-        
-        success = False
-        # Guardar en Supabase
-        if self.supabase:
-            try:
-                self.supabase.table("config").insert({"key": "admin_id", "value": str(telegram_id)}).execute()
-                self.supabase.table("users").upsert({
-                    "telegram_id": str(telegram_id),
-                    "username": username,
-                    "first_name": first_name
-                }).execute()
-                self.supabase.table("bot_info").insert({
-                    "bot_name": os.getenv('BOT_NAME', 'Bot Barbería'),
-                    "owner_telegram_id": str(telegram_id),
-                    "owner_name": first_name,
-                    "owner_username": username,
-                    "barberia_name": barberia_name
-                }).execute()
-                success = True
-            except Exception as e:
-                logger.error(f"Error en set_admin_id (Supabase): {e}")
-
-        # Guardar en SQLite (Backup local)
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute('INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)', ('admin_id', str(telegram_id)))
-                cursor.execute('INSERT OR REPLACE INTO users (telegram_id, username, first_name) VALUES (?, ?, ?)', (str(telegram_id), username, first_name))
-                cursor.execute('INSERT INTO bot_info (bot_name, owner_telegram_id, owner_name, owner_username, barberia_name) VALUES (?, ?, ?, ?, ?)', 
-                             (os.getenv('BOT_NAME', 'Bot Barbería'), str(telegram_id), first_name, username, barberia_name))
-                conn.commit()
-                success = True
-        except Exception as e:
-            logger.error(f"Error en set_admin_id (SQLite): {e}")
-        
-        return success
-
-    def get_owner_info(self):
-        if self.supabase:
-            try:
-                res = self.supabase.table("bot_info").select("*").order("created_at", desc=True).limit(1).execute()
-                if res.data:
-                    d = res.data[0]
-                    return {
-                        'telegram_id': d['owner_telegram_id'],
-                        'name': d['owner_name'],
-                        'username': d['owner_username'],
-                        'barberia_name': d['barberia_name'],
-                        'phone': d['owner_phone'],
-                        'address': d['owner_address'],
-                        'created_at': d['created_at']
-                    }
-            except Exception as e:
-                logger.error(f"Error en get_owner_info (Supabase): {e}")
-
-        # Fallback a SQLite
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT owner_telegram_id, owner_name, owner_username, barberia_name, owner_phone, owner_address, created_at FROM bot_info ORDER BY created_at DESC LIMIT 1')
-                row = cursor.fetchone()
-                if row:
-                    return {'telegram_id': row[0], 'name': row[1], 'username': row[2], 'barberia_name': row[3], 'phone': row[4], 'address': row[5], 'created_at': row[6]}
-        except: return None
-
-    def update_owner_info(self, barberia_name=None, owner_phone=None, owner_address=None):
-        admin_id = self.get_admin_id()
-        if not admin_id: return False
-        
-        success = False
-        if self.supabase:
-            try:
-                data = {}
-                if barberia_name: data['barberia_name'] = barberia_name
-                if owner_phone: data['owner_phone'] = owner_phone
-                if owner_address is not None: data['owner_address'] = owner_address
-                if data:
-                    self.supabase.table("bot_info").update(data).eq("owner_telegram_id", str(admin_id)).execute()
-                    success = True
-            except Exception as e:
-                logger.error(f"Error en update_owner_info (Supabase): {e}")
-
-        # SQLite
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                if barberia_name: cursor.execute('UPDATE bot_info SET barberia_name = ? WHERE owner_telegram_id = ?', (barberia_name, str(admin_id)))
-                if owner_phone: cursor.execute('UPDATE bot_info SET owner_phone = ? WHERE owner_telegram_id = ?', (owner_phone, str(admin_id)))
-                if owner_address is not None: cursor.execute('UPDATE bot_info SET owner_address = ? WHERE owner_telegram_id = ?', (owner_address, str(admin_id)))
-                conn.commit()
-                success = True
-        except: pass
-        
-        return success
-
-    def reset_configuration(self):
-        success = False
-        if self.supabase:
-            try:
-                self.supabase.table("config").delete().eq("key", "admin_id").execute()
-                self.supabase.table("bot_info").delete().neq("id", -1).execute() # Delete all
-                success = True
-            except Exception as e:
-                logger.error(f"Error reset (Supabase): {e}")
-        
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM config WHERE key = 'admin_id'")
-                cursor.execute("DELETE FROM bot_info")
-                conn.commit()
-                success = True
-        except: pass
-        return success
-
-    def save_user_credentials(self, telegram_id, credentials_dict, username=None, first_name=None):
-        json_data = json.dumps(credentials_dict)
-        success = False
-        if self.supabase:
-            try:
-                self.supabase.table("users").upsert({
-                    "telegram_id": str(telegram_id),
-                    "username": username,
-                    "first_name": first_name,
-                    "credentials_json": json_data
-                }).execute()
-                success = True
-            except Exception as e:
-                logger.error(f"Error save_creds (Supabase): {e}")
-
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute('INSERT OR REPLACE INTO users (telegram_id, username, first_name, credentials_json) VALUES (?, ?, ?, ?)', (str(telegram_id), username, first_name, json_data))
-                conn.commit()
-                success = True
-        except: pass
-        return success
-
-    def get_user_credentials(self, telegram_id):
-        if self.supabase:
-            try:
-                res = self.supabase.table("users").select("credentials_json").eq("telegram_id", str(telegram_id)).execute()
-                if res.data and res.data[0]['credentials_json']:
-                    return json.loads(res.data[0]['credentials_json'])
-            except Exception as e:
-                logger.error(f"Error get_creds (Supabase): {e}")
-
-        try:
-            with self._get_sqlite_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT credentials_json FROM users WHERE telegram_id = ?', (str(telegram_id),))
-                row = cursor.fetchone()
-                if row and row[0]: return json.loads(row[0])
-        except: pass
-        return None
+import os
+import time
+import sqlite3
+import json
+import logging
+import threading
+from services.metrics import timed_db
+from services import resilience
+from services.credential_crypto import default_cipher, CredentialsKeyError
+
+# Configuración
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutiliza el contexto del tenant (admin + dueño + credenciales); las escrituras lo invalidan
+TENANT_CONTEXT_TTL = float(os.getenv('TENANT_CONTEXT_TTL', 60))
+# Códigos de postgrest cuando la vista tenant_context aún no se creó (ver supabase_schema.sql)
+MISSING_RELATION_CODES = ('PGRST205', '42P01')
+# Columnas del registro local de reservas (booking_ledger)
+LEDGER_COLUMNS = ('id', 'event_id', 'telegram_id', 'calendar_id', 'nombre', 'servicio', 'precio', 'hora', 'estatus',
+                  'dia', 'celular', 'origen', 'start_time', 'sheet_row', 'synced', 'version', 'updated_at')
+
+class Database:
+    def __init__(self, connect=True):
+        """
+        connect=False difiere la conexión (y migración) a Supabase: la hace el warm-up
+        en segundo plano o, si no, el primer acceso a `self.supabase`.
+        """
+        self.url = os.getenv("SUPABASE_URL")
+        self.key = os.getenv("SUPABASE_KEY")
+        self._supabase = None
+        self._connected = False
+        self._connect_lock = threading.Lock()
+        self._tenant = None
+        self._tenant_generation = 0
+        self._tenant_view = True
+        self._ledger_restored = False
+        self._ledger_lock = threading.Lock()
+
+        # Mantener referencia a SQLite para migración y backup
+        self.sqlite_db = os.path.join(os.getenv('DB_DIR', '.'), "ultron_memory.db")
+        # Solo hay algo que migrar si el archivo existía antes de crear las tablas
+        self._sqlite_existed = os.path.exists(self.sqlite_db)
+
+        if connect:
+            self.connect()
+
+        self._init_sqlite()
+
+    @property
+    def supabase(self):
+        if not self._connected:
+            self.connect()
+        # Con el circuito abierto se responde desde el espejo SQLite sin esperar a Supabase
+        if self._supabase is not None and resilience.breaker('supabase').is_open():
+            return None
+        return self._supabase
+
+    def connect(self):
+        """Conecta a Supabase y migra desde SQLite una sola vez (idempotente y thread-safe)."""
+        if self._connected:
+            return
+        with self._connect_lock:
+            if self._connected:
+                return
+            if self.url and self.key:
+                try:
+                    # Import diferido: el SDK de Supabase tarda ~0.3s en cargar
+                    from supabase import create_client, ClientOptions
+                    # El timeout por defecto de postgrest es de 120s: una consulta lenta bloqueaba cada get_admin_id
+                    client = create_client(self.url, self.key,
+                                           options=ClientOptions(postgrest_client_timeout=resilience.SUPABASE_TIMEOUT))
+                    self._supabase = resilience.Guarded(client, 'supabase')
+                    logger.info("✅ Conexión a Supabase establecida.")
+                    self._check_and_migrate()
+                except Exception as e:
+                    logger.error(f"❌ Error conectando a Supabase: {e}")
+            else:
+                logger.warning("⚠️ SUPABASE_URL o SUPABASE_KEY no configuradas. Usando SQLite local.")
+            self._connected = True
+
+    def _get_sqlite_conn(self):
+        return sqlite3.connect(self.sqlite_db)
+
+    def _init_sqlite(self):
+        """Crea las tablas locales si no existen (el espejo SQLite debe poder responder solo)."""
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.executescript('''
+                    CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT);
+                    CREATE TABLE IF NOT EXISTS users (
+                        telegram_id TEXT PRIMARY KEY, username TEXT, first_name TEXT, credentials_json TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS bot_info (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, bot_name TEXT, owner_telegram_id TEXT,
+                        owner_name TEXT, owner_username TEXT, barberia_name TEXT, owner_phone TEXT,
+                        owner_address TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE TABLE IF NOT EXISTS appointments (
+                        event_id TEXT PRIMARY KEY, telegram_id TEXT NOT NULL, start_time TEXT NOT NULL,
+                        end_time TEXT, summary TEXT, calendar_id TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments (telegram_id, start_time);
+                    CREATE TABLE IF NOT EXISTS waitlist (
+                        id TEXT PRIMARY KEY, telegram_id TEXT NOT NULL, name TEXT, service TEXT, day TEXT NOT NULL,
+                        start_time TEXT NOT NULL, end_time TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'waiting',
+                        created_at TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_waitlist_day ON waitlist (status, day);
+                    CREATE TABLE IF NOT EXISTS recurrences (
+                        id TEXT PRIMARY KEY, telegram_id TEXT NOT NULL, summary TEXT, description TEXT,
+                        first_start TEXT NOT NULL, duration_minutes INTEGER NOT NULL, every_weeks INTEGER NOT NULL,
+                        next_start TEXT NOT NULL, skipped TEXT NOT NULL DEFAULT '', status TEXT NOT NULL DEFAULT 'active',
+                        created_at TEXT NOT NULL, calendar_id TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS booking_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, event_id TEXT, nombre TEXT, servicio TEXT,
+                        precio INTEGER, dia TEXT, hora TEXT, estatus TEXT, celular TEXT, origen TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS pending_bookings (
+                        id TEXT PRIMARY KEY, telegram_id TEXT, calendar_id TEXT NOT NULL, summary TEXT, description TEXT,
+                        start_time TEXT NOT NULL, end_time TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0, created_at TEXT NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, text TEXT NOT NULL, kwargs TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE TABLE IF NOT EXISTS booking_keys (
+                        key TEXT PRIMARY KEY, telegram_id TEXT, event_id TEXT NOT NULL, calendar_id TEXT,
+                        generation INTEGER NOT NULL DEFAULT 0, logged INTEGER NOT NULL DEFAULT 0, created_at TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_booking_keys_event ON booking_keys (event_id);
+                    CREATE TABLE IF NOT EXISTS booking_ledger (
+                        id TEXT PRIMARY KEY, event_id TEXT, telegram_id TEXT, calendar_id TEXT, nombre TEXT,
+                        servicio TEXT, precio TEXT, hora TEXT, estatus TEXT, dia TEXT, celular TEXT, origen TEXT,
+                        start_time TEXT, sheet_row INTEGER, synced INTEGER NOT NULL DEFAULT 0,
+                        version INTEGER NOT NULL DEFAULT 0, updated_at TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_booking_ledger_event ON booking_ledger (event_id);
+                    CREATE INDEX IF NOT EXISTS idx_booking_ledger_start ON booking_ledger (start_time);
+                ''')
+                # Columnas agregadas después de crear las tablas (bases SQLite ya existentes)
+                for table, column in (('appointments', 'calendar_id'), ('recurrences', 'calendar_id')):
+                    if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        except Exception as e:
+            logger.error(f"Error inicializando SQLite: {e}")
+
+    def _check_and_migrate(self):
+        """Migra datos de SQLite a Supabase si es necesario."""
+        if not self._sqlite_existed:
+            return
+
+        try:
+            # Verificar si ya hay admin en Supabase
+            res = self._supabase.table("config").select("value").eq("key", "admin_id").execute()
+            if not res.data:
+                logger.info("🚀 Iniciando migración de SQLite a Supabase...")
+                with self._get_sqlite_conn() as conn:
+                    cursor = conn.cursor()
+                    
+                    # 1. Migrar Config
+                    cursor.execute("SELECT key, value FROM config")
+                    configs = cursor.fetchall()
+                    for k, v in configs:
+                        self._supabase.table("config").upsert({"key": k, "value": v}).execute()
+                    
+                    # 2. Migrar Users
+                    cursor.execute("SELECT telegram_id, username, first_name, credentials_json FROM users")
+                    users = cursor.fetchall()
+                    for tid, uname, fname, creds in users:
+                        self._supabase.table("users").upsert({
+                            "telegram_id": str(tid),
+                            "username": uname,
+                            "first_name": fname,
+                            "credentials_json": creds
+                        }).execute()
+                    
+                    # 3. Migrar Bot Info
+                    cursor.execute("SELECT bot_name, owner_telegram_id, owner_name, owner_username, barberia_name, owner_phone, owner_address FROM bot_info")
+                    bots = cursor.fetchall()
+                    for bn, otid, on, ou, bname, oph, oad in bots:
+                        self._supabase.table("bot_info").insert({
+                            "bot_name": bn,
+                            "owner_telegram_id": str(otid),
+                            "owner_name": on,
+                            "owner_username": ou,
+                            "barberia_name": bname,
+                            "owner_phone": oph,
+                            "owner_address": oad
+                        }).execute()
+                
+                logger.info("✅ Migración completada con éxito.")
+        except Exception as e:
+            logger.error(f"❌ Error durante la migración: {e}")
+
+    # --- Health probes (los llama services.health en segundo plano) ---
+    def ping_sqlite(self):
+        with self._get_sqlite_conn() as conn:
+            conn.execute('SELECT 1').fetchone()
+        return 'ok'
+
+    def ping_supabase(self):
+        """'ok', 'disabled' (solo SQLite), 'connecting' (warm-up pendiente) o 'circuit_open'; lanza si falla."""
+        if not (self.url and self.key):
+            return 'disabled'
+        if not self._connected:
+            return 'connecting'
+        if self._supabase is None:
+            raise RuntimeError("no se pudo crear el cliente de Supabase")
+        if resilience.breaker('supabase').is_open():
+            return 'circuit_open'
+        self._supabase.table("config").select("key").limit(1).execute()
+        return 'ok'
+
+    # --- Tenant context (admin + dueño + credenciales en una sola lectura) ---
+    def _invalidate_tenant(self):
+        self._tenant_generation += 1
+        self._tenant = None
+
+    def _read_tenant_row(self):
+        if self.supabase and self._tenant_view:
+            try:
+                res = self.supabase.table("tenant_context").select("*").execute()
+                return res.data[0] if res.data else {}
+            except Exception as e:
+                if getattr(e, 'code', None) in MISSING_RELATION_CODES:
+                    logger.warning("Vista tenant_context no encontrada en Supabase (ver supabase_schema.sql): se usan consultas separadas.")
+                    self._tenant_view = False
+                else:
+                    logger.error(f"Error en get_tenant_context (Supabase): {e}")
+                    return None
+
+        if self.supabase:
+            owner = self.get_owner_info() or {}
+            admin_id = self.get_admin_id()
+            creds = self.get_user_credentials(admin_id) if admin_id else None
+            return {
+                'admin_id': admin_id, 'credentials_json': json.dumps(creds) if creds else None,
+                'owner_telegram_id': owner.get('telegram_id'), 'owner_name': owner.get('name'),
+                'owner_username': owner.get('username'), 'barberia_name': owner.get('barberia_name'),
+                'owner_phone': owner.get('phone'), 'owner_address': owner.get('address'),
+                'created_at': owner.get('created_at'),
+            }
+        return None
+
+    def _read_tenant_row_sqlite(self):
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                row = conn.execute('''
+                    SELECT c.value AS admin_id, u.credentials_json, b.owner_telegram_id, b.owner_name,
+                           b.owner_username, b.barberia_name, b.owner_phone, b.owner_address, b.created_at
+                    FROM (SELECT 1) AS one
+                    LEFT JOIN config c ON c.key = 'admin_id'
+                    LEFT JOIN users u ON u.telegram_id = c.value
+                    LEFT JOIN (SELECT * FROM bot_info ORDER BY created_at DESC LIMIT 1) b ON 1
+                ''').fetchone()
+                return dict(row) if row else {}
+        except Exception as e:
+            logger.error(f"Error en get_tenant_context (SQLite): {e}")
+            return {}
+
+    @timed_db
+    def get_tenant_context(self):
+        """
+        Admin, datos del dueño y credenciales de Google del admin en un solo round trip
+        (vista tenant_context en Supabase, un JOIN en SQLite). Se cachea como unidad
+        TENANT_CONTEXT_TTL segundos; set_admin_id, update_owner_info, reset_configuration
+        y save_user_credentials lo invalidan. Devuelve {'admin_id', 'owner', 'credentials'}
+        (no modificar: es el objeto cacheado).
+        """
+        cached = self._tenant
+        if cached and time.monotonic() - cached[0] < TENANT_CONTEXT_TTL:
+            return cached[1]
+
+        generation = self._tenant_generation
+        row = self._read_tenant_row()
+        if row is None:
+            row = self._read_tenant_row_sqlite()
+
+        owner = None
+        if row.get('created_at') or row.get('owner_telegram_id'):
+            owner = {
+                'telegram_id': row.get('owner_telegram_id'), 'name': row.get('owner_name'),
+                'username': row.get('owner_username'), 'barberia_name': row.get('barberia_name'),
+                'phone': row.get('owner_phone'), 'address': row.get('owner_address'),
+                'created_at': row.get('created_at'),
+            }
+        credentials = self._decrypt_credentials(row.get('credentials_json'))
+        context = {'admin_id': row.get('admin_id'), 'owner': owner, 'credentials': credentials}
+
+        # Sin admin no se cachea (el /setup debe verse de inmediato); tampoco si hubo una escritura mientras se leía
+        if context['admin_id'] and generation == self._tenant_generation:
+            self._tenant = (time.monotonic(), context)
+        return context
+
+    # --- Config Methods ---
+    @timed_db
+    def get_admin_id(self):
+        if self.supabase:
+            try:
+                res = self.supabase.table("config").select("value").eq("key", "admin_id").execute()
+                return res.data[0]['value'] if res.data else None
+            except Exception as e:
+                logger.error(f"Error en get_admin_id (Supabase): {e}")
+        
+        # Fallback a SQLite si Supabase falla o no está configurado
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT value FROM config WHERE key = ?', ('admin_id',))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except: return None
+
+    @timed_db
+    def get_config_value(self, key):
+        if self.supabase:
+            try:
+                res = self.supabase.table("config").select("value").eq("key", key).execute()
+                return res.data[0]['value'] if res.data else None
+            except Exception as e:
+                logger.error(f"Error en get_config_value (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT value FROM config WHERE key = ?', (key,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except: return None
+
+    @timed_db
+    def set_config_value(self, key, value):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("config").upsert({"key": key, "value": str(value)}).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error en set_config_value (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)', (key, str(value)))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error en set_config_value (SQLite): {e}")
+        return success
+
+    @timed_db
+    def set_admin_id(self, telegram_id, username=None, first_name=None, barberia_name=None):
+        if self.get_admin_id(): return False
+        
+        success = False
+        # Guardar en Supabase
+        if self.supabase:
+            try:
+                self.supabase.table("config").insert({"key": "admin_id", "value": str(telegram_id)}).execute()
+                self.supabase.table("users").upsert({
+                    "telegram_id": str(telegram_id),
+                    "username": username,
+                    "first_name": first_name
+                }).execute()
+                self.supabase.table("bot_info").insert({
+                    "bot_name": os.getenv('BOT_NAME', 'Bot Barbería'),
+                    "owner_telegram_id": str(telegram_id),
+                    "owner_name": first_name,
+                    "owner_username": username,
+                    "barberia_name": barberia_name
+                }).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error en set_admin_id (Supabase): {e}")
+
+        # Guardar en SQLite (Backup local)
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)', ('admin_id', str(telegram_id)))
+                cursor.execute('INSERT OR REPLACE INTO users (telegram_id, username, first_name) VALUES (?, ?, ?)', (str(telegram_id), username, first_name))
+                cursor.execute('INSERT INTO bot_info (bot_name, owner_telegram_id, owner_name, owner_username, barberia_name) VALUES (?, ?, ?, ?, ?)', 
+                             (os.getenv('BOT_NAME', 'Bot Barbería'), str(telegram_id), first_name, username, barberia_name))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error en set_admin_id (SQLite): {e}")
+        
+        self._invalidate_tenant()
+        return success
+
+    @timed_db
+    def get_owner_info(self):
+        if self.supabase:
+            try:
+                res = self.supabase.table("bot_info").select("*").order("created_at", desc=True).limit(1).execute()
+                if res.data:
+                    d = res.data[0]
+                    return {
+                        'telegram_id': d['owner_telegram_id'],
+                        'name': d['owner_name'],
+                        'username': d['owner_username'],
+                        'barberia_name': d['barberia_name'],
+                        'phone': d['owner_phone'],
+                        'address': d['owner_address'],
+                        'created_at': d['created_at']
+                    }
+            except Exception as e:
+                logger.error(f"Error en get_owner_info (Supabase): {e}")
+
+        # Fallback a SQLite
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT owner_telegram_id, owner_name, owner_username, barberia_name, owner_phone, owner_address, created_at FROM bot_info ORDER BY created_at DESC LIMIT 1')
+                row = cursor.fetchone()
+                if row:
+                    return {'telegram_id': row[0], 'name': row[1], 'username': row[2], 'barberia_name': row[3], 'phone': row[4], 'address': row[5], 'created_at': row[6]}
+        except: return None
+
+    @timed_db
+    def update_owner_info(self, barberia_name=None, owner_phone=None, owner_address=None):
+        admin_id = self.get_admin_id()
+        if not admin_id: return False
+        
+        success = False
+        if self.supabase:
+            try:
+                data = {}
+                if barberia_name: data['barberia_name'] = barberia_name
+                if owner_phone: data['owner_phone'] = owner_phone
+                if owner_address is not None: data['owner_address'] = owner_address
+                if data:
+                    self.supabase.table("bot_info").update(data).eq("owner_telegram_id", str(admin_id)).execute()
+                    success = True
+            except Exception as e:
+                logger.error(f"Error en update_owner_info (Supabase): {e}")
+
+        # SQLite
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                if barberia_name: cursor.execute('UPDATE bot_info SET barberia_name = ? WHERE owner_telegram_id = ?', (barberia_name, str(admin_id)))
+                if owner_phone: cursor.execute('UPDATE bot_info SET owner_phone = ? WHERE owner_telegram_id = ?', (owner_phone, str(admin_id)))
+                if owner_address is not None: cursor.execute('UPDATE bot_info SET owner_address = ? WHERE owner_telegram_id = ?', (owner_address, str(admin_id)))
+                conn.commit()
+                success = True
+        except: pass
+        
+        self._invalidate_tenant()
+        return success
+
+    @timed_db
+    def reset_configuration(self):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("config").delete().eq("key", "admin_id").execute()
+                self.supabase.table("bot_info").delete().neq("id", -1).execute() # Delete all
+                success = True
+            except Exception as e:
+                logger.error(f"Error reset (Supabase): {e}")
+        
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM config WHERE key = 'admin_id'")
+                cursor.execute("DELETE FROM bot_info")
+                conn.commit()
+                success = True
+        except: pass
+        self._invalidate_tenant()
+        return success
+
+    @timed_db
+    def save_user_credentials(self, telegram_id, credentials_dict, username=None, first_name=None):
+        # Cifrado de sobre (ver services/credential_crypto.py); sin clave configurada queda en JSON plano
+        json_data = default_cipher().encrypt(credentials_dict)
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("users").upsert({
+                    "telegram_id": str(telegram_id),
+                    "username": username,
+                    "first_name": first_name,
+                    "credentials_json": json_data
+                }).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_creds (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('INSERT OR REPLACE INTO users (telegram_id, username, first_name, credentials_json) VALUES (?, ?, ?, ?)', (str(telegram_id), username, first_name, json_data))
+                conn.commit()
+                success = True
+        except: pass
+        self._invalidate_tenant()
+        return success
+
+    @timed_db
+    def get_user_credentials(self, telegram_id):
+        if self.supabase:
+            try:
+                res = self.supabase.table("users").select("credentials_json").eq("telegram_id", str(telegram_id)).execute()
+                if res.data and res.data[0]['credentials_json']:
+                    return self._decrypt_credentials(res.data[0]['credentials_json'])
+            except Exception as e:
+                logger.error(f"Error get_creds (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT credentials_json FROM users WHERE telegram_id = ?', (str(telegram_id),))
+                row = cursor.fetchone()
+                if row and row[0]: return self._decrypt_credentials(row[0])
+        except: pass
+        return None
+
+    def _decrypt_credentials(self, stored):
+        # Descifrado con caché en memoria: no se paga en cada mensaje
+        try:
+            return default_cipher().decrypt(stored)
+        except CredentialsKeyError:
+            return None
+
+    @timed_db
+    def rotate_credentials(self):
+        """
+        Re-envuelve las credenciales guardadas con la clave maestra actual (la primera de
+        CREDENTIALS_ENCRYPTION_KEYS) y cifra las que seguían en texto plano. Solo cambia la
+        clave de datos envuelta, no el contenido. Devuelve cuántos registros se reescribieron.
+        """
+        cipher = default_cipher()
+        if not cipher.enabled:
+            return 0
+
+        def rewrapped(telegram_id, stored):
+            # Un registro que ninguna clave descifra (o mal formado) se salta: no debe frenar a los demás
+            try:
+                return cipher.rewrap(stored) if cipher.needs_rewrap(stored) else None
+            except (CredentialsKeyError, ValueError) as e:
+                logger.error(f"No se pudieron re-cifrar las credenciales de {telegram_id}: {e}")
+                return None
+
+        rotated = 0
+        if self.supabase:
+            try:
+                res = self.supabase.table("users").select("telegram_id, credentials_json").execute()
+                for row in res.data or []:
+                    updated = rewrapped(row['telegram_id'], row['credentials_json'])
+                    if updated:
+                        self.supabase.table("users").update({"credentials_json": updated}) \
+                            .eq("telegram_id", row['telegram_id']).execute()
+                        rotated += 1
+            except Exception as e:
+                logger.error(f"Error rotando credenciales (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                rows = conn.execute('SELECT telegram_id, credentials_json FROM users').fetchall()
+                for telegram_id, stored in rows:
+                    updated = rewrapped(telegram_id, stored)
+                    if updated:
+                        conn.execute('UPDATE users SET credentials_json = ? WHERE telegram_id = ?', (updated, telegram_id))
+                        rotated += 1
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error rotando credenciales (SQLite): {e}")
+        if rotated:
+            logger.info(f"🔐 {rotated} registros de credenciales re-cifrados con la clave actual.")
+        return rotated
+
+    # --- Appointments Index (telegram_id -> próximas citas) ---
+    @timed_db
+    def save_appointment(self, telegram_id, event_id, start_time, end_time=None, summary=None, calendar_id=None):
+        row = {
+            "event_id": event_id,
+            "telegram_id": str(telegram_id),
+            "start_time": start_time,
+            "end_time": end_time,
+            "summary": summary,
+            "calendar_id": calendar_id
+        }
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("appointments").upsert(row).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_appointment (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO appointments (event_id, telegram_id, start_time, end_time, summary, calendar_id) VALUES (?, ?, ?, ?, ?, ?)',
+                             (event_id, str(telegram_id), start_time, end_time, summary, calendar_id))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_appointment (SQLite): {e}")
+        return success
+
+    @timed_db
+    def delete_appointment(self, event_id):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("appointments").delete().eq("event_id", event_id).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error delete_appointment (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('DELETE FROM appointments WHERE event_id = ?', (event_id,))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error delete_appointment (SQLite): {e}")
+        return success
+
+    @timed_db
+    def get_appointment(self, event_id):
+        if self.supabase:
+            try:
+                res = self.supabase.table("appointments").select("*").eq("event_id", event_id).execute()
+                return res.data[0] if res.data else None
+            except Exception as e:
+                logger.error(f"Error get_appointment (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                row = conn.execute('SELECT event_id, telegram_id, start_time, end_time, summary, calendar_id FROM appointments WHERE event_id = ?',
+                                   (event_id,)).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error get_appointment (SQLite): {e}")
+        return None
+
+    @timed_db
+    def get_user_appointments(self, telegram_id, from_time):
+        """Citas de un usuario desde from_time (ISO UTC), ordenadas por fecha."""
+        if self.supabase:
+            try:
+                res = self.supabase.table("appointments").select("*").eq("telegram_id", str(telegram_id)) \
+                    .gte("start_time", from_time).order("start_time").execute()
+                return res.data
+            except Exception as e:
+                logger.error(f"Error get_user_appointments (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('SELECT event_id, telegram_id, start_time, end_time, summary, calendar_id FROM appointments WHERE telegram_id = ? AND start_time >= ? ORDER BY start_time',
+                               (str(telegram_id), from_time))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error get_user_appointments (SQLite): {e}")
+        return []
+
+    @timed_db
+    def get_appointments_between(self, time_min, time_max):
+        """Citas del índice con inicio en [time_min, time_max) (ISO UTC)."""
+        if self.supabase:
+            try:
+                res = self.supabase.table("appointments").select("*") \
+                    .gte("start_time", time_min).lt("start_time", time_max).execute()
+                return res.data
+            except Exception as e:
+                logger.error(f"Error get_appointments_between (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('SELECT event_id, telegram_id, start_time, end_time, summary, calendar_id FROM appointments WHERE start_time >= ? AND start_time < ?',
+                               (time_min, time_max))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error get_appointments_between (SQLite): {e}")
+        return []
+
+    @timed_db
+    def replace_appointments(self, appointments, time_min, time_max):
+        """
+        Sincroniza el índice con el calendario: reemplaza las citas en [time_min, time_max)
+        y elimina las que ya pasaron.
+        """
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("appointments").delete().lt("start_time", time_min).execute()
+                self.supabase.table("appointments").delete().gte("start_time", time_min).lt("start_time", time_max).execute()
+                if appointments:
+                    self.supabase.table("appointments").upsert(appointments).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error replace_appointments (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('DELETE FROM appointments WHERE start_time < ? OR (start_time >= ? AND start_time < ?)', (time_min, time_min, time_max))
+                conn.executemany('INSERT OR REPLACE INTO appointments (event_id, telegram_id, start_time, end_time, summary, calendar_id) '
+                                 'VALUES (:event_id, :telegram_id, :start_time, :end_time, :summary, :calendar_id)',
+                                 appointments)
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error replace_appointments (SQLite): {e}")
+        return success
+
+    # --- Waitlist ---
+
+    @timed_db
+    def save_waitlist_entry(self, entry):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("waitlist").upsert(entry).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_waitlist_entry (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO waitlist (id, telegram_id, name, service, day, start_time, end_time, status, created_at) '
+                             'VALUES (:id, :telegram_id, :name, :service, :day, :start_time, :end_time, :status, :created_at)', entry)
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_waitlist_entry (SQLite): {e}")
+        return success
+
+    @timed_db
+    def update_waitlist_status(self, entry_id, status):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("waitlist").update({"status": status}).eq("id", entry_id).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error update_waitlist_status (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('UPDATE waitlist SET status = ? WHERE id = ?', (status, entry_id))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error update_waitlist_status (SQLite): {e}")
+        return success
+
+    @timed_db
+    def get_waiting_entries(self, from_day):
+        """Entradas en espera desde from_day (YYYY-MM-DD), en orden de llegada."""
+        if self.supabase:
+            try:
+                res = self.supabase.table("waitlist").select("*").eq("status", "waiting") \
+                    .gte("day", from_day).order("created_at").execute()
+                return res.data
+            except Exception as e:
+                logger.error(f"Error get_waiting_entries (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("SELECT id, telegram_id, name, service, day, start_time, end_time, status, created_at FROM waitlist "
+                               "WHERE status = 'waiting' AND day >= ? ORDER BY created_at", (from_day,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error get_waiting_entries (SQLite): {e}")
+        return []
+
+    # --- Citas recurrentes ---
+
+    @timed_db
+    def save_recurrence(self, recurrence):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("recurrences").upsert(recurrence).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_recurrence (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO recurrences (id, telegram_id, summary, description, first_start, duration_minutes, '
+                             'every_weeks, next_start, skipped, status, created_at, calendar_id) VALUES (:id, :telegram_id, :summary, '
+                             ':description, :first_start, :duration_minutes, :every_weeks, :next_start, :skipped, :status, :created_at, '
+                             ':calendar_id)', {'calendar_id': None, **recurrence})
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_recurrence (SQLite): {e}")
+        return success
+
+    @timed_db
+    def get_active_recurrences(self, telegram_id=None):
+        """Series activas (todas o las de un cliente), en orden de creación."""
+        if self.supabase:
+            try:
+                query = self.supabase.table("recurrences").select("*").eq("status", "active")
+                if telegram_id:
+                    query = query.eq("telegram_id", str(telegram_id))
+                return query.order("created_at").execute().data
+            except Exception as e:
+                logger.error(f"Error get_active_recurrences (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                sql = "SELECT * FROM recurrences WHERE status = 'active'"
+                params = ()
+                if telegram_id:
+                    sql += " AND telegram_id = ?"
+                    params = (str(telegram_id),)
+                cursor.execute(sql + " ORDER BY created_at", params)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error get_active_recurrences (SQLite): {e}")
+        return []
+
+    # --- Mensajes salientes pendientes ---
+    # Lo que la cola de salida no alcanzó a enviar al apagar (redeploy). Van a Supabase:
+    # sin disco persistente el SQLite del deploy anterior no existe al arrancar el nuevo.
+    # SQLite solo si Supabase no responde (en un solo lado, para no enviarlos dos veces).
+
+    @timed_db
+    def save_outbox_messages(self, messages):
+        """messages: [(chat_id, text, kwargs)]."""
+        if self.supabase:
+            try:
+                self.supabase.table("outbox").insert([
+                    {"chat_id": str(chat_id), "text": text, "kwargs": kwargs or {}} for chat_id, text, kwargs in messages
+                ]).execute()
+                return True
+            except Exception as e:
+                logger.error(f"Error save_outbox_messages (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.executemany('INSERT INTO outbox (chat_id, text, kwargs) VALUES (?, ?, ?)',
+                                 [(str(chat_id), text, json.dumps(kwargs or {})) for chat_id, text, kwargs in messages])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error save_outbox_messages (SQLite): {e}")
+        return False
+
+    @timed_db
+    def take_outbox_messages(self):
+        """Devuelve y borra los mensajes guardados, en orden: [(chat_id, text, kwargs)]."""
+        messages = []
+        if self.supabase:
+            try:
+                rows = self.supabase.table("outbox").select("id, chat_id, text, kwargs").order("id").execute().data
+                if rows:
+                    self.supabase.table("outbox").delete().lte("id", rows[-1]['id']).execute()
+                messages += [(row['chat_id'], row['text'], row['kwargs'] or {}) for row in rows]
+            except Exception as e:
+                logger.error(f"Error take_outbox_messages (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                rows = conn.execute('SELECT id, chat_id, text, kwargs FROM outbox ORDER BY id').fetchall()
+                if rows:
+                    conn.execute('DELETE FROM outbox WHERE id <= ?', (rows[-1][0],))
+                    conn.commit()
+                messages += [(chat_id, text, json.loads(kwargs or '{}')) for _, chat_id, text, kwargs in rows]
+        except Exception as e:
+            logger.error(f"Error take_outbox_messages (SQLite): {e}")
+        return messages
+
+    # --- Claves de idempotencia de reservas ---
+
+    @timed_db
+    def save_booking_key(self, record):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("booking_keys").upsert(record).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_booking_key (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO booking_keys (key, telegram_id, event_id, calendar_id, generation, logged, created_at) '
+                             'VALUES (:key, :telegram_id, :event_id, :calendar_id, :generation, :logged, :created_at)', record)
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_booking_key (SQLite): {e}")
+        return success
+
+    @timed_db
+    def get_booking_key(self, key):
+        if self.supabase:
+            try:
+                res = self.supabase.table("booking_keys").select("*").eq("key", key).execute()
+                return res.data[0] if res.data else None
+            except Exception as e:
+                logger.error(f"Error get_booking_key (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute('SELECT key, telegram_id, event_id, calendar_id, generation, logged, created_at FROM booking_keys WHERE key = ?', (key,))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error get_booking_key (SQLite): {e}")
+        return None
+
+    @timed_db
+    def mark_booking_logged(self, event_id):
+        """
+        Marca la reserva como registrada en Sheets. True si se marcó ahora, False si ya
+        estaba marcada, None si el evento no tiene clave (p. ej. creado por el dueño).
+        """
+        if self.supabase:
+            try:
+                res = self.supabase.table("booking_keys").update({"logged": True}) \
+                    .eq("event_id", event_id).eq("logged", False).execute()
+                if res.data:
+                    self._mark_booking_logged_sqlite(event_id)
+                    return True
+                res = self.supabase.table("booking_keys").select("key").eq("event_id", event_id).execute()
+                return False if res.data else None
+            except Exception as e:
+                logger.error(f"Error mark_booking_logged (Supabase): {e}")
+
+        try:
+            if self._mark_booking_logged_sqlite(event_id):
+                return True
+            with self._get_sqlite_conn() as conn:
+                found = conn.execute('SELECT 1 FROM booking_keys WHERE event_id = ?', (event_id,)).fetchone()
+                return False if found else None
+        except Exception as e:
+            logger.error(f"Error mark_booking_logged (SQLite): {e}")
+        return None
+
+    def _mark_booking_logged_sqlite(self, event_id):
+        with self._get_sqlite_conn() as conn:
+            # UPDATE condicional: entre dos registros simultáneos solo uno lo marca
+            cursor = conn.execute('UPDATE booking_keys SET logged = 1 WHERE event_id = ? AND logged = 0', (event_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    # --- Booking log (analítica) ---
+    # Solo SQLite: es una copia local derivada de Google Sheets y del calendario
+    # que se reconstruye en cada sincronización.
+
+    @timed_db
+    def add_booking_log(self, row):
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT INTO booking_log (event_id, nombre, servicio, precio, dia, hora, estatus, celular, origen) '
+                             'VALUES (:event_id, :nombre, :servicio, :precio, :dia, :hora, :estatus, :celular, :origen)', row)
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error add_booking_log (SQLite): {e}")
+        return False
+
+    @timed_db
+    def replace_booking_log(self, rows):
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('DELETE FROM booking_log')
+                conn.executemany('INSERT INTO booking_log (event_id, nombre, servicio, precio, dia, hora, estatus, celular, origen) '
+                                 'VALUES (:event_id, :nombre, :servicio, :precio, :dia, :hora, :estatus, :celular, :origen)', rows)
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error replace_booking_log (SQLite): {e}")
+        return False
+
+    @timed_db
+    def get_booking_log(self):
+        """Filas del log en orden de registro: (id, event_id, nombre, servicio, precio, dia, hora, estatus, celular, origen)."""
+        try:
+            with self._get_sqlite_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, event_id, nombre, servicio, precio, dia, hora, estatus, celular, origen FROM booking_log ORDER BY id')
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error get_booking_log (SQLite): {e}")
+        return []
+
+    # --- Registro local de reservas (fuente de verdad de la hoja de Sheets) ---
+    # Se escribe en cada creación/cancelación y el reconciliador (services/booking_ledger.py) lo lleva
+    # a la hoja. Como pending_bookings: Supabase para sobrevivir a un redeploy sin disco, SQLite para
+    # seguir registrando con Supabase caído. Las lecturas van a SQLite, que se rellena desde Supabase
+    # la primera vez que se consulta.
+
+    def _restore_ledger(self):
+        """Copia a SQLite las entradas de Supabase que no tiene (lo local es la última escritura de este proceso)."""
+        if self._ledger_restored:
+            return
+        with self._ledger_lock:
+            if self._ledger_restored:
+                return
+            client = self.supabase
+            if client is None:
+                # Sin Supabase configurada no hay nada que traer; con el circuito abierto se reintenta luego
+                self._ledger_restored = self._supabase is None
+                return
+            try:
+                rows, page = [], 1000
+                while True:
+                    data = client.table("booking_ledger").select(', '.join(LEDGER_COLUMNS)).order("id") \
+                        .range(len(rows), len(rows) + page - 1).execute().data
+                    rows += data
+                    if len(data) < page:
+                        break
+                with self._get_sqlite_conn() as conn:
+                    conn.executemany(f"INSERT OR IGNORE INTO booking_ledger ({', '.join(LEDGER_COLUMNS)}) "
+                                     f"VALUES ({', '.join(':' + c for c in LEDGER_COLUMNS)})", rows)
+                    conn.commit()
+                self._ledger_restored = True
+                if rows:
+                    logger.info(f"Registro de reservas: {len(rows)} entradas leídas de Supabase.")
+            except Exception as e:
+                logger.error(f"Error restaurando booking_ledger desde Supabase: {e}")
+
+    @timed_db
+    def save_ledger_entry(self, entry):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("booking_ledger").upsert(entry).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_ledger_entry (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute(f"INSERT OR REPLACE INTO booking_ledger ({', '.join(LEDGER_COLUMNS)}) "
+                             f"VALUES ({', '.join(':' + c for c in LEDGER_COLUMNS)})", entry)
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_ledger_entry (SQLite): {e}")
+        return success
+
+    def get_ledger_entry(self, entry_id):
+        entries = self.get_ledger_entries(entry_id=entry_id)
+        return entries[0] if entries else None
+
+    @timed_db
+    def get_ledger_entries(self, unsynced=False, start=None, end=None, entry_id=None):
+        """Entradas del registro (filtros opcionales: sin sincronizar, start_time en [start, end), id)."""
+        clauses, params = [], []
+        if unsynced:
+            clauses.append('synced = 0')
+        if start and end:
+            clauses += ['start_time >= ?', 'start_time < ?']
+            params += [start, end]
+        if entry_id:
+            clauses.append('id = ?')
+            params.append(entry_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        self._restore_ledger()
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute(f"SELECT {', '.join(LEDGER_COLUMNS)} FROM booking_ledger{where} "
+                                    "ORDER BY COALESCE(sheet_row, 1e9), updated_at", params).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error get_ledger_entries (SQLite): {e}")
+        return []
+
+    @timed_db
+    def mark_ledger_synced(self, entry_id, sheet_row, version):
+        """Guarda la fila de la hoja; solo marca sincronizada si nadie cambió la entrada desde que se leyó."""
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("booking_ledger").update({'sheet_row': sheet_row}).eq("id", entry_id).execute()
+                self.supabase.table("booking_ledger").update({'synced': 1}).eq("id", entry_id).eq("version", version).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error mark_ledger_synced (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('UPDATE booking_ledger SET sheet_row = ?, synced = CASE WHEN version = ? THEN 1 ELSE synced END '
+                             'WHERE id = ?', (sheet_row, version, entry_id))
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error mark_ledger_synced (SQLite): {e}")
+        return success
+
+    # --- Reservas pendientes ---
+    # Citas aceptadas mientras Google Calendar no respondía; se crean cuando vuelve.
+    # Se escriben en los dos lados: Supabase sobrevive a un redeploy sin disco y SQLite
+    # a una caída de Supabase (que suele coincidir con problemas de red).
+
+    @timed_db
+    def save_pending_booking(self, booking):
+        success = False
+        if self.supabase:
+            try:
+                self.supabase.table("pending_bookings").upsert(booking).execute()
+                success = True
+            except Exception as e:
+                logger.error(f"Error save_pending_booking (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.execute('INSERT OR REPLACE INTO pending_bookings (id, telegram_id, calendar_id, summary, description, start_time, '
+                             'end_time, status, attempts, created_at) VALUES (:id, :telegram_id, :calendar_id, :summary, :description, '
+                             ':start_time, :end_time, :status, :attempts, :created_at)', booking)
+                conn.commit()
+                success = True
+        except Exception as e:
+            logger.error(f"Error save_pending_booking (SQLite): {e}")
+        return success
+
+    @timed_db
+    def get_pending_bookings(self):
+        """Reservas aún sin crear en el calendario, en orden de llegada."""
+        bookings = {}
+        if self.supabase:
+            try:
+                rows = self.supabase.table("pending_bookings").select("*").eq("status", "pending").execute().data
+                bookings.update((row['id'], row) for row in rows)
+            except Exception as e:
+                logger.error(f"Error get_pending_bookings (Supabase): {e}")
+
+        try:
+            with self._get_sqlite_conn() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                # Todas, no solo las pendientes: la copia local es la última escritura de este proceso
+                # (una reserva ya creada cuyo cambio de estado no llegó a Supabase no se reintenta)
+                cursor.execute("SELECT id, telegram_id, calendar_id, summary, description, start_time, end_time, status, attempts, "
+                               "created_at FROM pending_bookings")
+                bookings.update((row['id'], dict(row)) for row in cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Error get_pending_bookings (SQLite): {e}")
+        return sorted((b for b in bookings.values() if b['status'] == 'pending'), key=lambda b: b['created_at'])
@@ -1,154 +1,400 @@
-import os
-import datetime
-import logging
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-
-SCOPES = [
-    'https://www.googleapis.com/auth/calendar',
-    'https://www.googleapis.com/auth/spreadsheets'
-]
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-class GoogleServices:
-    def __init__(self, credentials_file='credentials.json', credentials_object=None):
-        """
-        Initializes Google Services.
-        - credentials_object: Pre-loaded Credentials object (for SaaS/DB usage).
-        - credentials_file: Path to client_secrets (for local desktop flow).
-        """
-        self.creds = None
-
-        if credentials_object:
-            self.creds = credentials_object
-        else:
-            # Fallback for local testing (token.json file)
-            if os.path.exists('token.json'):
-                try:
-                    self.creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-                except Exception as e:
-                    logger.warning(f"Error loading token.json: {e}")
-
-            # If no valid token, let user log in (Desktop Flow)
-            if not self.creds or not self.creds.valid:
-                if self.creds and self.creds.expired and self.creds.refresh_token:
-                    try:
-                        self.creds.refresh(Request())
-                    except Exception as e:
-                        logger.warning(f"Error refreshing token: {e}")
-                        self.creds = None
-
-                if not self.creds and os.path.exists(credentials_file):
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        credentials_file, SCOPES)
-                    self.creds = flow.run_local_server(port=0)
-                    with open('token.json', 'w') as token:
-                        token.write(self.creds.to_json())
-        
-        if self.creds:
-            self.calendar_service = build('calendar', 'v3', credentials=self.creds)
-            self.sheets_service = build('sheets', 'v4', credentials=self.creds)
-        else:
-            self.calendar_service = None
-            self.sheets_service = None
-
-
-    def create_event(self, calendar_id, summary, description, start_time, end_time):
-        """
-        Creates a Google Calendar event.
-        start_time and end_time should be ISO strings.
-        """
-        if not self.calendar_service: return None
-        
-        event = {
-            'summary': summary,
-            'description': description,
-            'start': {
-                'dateTime': start_time, 
-                'timeZone': 'America/Bogota', # Adjust as needed
-            },
-            'end': {
-                'dateTime': end_time,
-                'timeZone': 'America/Bogota',
-            },
-        }
-
-        try:
-            event_result = self.calendar_service.events().insert(calendarId=calendar_id, body=event).execute()
-            logger.info(f"Event created: {event_result.get('htmlLink')}")
-            return event_result
-        except HttpError as error:
-            logger.error(f"An error occurred in create_event: {error}")
-            return None
-
-    def delete_event(self, calendar_id, event_id):
-        """Deletes an event by ID."""
-        if not self.calendar_service: return None
-        try:
-            self.calendar_service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
-            logger.info(f"Event {event_id} deleted.")
-            return True
-        except HttpError as error:
-            logger.error(f"An error occurred in delete_event: {error}")
-            return False
-
-    def update_event(self, calendar_id, event_id, start_time, end_time, summary=None):
-        """Updates an event (Reschedule)."""
-        if not self.calendar_service: return None
-        try:
-            # First get the event to keep other fields
-            event = self.calendar_service.events().get(calendarId=calendar_id, eventId=event_id).execute()
-            
-            event['start']['dateTime'] = start_time
-            event['end']['dateTime'] = end_time
-            if summary:
-                event['summary'] = summary
-                
-            updated_event = self.calendar_service.events().update(calendarId=calendar_id, eventId=event_id, body=event).execute()
-            logger.info(f"Event {event_id} updated.")
-            return updated_event
-        except HttpError as error:
-            logger.error(f"An error occurred in update_event: {error}")
-            return None
-
-    def check_availability(self, calendar_id, time_min, time_max):
-        """
-        List events in a time range to check availability.
-        time_min and time_max are ISO strings.
-        """
-        if not self.calendar_service: return []
-        try:
-            events_result = self.calendar_service.events().list(
-                calendarId=calendar_id, timeMin=time_min, timeMax=time_max,
-                singleEvents=True, orderBy='startTime'
-            ).execute()
-            return events_result.get('items', [])
-        except HttpError as error:
-            logger.error(f"An error occurred in check_availability: {error}")
-            return []
-
-    def log_to_sheet(self, spreadsheet_id, range_name, values):
-        """
-        Appends a row to Google Sheets.
-        values: List of values [Nombre, Servicio, Precio, Hora, Estatus, Dia, Celular, ID, ...]
-        """
-        if not self.sheets_service: return None
-        body = {
-            'values': [values]
-        }
-        try:
-            result = self.sheets_service.spreadsheets().values().append(
-                spreadsheetId=spreadsheet_id, range=range_name,
-                valueInputOption="USER_ENTERED", body=body
-            ).execute()
-            logger.info(f"{result.get('updates').get('updatedCells')} cells appended.")
-            return result
-        except HttpError as error:
-            logger.error(f"An error occurred in log_to_sheet: {error}")
-            return None
+import os
+import asyncio
+import datetime
+import logging
+import threading
+from urllib.parse import quote
+import httpx
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from services import http_client
+from services.metrics import GOOGLE_RESPONSE_BYTES, GOOGLE_PARSE_SECONDS, span
+from services import resilience
+from services.resilience import CircuitOpenError, is_transient, status_of
+
+CALENDAR_API = 'https://www.googleapis.com/calendar/v3'
+# Hoja donde el bot registra cada acción: [Nombre, Servicio, Precio, Hora, Estatus, Dia, Celular, ID, Origen]
+LOG_SHEET_RANGE = "Hoja 1!A:I" # Adjust if your sheet name is different
+# Máximo de llamadas por batch request de la API de Calendar
+BATCH_LIMIT = 50
+# Respuestas parciales: solo los campos que el bot usa (sin attendees, links, creator, etc.)
+EVENT_FIELDS = 'id,status,summary,description,start,end'
+LIST_FIELDS = f"items({EVENT_FIELDS}),nextPageToken"
+FREEBUSY_FIELDS = 'calendars'
+PAGE_SIZE = 250
+
+SCOPES = [
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/spreadsheets'
+]
+
+logger = logging.getLogger(__name__)
+
+class GoogleServices:
+    def __init__(self, credentials_file='credentials.json', credentials_object=None):
+        """
+        Initializes Google Services.
+        - credentials_object: Pre-loaded Credentials object (for SaaS/DB usage).
+        - credentials_file: Path to client_secrets (for local desktop flow).
+        """
+        self.creds = None
+
+        if credentials_object:
+            self.creds = credentials_object
+        else:
+            # Fallback for local testing (token.json file)
+            if os.path.exists('token.json'):
+                try:
+                    self.creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+                except Exception as e:
+                    logger.warning(f"Error loading token.json: {e}")
+
+            # If no valid token, let user log in (Desktop Flow)
+            if not self.creds or not self.creds.valid:
+                if self.creds and self.creds.expired and self.creds.refresh_token:
+                    try:
+                        self.creds.refresh(Request())
+                    except Exception as e:
+                        logger.warning(f"Error refreshing token: {e}")
+                        self.creds = None
+
+                if not self.creds and os.path.exists(credentials_file):
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        credentials_file, SCOPES)
+                    self.creds = flow.run_local_server(port=0)
+                    with open('token.json', 'w') as token:
+                        token.write(self.creds.to_json())
+
+        # Los clientes de discovery se construyen en el primer uso: los caminos async
+        # (recordatorios, disponibilidad) no los necesitan y construirlos cuesta CPU
+        self._calendar_service = None
+        self._sheets_service = None
+        # httplib2.Http no es thread-safe: cada hilo (p. ej. herramientas del agente en paralelo) usa el suyo
+        self._local = threading.local()
+
+    def _thread_http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            from googleapiclient import http as api_http
+            from google_auth_httplib2 import AuthorizedHttp
+            # Timeout propio: sin él una llamada colgada bloquea el hilo hasta el timeout de gunicorn
+            raw = api_http.build_http()
+            raw.timeout = resilience.GOOGLE_TIMEOUT
+            http = self._local.http = AuthorizedHttp(self.creds, http=raw)
+        return http
+
+    def _build(self, api, version):
+        if not self.creds:
+            return None
+        from googleapiclient.discovery import build
+        from googleapiclient.http import HttpRequest
+
+        def request_builder(http, *args, **kwargs):
+            # El cliente de discovery se comparte; el transporte es el del hilo que ejecuta
+            return HttpRequest(self._thread_http(), *args, **kwargs)
+
+        return build(api, version, http=self._thread_http(), requestBuilder=request_builder)
+
+    @property
+    def calendar_service(self):
+        if self._calendar_service is None:
+            self._calendar_service = self._build('calendar', 'v3')
+        return self._calendar_service
+
+    @property
+    def sheets_service(self):
+        if self._sheets_service is None:
+            self._sheets_service = self._build('sheets', 'v4')
+        return self._sheets_service
+
+
+    @staticmethod
+    def _execute(request, call, dependency='calendar', idempotent=True):
+        """
+        Executes a googleapiclient request through the dependency's circuit breaker
+        (with retries if idempotent), recording response size and JSON parse time.
+        """
+        postproc = request.postproc
+
+        def measured(resp, content):
+            GOOGLE_RESPONSE_BYTES.labels(call=call).observe(len(content or b''))
+            with span(call, GOOGLE_PARSE_SECONDS, None, 'call'):
+                return postproc(resp, content)
+
+        request.postproc = measured
+        return resilience.call(dependency, request.execute, idempotent=idempotent)
+
+    @staticmethod
+    def _event_body(summary, description, start_time, end_time):
+        return {
+            'summary': summary,
+            'description': description,
+            'start': {
+                'dateTime': start_time, 
+                'timeZone': 'America/Bogota', # Adjust as needed
+            },
+            'end': {
+                'dateTime': end_time,
+                'timeZone': 'America/Bogota',
+            },
+        }
+
+    def create_event(self, calendar_id, summary, description, start_time, end_time, event_id=None):
+        """
+        Creates a Google Calendar event.
+        start_time and end_time should be ISO strings.
+        event_id (base32hex) makes the insert idempotent: if an event with that ID already
+        exists (409), that event is returned with 'duplicate': True.
+        Transient failures (5xx, timeouts, open circuit) are raised so the caller can
+        queue the booking; a rejected event (4xx) returns None.
+        """
+        if not self.calendar_service: return None
+
+        event = self._event_body(summary, description, start_time, end_time)
+        if event_id:
+            event['id'] = event_id
+
+        try:
+            # Without our own ID a blind retry could book the slot twice; with it, retries are safe
+            event_result = self._execute(self.calendar_service.events().insert(calendarId=calendar_id, body=event),
+                                         'create_event', idempotent=bool(event_id))
+            logger.info(f"Event created: {event_result.get('htmlLink')}")
+            return event_result
+        except HttpError as error:
+            if event_id and status_of(error) == 409:
+                existing = self.get_event(calendar_id, event_id)
+                if existing:
+                    logger.info(f"Event {event_id} already exists; returning it.")
+                    return {**existing, 'duplicate': True}
+            if is_transient(error):
+                raise
+            logger.error(f"An error occurred in create_event: {error}")
+            return None
+
+    def batch_create_events(self, calendar_id, bodies):
+        """
+        Inserts several events with batch requests (up to 50 calls per HTTP request).
+        Returns a list aligned with bodies: the created event, or None if that insert failed.
+        """
+        results = [None] * len(bodies)
+        if not self.calendar_service or not bodies: return results
+
+        def callback(request_id, response, exception):
+            if exception:
+                logger.error(f"An error occurred in batch_create_events: {exception}")
+            else:
+                results[int(request_id)] = response
+
+        for offset in range(0, len(bodies), BATCH_LIMIT):
+            batch = self.calendar_service.new_batch_http_request(callback=callback)
+            for i, body in enumerate(bodies[offset:offset + BATCH_LIMIT], start=offset):
+                batch.add(self.calendar_service.events().insert(calendarId=calendar_id, body=body), request_id=str(i))
+            try:
+                resilience.call('calendar', batch.execute, idempotent=False)
+            except HttpError as error:
+                logger.error(f"An error occurred in batch_create_events: {error}")
+        logger.info(f"Batch created {sum(1 for r in results if r)}/{len(bodies)} events.")
+        return results
+
+    def delete_event(self, calendar_id, event_id):
+        """Deletes an event by ID."""
+        if not self.calendar_service: return None
+        try:
+            self._execute(self.calendar_service.events().delete(calendarId=calendar_id, eventId=event_id), 'delete_event')
+            logger.info(f"Event {event_id} deleted.")
+            return True
+        except (HttpError, CircuitOpenError) as error:
+            logger.error(f"An error occurred in delete_event: {error}")
+            return False
+
+    def get_event(self, calendar_id, event_id):
+        """Gets an event by ID (None if it does not exist or the request fails)."""
+        if not self.calendar_service: return None
+        try:
+            return self._execute(self.calendar_service.events().get(
+                calendarId=calendar_id, eventId=event_id, fields=EVENT_FIELDS), 'get_event')
+        except (HttpError, CircuitOpenError) as error:
+            logger.error(f"An error occurred in get_event: {error}")
+            return None
+
+    def update_event(self, calendar_id, event_id, start_time, end_time, summary=None):
+        """Updates an event (Reschedule)."""
+        if not self.calendar_service: return None
+        try:
+            # First get the event to keep other fields
+            event = self.calendar_service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+            
+            event['start']['dateTime'] = start_time
+            event['end']['dateTime'] = end_time
+            if summary:
+                event['summary'] = summary
+                
+            updated_event = self.calendar_service.events().update(calendarId=calendar_id, eventId=event_id, body=event).execute()
+            logger.info(f"Event {event_id} updated.")
+            return updated_event
+        except HttpError as error:
+            logger.error(f"An error occurred in update_event: {error}")
+            return None
+
+    def list_events(self, calendar_id, time_min, time_max):
+        """
+        List events in a time range, following nextPageToken, with only the fields the bot uses.
+        Unlike check_availability, errors are raised so callers can tell an empty
+        calendar from a failed request.
+        """
+        items, page_token = [], None
+        while True:
+            page = self._execute(self.calendar_service.events().list(
+                calendarId=calendar_id, timeMin=time_min, timeMax=time_max, singleEvents=True,
+                orderBy='startTime', maxResults=PAGE_SIZE, pageToken=page_token, fields=LIST_FIELDS
+            ), 'list_events')
+            items += page.get('items', [])
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return items
+
+    def free_busy(self, calendar_ids, time_min, time_max):
+        """
+        Busy intervals of several calendars in a single freebusy().query call:
+        {calendar_id: [{'start': ISO, 'end': ISO}, ...]}. Errors are raised (like list_events).
+        """
+        result = self._execute(self.calendar_service.freebusy().query(body={
+            'timeMin': time_min, 'timeMax': time_max, 'timeZone': 'America/Bogota',
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+        }, fields=FREEBUSY_FIELDS), 'free_busy')
+        busy = {}
+        for calendar_id, info in result.get('calendars', {}).items():
+            if info.get('errors'):
+                raise RuntimeError(f"freeBusy failed for {calendar_id}: {info['errors']}")
+            busy[calendar_id] = info.get('busy', [])
+        return busy
+
+    def check_availability(self, calendar_id, time_min, time_max):
+        """
+        List events in a time range to check availability.
+        time_min and time_max are ISO strings.
+        """
+        if not self.calendar_service: return []
+        try:
+            return self.list_events(calendar_id, time_min, time_max)
+        except (HttpError, CircuitOpenError) as error:
+            logger.error(f"An error occurred in check_availability: {error}")
+            return []
+
+    def read_sheet(self, spreadsheet_id, range_name):
+        """
+        Reads all rows in a range. Errors are raised (like list_events) so a failed
+        read is never mistaken for an empty sheet.
+        """
+        result = resilience.call('sheets', self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=range_name,
+            # Precios como número y fechas/horas como texto (no como serial de Sheets)
+            valueRenderOption='UNFORMATTED_VALUE', dateTimeRenderOption='FORMATTED_STRING'
+        ).execute)
+        return result.get('values', [])
+
+    def append_rows(self, spreadsheet_id, range_name, rows):
+        """
+        Appends several rows in one call and returns the updated range (e.g. "Hoja 1!A12:I14").
+        Errors are raised: the caller only marks the rows as written if this succeeds.
+        """
+        # Not idempotent: a retried append would duplicate the rows
+        result = resilience.call('sheets', self.sheets_service.spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id, range=range_name, valueInputOption="USER_ENTERED",
+            insertDataOption="INSERT_ROWS", body={'values': rows}
+        ).execute, idempotent=False)
+        return result.get('updates', {}).get('updatedRange', '')
+
+    def batch_update_values(self, spreadsheet_id, data):
+        """
+        Overwrites several ranges in one values().batchUpdate call.
+        data: [{'range': 'Hoja 1!A5:I5', 'values': [[...]]}, ...]. Errors are raised.
+        """
+        result = resilience.call('sheets', self.sheets_service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={'valueInputOption': 'USER_ENTERED', 'data': data}
+        ).execute)
+        return result.get('totalUpdatedRows', 0)
+
+    def log_to_sheet(self, spreadsheet_id, range_name, values):
+        """
+        Appends a row to Google Sheets.
+        values: List of values [Nombre, Servicio, Precio, Hora, Estatus, Dia, Celular, ID, ...]
+        """
+        if not self.sheets_service: return None
+        body = {
+            'values': [values]
+        }
+        try:
+            # Not idempotent: a retried append would duplicate the row
+            result = resilience.call('sheets', self.sheets_service.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id, range=range_name,
+                valueInputOption="USER_ENTERED", body=body
+            ).execute, idempotent=False)
+            logger.info(f"{result.get('updates').get('updatedCells')} cells appended.")
+            return result
+        except (HttpError, CircuitOpenError) as error:
+            logger.error(f"An error occurred in log_to_sheet: {error}")
+            return None
+
+
+    # --- Async Calendar calls (shared httpx client, non-blocking for the event loop) ---
+
+    async def _auth_headers(self):
+        if not self.creds.valid:
+            # google-auth refreshes with a blocking request; keep it off the event loop
+            await asyncio.to_thread(self.creds.refresh, Request())
+        return {'Authorization': f"Bearer {self.creds.token}"}
+
+    async def _calendar_request(self, method, path, **kwargs):
+        # http_client ya reintenta; aquí solo el circuit breaker compartido con el camino síncrono
+        circuit = resilience.breaker('calendar')
+        if not circuit.allow():
+            raise CircuitOpenError("calendar no disponible (circuito abierto)")
+        try:
+            headers = await self._auth_headers()
+            response = await http_client.request(method, f"{CALENDAR_API}{path}", headers=headers, **kwargs)
+            response.raise_for_status()
+        except Exception as e:
+            if is_transient(e):
+                circuit.record_failure()
+            else:
+                circuit.record_success()
+            raise
+        circuit.record_success()
+        return response
+
+    async def _calendar_json(self, call, method, path, **kwargs):
+        response = await self._calendar_request(method, path, **kwargs)
+        GOOGLE_RESPONSE_BYTES.labels(call=call).observe(len(response.content))
+        with span(call, GOOGLE_PARSE_SECONDS, None, 'call'):
+            return response.json()
+
+    @staticmethod
+    def _events_path(calendar_id, event_id=None):
+        path = f"/calendars/{quote(calendar_id, safe='')}/events"
+        return f"{path}/{quote(event_id, safe='')}" if event_id else path
+
+    async def async_list_events(self, calendar_id, time_min, time_max):
+        """Async version of list_events (paginated, partial response; errors are raised)."""
+        params = {'timeMin': time_min, 'timeMax': time_max, 'singleEvents': 'true', 'orderBy': 'startTime',
+                  'maxResults': PAGE_SIZE, 'fields': LIST_FIELDS}
+        items = []
+        while True:
+            page = await self._calendar_json('async_list_events', 'GET', self._events_path(calendar_id), params=params)
+            items += page.get('items', [])
+            if not page.get('nextPageToken'):
+                return items
+            params = {**params, 'pageToken': page['nextPageToken']}
+
+    async def async_check_availability(self, calendar_id, time_min, time_max):
+        """Async version of check_availability."""
+        if not self.creds: return []
+        try:
+            return await self.async_list_events(calendar_id, time_min, time_max)
+        except (httpx.HTTPError, RefreshError, CircuitOpenError) as error:
+            # RefreshError: token revocado o vencido (no es un error de httpx)
+            logger.error(f"An error occurred in async_check_availability: {error}")
+            return []
@@ -1,147 +1,239 @@
-import os
-import uvicorn
-import asyncio
-import logging
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-from bot import create_application
-from services.auth_service import AuthService
-
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-
-class DebugMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        print(f"!!! DEBUG REQUEST: {request.method} {request.url} !!!")
-        response = await call_next(request)
-        return response
-
-# --- FastAPI Setup ---
-app = FastAPI()
-app.add_middleware(DebugMiddleware)
-auth_service = AuthService()
-
-@app.get("/")
-def home():
-    return {"status": "BarberBot Service Running", "service": "BarberBot"}
-
-@app.get("/auth/callback")
-async def auth_callback(state: str, code: str):
-    """
-    Callback URL que llamará Google.
-    state: Trae el telegram_id del usuario que inició el proceso.
-    code: El código de un solo uso para obtener el token.
-    """
-    logger.info(f"Recibido callback para usuario Telegram ID: {state}")
-    
-    success = auth_service.process_callback(code, state)
-    
-    if success:
-        # Enviar mensaje de confirmación a Telegram
-        try:
-            if bot_app:
-                await bot_app.bot.send_message(
-                    chat_id=state,
-                    text=(
-                        "✅ *¡Conexión Exitosa!*\n\n"
-                        "Tu calendario de Google se ha vinculado correctamente.\n"
-                        "Ahora ya puedes usar el bot para agendar citas y gestionar tu negocio.\n\n"
-                        "💡 *Prueba esto:* Dile al bot \"¿Qué citas tengo para mañana?\""
-                    ),
-                    parse_mode='Markdown'
-                )
-        except Exception as e:
-            logger.error(f"Error enviando mensaje de éxito a Telegram: {e}")
-
-        return HTMLResponse("""
-        <html>
-            <body style="font-family: sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: green;">✅ ¡Conexión Exitosa!</h1>
-                <p>Tu calendario de Google se ha vinculado correctamente con el Bot.</p>
-                <p>Ya puedes cerrar esta ventana y volver a Telegram.</p>
-            </body>
-        </html>
-        """)
-    else:
-        return HTMLResponse("""
-        <html>
-            <body style="font-family: sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: red;">❌ Error al conectar</h1>
-                <p>Hubo un problema guardando tus credenciales. Por favor intenta de nuevo.</p>
-            </body>
-        </html>
-        """, status_code=500)
-
-# --- Telegram Bot Setup ---
-bot_app = create_application()
-
-@app.on_event("startup")
-async def startup_event():
-    """
-    Inicia el bot de Telegram cuando arranca el servidor web.
-    """
-    logger.info("==================================================")
-    logger.info("       🚀 INICIANDO SERVIDOR MAIN.PY NUEVO 🚀      ")
-    print("!!! FORCE PRINT: SERVIDOR INICIANDO - SI NO VES ESTO, NO ES EL CODIGO NUEVO !!!!")
-    logger.info("==================================================")
-    
-    # Imprimir todas las rutas registradas para debugging
-    logger.info("Rutas registradas en FastAPI:")
-    for route in app.routes:
-        logger.info(f" -> {route.path} [{route.name}]")
-        
-    if bot_app:
-        logger.info("Iniciando Bot de Telegram...")
-        try:
-            await bot_app.initialize()
-            await bot_app.start()
-            # start_polling es asíncrono y no bloqueante en versions recientes de PTB si se usa así
-            await bot_app.updater.start_polling(drop_pending_updates=True)
-            logger.info("✅ Bot de Telegram iniciado y escuchando (Polling).")
-        except Exception as e:
-            logger.error(f"❌ ERROR CRÍTICO INICIANDO EL BOT: {e}")
-            logger.error("El servidor web seguirá corriendo, pero el Bot no responderá hasta arreglar el conflicto.")
-
-    logger.info("==================================================")
-    logger.info("       🟢 SERVIDOR WEB LISTO Y ESCUCHANDO 🟢       ")
-    logger.info("==================================================")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """
-    Detiene el bot correctamente al apagar el servidor.
-    """
-    if bot_app:
-        logger.info("Deteniendo Bot de Telegram...")
-        try:
-            await bot_app.updater.stop()
-            await bot_app.stop()
-            await bot_app.shutdown()
-            logger.info("Bot detenido.")
-        except Exception as e:
-            logger.error(f"Error deteniendo el bot: {e}")
-
-@app.get("/debug-routes")
-def debug_routes():
-    """Lista todas las rutas registradas para debugging."""
-    routes = []
-    for route in app.routes:
-        routes.append(str(route.path))
-    return {"registered_routes": routes}
-
-if __name__ == "__main__":
-    # Desarrollo local: usar uvicorn directamente
-    port = int(os.getenv("PORT", 8000))
-    logger.info(f"Iniciando servidor web en puerto {port} (modo desarrollo)...")
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=port,
-        log_level="info",
-        access_log=True,
-        loop="asyncio"
-    )
+import os
+import time
+import uuid
+import uvicorn
+import asyncio
+import logging
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from bot import create_application, drain, scheduler_state, db
+from services.auth_service import AuthService, OAuthConfigError, get_client_config
+from services.http_client import close_http_client
+from services.metrics import HTTP_SECONDS, render_latest
+from services.logging_config import setup_logging, log_context, sampled
+from services.startup import warm_up
+from services.health import HealthMonitor, default_probes
+
+# Configurar logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+# Health checks y scraping: no generan log de acceso
+QUIET_PATHS = {'/', '/metrics', '/healthz', '/readyz'}
+
+class RequestContextMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        with log_context(request_id=request_id):
+            start = time.perf_counter()
+            response = await call_next(request)
+            if request.url.path not in QUIET_PATHS:
+                # Sin query string: el callback OAuth trae el code en la URL
+                logger.info(
+                    f"{request.method} {request.url.path} {response.status_code} "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms",
+                    extra=sampled(1.0 if response.status_code >= 400 else 0.5)
+                )
+        response.headers['X-Request-ID'] = request_id
+        return response
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        # Usar la plantilla de la ruta (no la URL) para no disparar la cardinalidad
+        route = request.scope.get('route')
+        HTTP_SECONDS.labels(
+            method=request.method,
+            route=route.path if route else 'unmatched',
+            status=response.status_code
+        ).observe(time.perf_counter() - start)
+        return response
+
+# --- FastAPI Setup ---
+app = FastAPI()
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(MetricsMiddleware)
+auth_service = AuthService(db)
+health = HealthMonitor(default_probes(db))
+
+# Tareas lanzadas en el arranque (warm-up e inicio del bot); se cancelan al apagar
+background_tasks = set()
+
+@app.get("/")
+def home():
+    return {"status": "BarberBot Service Running", "service": "BarberBot"}
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: solo indica que el proceso responde."""
+    return health.liveness()
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: bot, scheduler, BD, credenciales y circuitos (desde la caché de sondas)."""
+    ready, report = health.readiness(bot_state(), scheduler_state())
+    if bot_status['error']:
+        report['bot_error'] = bot_status['error']
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato Prometheus (histogramas por etapa, herramientas, jobs y BD)."""
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/auth/callback")
+async def auth_callback(state: str, code: str):
+    """
+    Callback URL que llamará Google.
+    state: Trae el telegram_id del usuario que inició el proceso.
+    code: El código de un solo uso para obtener el token.
+    """
+    logger.info("Recibido callback OAuth")
+    
+    success = await auth_service.process_callback(code, state)
+    
+    if success:
+        # Enviar mensaje de confirmación a Telegram
+        try:
+            if bot_app:
+                await bot_app.bot.send_message(
+                    chat_id=state,
+                    text=(
+                        "✅ *¡Conexión Exitosa!*\n\n"
+                        "Tu calendario de Google se ha vinculado correctamente.\n"
+                        "Ahora ya puedes usar el bot para agendar citas y gestionar tu negocio.\n\n"
+                        "💡 *Prueba esto:* Dile al bot \"¿Qué citas tengo para mañana?\""
+                    ),
+                    parse_mode='Markdown'
+                )
+        except Exception as e:
+            logger.error(f"Error enviando mensaje de éxito a Telegram: {e}")
+
+        return HTMLResponse("""
+        <html>
+            <body style="font-family: sans-serif; text-align: center; padding: 50px;">
+                <h1 style="color: green;">✅ ¡Conexión Exitosa!</h1>
+                <p>Tu calendario de Google se ha vinculado correctamente con el Bot.</p>
+                <p>Ya puedes cerrar esta ventana y volver a Telegram.</p>
+            </body>
+        </html>
+        """)
+    else:
+        return HTMLResponse("""
+        <html>
+            <body style="font-family: sans-serif; text-align: center; padding: 50px;">
+                <h1 style="color: red;">❌ Error al conectar</h1>
+                <p>Hubo un problema guardando tus credenciales. Por favor intenta de nuevo.</p>
+            </body>
+        </html>
+        """, status_code=500)
+
+# --- Telegram Bot Setup ---
+bot_app = create_application()
+# Estado del arranque del bot para /readyz ('starting', 'polling', 'failed' o 'stopping')
+bot_status = {'state': 'starting', 'error': None}
+
+def bot_state():
+    if not bot_app:
+        return 'disabled'
+    if bot_status['state'] == 'polling' and not bot_app.updater.running:
+        return 'stopped'
+    return bot_status['state']
+
+async def start_bot():
+    logger.info("Iniciando Bot de Telegram...")
+    try:
+        await bot_app.initialize()
+        await bot_app.start()
+        # start_polling es asíncrono y no bloqueante en versions recientes de PTB si se usa así
+        await bot_app.updater.start_polling(drop_pending_updates=True)
+        bot_status['state'] = 'polling'
+        logger.info("✅ Bot de Telegram iniciado y escuchando (Polling).")
+    except Exception as e:
+        bot_status.update(state='failed', error=str(e))
+        logger.error(f"❌ ERROR CRÍTICO INICIANDO EL BOT: {e}")
+        logger.error("El servidor web seguirá corriendo, pero el Bot no responderá hasta arreglar el conflicto.")
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Arranque rápido: el servidor empieza a responder (health checks en / y /healthz) de inmediato;
+    la conexión a la BD, la carga de SDKs y el inicio del bot de Telegram van en segundo plano.
+    """
+    logger.info("==================================================")
+    logger.info("       🚀 INICIANDO SERVIDOR MAIN.PY NUEVO 🚀      ")
+    logger.info("==================================================")
+    
+    # Validar la configuración OAuth una sola vez (la reutilizan /connect y el callback)
+    try:
+        get_client_config()
+    except OAuthConfigError as e:
+        logger.error(f"❌ CONFIGURACIÓN OAUTH INVÁLIDA: {e}")
+        logger.error("/connect y /auth/callback fallarán hasta corregir GOOGLE_CREDENTIALS_JSON o credentials.json.")
+
+    # Imprimir todas las rutas registradas para debugging
+    logger.info("Rutas registradas en FastAPI:")
+    for route in app.routes:
+        logger.debug(f" -> {route.path} [{route.name}]")
+        
+    run_in_background(asyncio.to_thread(warm_up, db))
+    health.start()
+    if bot_app:
+        run_in_background(start_bot())
+
+    logger.info("==================================================")
+    logger.info("       🟢 SERVIDOR WEB LISTO Y ESCUCHANDO 🟢       ")
+    logger.info("==================================================")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Detiene el bot correctamente al apagar el servidor.
+    """
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await health.stop()
+
+    if bot_app and bot_app.running:
+        bot_status['state'] = 'stopping'
+        logger.info("Deteniendo Bot de Telegram (drenando turnos, jobs y mensajes)...")
+        try:
+            await drain(bot_app)
+            logger.info("Bot detenido.")
+        except Exception as e:
+            logger.error(f"Error deteniendo el bot: {e}")
+
+    await close_http_client()
+
+@app.get("/debug-routes")
+def debug_routes():
+    """Lista todas las rutas registradas para debugging."""
+    routes = []
+    for route in app.routes:
+        routes.append(str(route.path))
+    return {"registered_routes": routes}
+
+if __name__ == "__main__":
+    # Desarrollo local: usar uvicorn directamente
+    port = int(os.getenv("PORT", 8000))
+    logger.info(f"Iniciando servidor web en puerto {port} (modo desarrollo)...")
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        log_level="info",
+        access_log=True,
+        loop="asyncio"
+    )
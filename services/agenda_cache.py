@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+import threading
+from services.appointment_index import CALENDAR_TZ
+
+logger = logging.getLogger(__name__)
+
+# Red de seguridad para cambios hechos directamente en Google Calendar
+AGENDA_TTL = int(os.getenv('AGENDA_CACHE_TTL', 600))
+MAX_CACHED_DAYS = 14
+
+
+def local_day(value=None):
+    """Fecha local del calendario para un ISO (con o sin offset) o para ahora."""
+    if not value:
+        return datetime.datetime.now(CALENDAR_TZ).date()
+    if len(value) == 10:  # evento de día completo ('YYYY-MM-DD')
+        return datetime.date.fromisoformat(value)
+    dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=CALENDAR_TZ)
+    return dt.astimezone(CALENDAR_TZ).date()
+
+
+def day_bounds(day):
+    """timeMin/timeMax (UTC) que cubren el día local completo."""
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=CALENDAR_TZ)
+    end = start + datetime.timedelta(days=1)
+    return tuple(t.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ') for t in (start, end))
+
+
+def compact_event(event):
+    start = event.get('start', {})
+    return {
+        'id': event.get('id'),
+        'start': start.get('dateTime', start.get('date', '')),
+        'summary': event.get('summary', 'Cita'),
+    }
+
+
+def format_time(start):
+    if len(start) == 10:
+        return "Todo el día"
+    return datetime.datetime.fromisoformat(start.replace('Z', '+00:00')).astimezone(CALENDAR_TZ).strftime('%H:%M')
+
+
+def render_agenda(day, events, today=None):
+    """Texto (Markdown) de la agenda de un día, ordenado por hora."""
+    today = today or local_day()
+    title = "Hoy" if day == today else day.strftime('%d/%m/%Y')
+    if not events:
+        return f"📅 No hay citas programadas para {'hoy' if day == today else 'el ' + title}."
+    lines = [f"📅 *Agenda de {title}:* ({len(events)} {'cita' if len(events) == 1 else 'citas'})\n"]
+    lines += [f"• {format_time(e['start'])} - {e['summary']}" for e in sorted(events, key=lambda e: e['start'])]
+    return "\n".join(lines)
+
+
+def combine_agendas(barbers, texts):
+    """Une las agendas de cada silla con el nombre del barbero (None si fallaron todas)."""
+    if len(barbers) == 1:
+        return texts[0]
+    if all(t is None for t in texts):
+        return None
+    return "\n\n".join(f"💈 *{b['name']}*\n{t or '⚠️ No pude cargar su agenda.'}" for b, t in zip(barbers, texts))
+
+
+class AgendaCache:
+    """
+    Agenda por día (y por calendario/silla) ya renderizada. Se construye una vez con
+    un solo events().list, se actualiza en memoria cuando el bot crea o cancela citas
+    y se reconstruye cuando pasa AGENDA_TTL (por si el dueño edita el calendario a mano).
+    La sirven /hoy, el resumen de las 8:00 y la herramienta get_agenda del admin.
+    """
+
+    def __init__(self, ttl=AGENDA_TTL):
+        self.ttl = ttl
+        # (calendar_id, date) -> {'events': {id: evento compacto}, 'built_at': monotonic, 'text': str | None}
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        snapshot = self._days.get(key)
+        return snapshot if snapshot and time.monotonic() - snapshot['built_at'] < self.ttl else None
+
+    def _store(self, key, events):
+        with self._lock:
+            self._days[key] = {'events': {e['id']: compact_event(e) for e in events if e.get('id')},
+                               'built_at': time.monotonic(), 'text': None}
+            # Descartar otros días pasados y, si hay demasiados, los más viejos
+            today = local_day()
+            for old in sorted(self._days, key=lambda k: k[1]):
+                if old != key and (old[1] < today or len(self._days) > MAX_CACHED_DAYS):
+                    self._days.pop(old, None)
+
+    def _text(self, key):
+        with self._lock:
+            snapshot = self._days.get(key)
+            if snapshot is None:
+                return None
+            if snapshot['text'] is None:
+                snapshot['text'] = render_agenda(key[1], list(snapshot['events'].values()))
+            return snapshot['text']
+
+    # --- Lectura ---
+
+    def get_text(self, services, calendar_id, day=None):
+        """Agenda renderizada (camino síncrono: herramienta del agente)."""
+        key = (calendar_id, day or local_day())
+        if not self._fresh(key):
+            try:
+                self._store(key, services.list_events(calendar_id, *day_bounds(key[1])))
+            except Exception as e:
+                logger.error(f"Error construyendo la agenda del {key[1]}: {e}")
+        return self._text(key)
+
+    async def async_get_text(self, services, calendar_id, day=None, refresh=False):
+        """Agenda renderizada (camino async: /hoy y resumen diario)."""
+        key = (calendar_id, day or local_day())
+        if refresh or not self._fresh(key):
+            try:
+                self._store(key, await services.async_list_events(calendar_id, *day_bounds(key[1])))
+            except Exception as e:
+                # Si falla, se sirve la última versión conocida (si hay)
+                logger.error(f"Error construyendo la agenda del {key[1]}: {e}")
+        return self._text(key)
+
+    # --- Varias sillas ---
+
+    def get_combined(self, services, barbers, day=None):
+        """Agenda de todos los barberos (con una sola silla es la agenda de siempre)."""
+        return combine_agendas(barbers, [self.get_text(services, b['calendar_id'], day) for b in barbers])
+
+    async def async_get_combined(self, services, barbers, day=None, refresh=False):
+        """Como get_combined; devuelve (texto combinado, {calendar_id: texto}) para enviar a cada barbero."""
+        texts = await asyncio.gather(*(self.async_get_text(services, b['calendar_id'], day, refresh) for b in barbers))
+        return combine_agendas(barbers, texts), {b['calendar_id']: t for b, t in zip(barbers, texts)}
+
+    # --- Actualización incremental ---
+
+    def apply_created(self, event, calendar_id):
+        if not event or not event.get('id'):
+            return
+        compact = compact_event(event)
+        day = local_day(compact['start'])
+        with self._lock:
+            snapshot = self._days.get((calendar_id, day))
+            if snapshot is not None:
+                snapshot['events'][compact['id']] = compact
+                snapshot['text'] = None
+
+    def apply_deleted(self, event_id):
+        with self._lock:
+            for snapshot in self._days.values():
+                if snapshot['events'].pop(event_id, None) is not None:
+                    snapshot['text'] = None
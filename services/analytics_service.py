@@ -0,0 +1,279 @@
+import re
+import time
+import logging
+import datetime
+import threading
+from prompts import SERVICES
+from google_services import LOG_SHEET_RANGE
+from services.appointment_index import CALENDAR_TZ
+from services.intent_router import normalize
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('event_id', 'nombre', 'servicio', 'precio', 'dia', 'hora', 'estatus', 'celular', 'origen')
+
+# Estatus normalizados (minúsculas, sin tildes, espacios -> '_')
+BOOKED = {'agendado', 'actualizado', 'reagendado', 'completado'}
+CANCELLED = {'eliminado', 'cancelado'}
+NO_SHOW = {'no_asistio', 'no_show', 'no_vino', 'inasistencia'}
+
+PERIODS = ('hoy', 'semana', 'mes', 'mes_pasado', 'ano')
+CALENDAR_LOOKBACK_DAYS = 365
+CALENDAR_LOOKAHEAD_DAYS = 60
+
+DAY_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d')
+TIME_RE = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([ap])?", re.IGNORECASE)
+
+
+def parse_price(value):
+    """'$17.000 COP' / '17000' / 17000 -> 17000 (None si no hay dígitos)."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    # Quitar decimales ('17.000,00') y luego los separadores de miles
+    digits = re.sub(r"\D", '', re.sub(r"[.,]\d{1,2}\s*$", '', str(value or '').split('COP')[0].strip()))
+    return int(digits) if digits else None
+
+
+def parse_day(value):
+    for fmt in DAY_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(value).strip(), fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def parse_time(value):
+    """'15:00:00' / '3:00 p. m.' -> '15:00:00' ('' si no se reconoce)."""
+    match = TIME_RE.search(str(value or ''))
+    if not match:
+        return ''
+    hour, minute, second, meridian = match.groups()
+    hour = int(hour)
+    if meridian:
+        hour = hour % 12 + (12 if meridian.lower() == 'p' else 0)
+    return f"{hour:02d}:{minute}:{second or '00'}"
+
+
+def normalize_status(value):
+    return re.sub(r"\s+", '_', normalize(str(value or '')))
+
+
+def infer_service(text):
+    """Servicio del catálogo mencionado en un texto (el nombre o keyword más largo)."""
+    text = normalize(text or '')
+    best, best_len = None, 0
+    for service in SERVICES:
+        for keyword in (service['nombre'],) + tuple(service['keywords']):
+            keyword = normalize(keyword)
+            if keyword in text and len(keyword) > best_len:
+                best, best_len = service, len(keyword)
+    return best
+
+
+def row_from_values(values, origen=None):
+    """Fila del log de Sheets ([Nombre, Servicio, Precio, Hora, Estatus, Dia, Celular, ID, Origen]) -> dict."""
+    values = list(values) + [''] * (len(COLUMNS) - len(values))
+    precio = values[2]
+    nombre, servicio, _, hora, estatus, dia, celular, event_id, row_origen = (str(v).strip() for v in values[:9])
+    dia = parse_day(dia)
+    if not dia:
+        return None  # encabezado o fila incompleta
+
+    price = parse_price(precio)
+    if price is None:
+        service = infer_service(servicio)
+        price = service['precio'] if service else 0
+    return {
+        'event_id': event_id, 'nombre': nombre, 'servicio': servicio, 'precio': price,
+        'dia': dia, 'hora': parse_time(hora), 'estatus': normalize_status(estatus), 'celular': celular,
+        'origen': origen or row_origen or 'Sheets',
+    }
+
+
+def row_from_event(event):
+    """Cita creada directamente en Calendar (sin fila en Sheets)."""
+    start = event.get('start', {}).get('dateTime')
+    if not start or not event.get('id'):
+        return None
+    local = datetime.datetime.fromisoformat(start.replace('Z', '+00:00'))
+    if local.tzinfo:
+        local = local.astimezone(CALENDAR_TZ)
+    summary = event.get('summary') or ''
+    service = infer_service(summary)
+    return {
+        'event_id': event['id'], 'nombre': summary.rsplit(' - ', 1)[-1] if ' - ' in summary else summary,
+        'servicio': service['nombre'] if service else summary, 'precio': service['precio'] if service else 0,
+        'dia': local.strftime('%Y-%m-%d'), 'hora': local.strftime('%H:%M:%S'), 'estatus': 'agendado',
+        'celular': '', 'origen': 'Calendar',
+    }
+
+
+def resolve_period(period='mes', start_date=None, end_date=None, today=None):
+    """Devuelve (inicio, fin) como fechas, con fin exclusivo."""
+    today = today or datetime.datetime.now(CALENDAR_TZ).date()
+    if start_date:
+        start = datetime.date.fromisoformat(start_date)
+        end = datetime.date.fromisoformat(end_date) if end_date else today
+        return start, end + datetime.timedelta(days=1)
+
+    period = normalize_status(period or 'mes')
+    if period == 'hoy':
+        return today, today + datetime.timedelta(days=1)
+    if period == 'semana':
+        start = today - datetime.timedelta(days=today.weekday())
+        return start, start + datetime.timedelta(days=7)
+    if period == 'mes_pasado':
+        end = today.replace(day=1)
+        return (end - datetime.timedelta(days=1)).replace(day=1), end
+    if period in ('ano', 'anio', 'year'):
+        return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+    # 'mes' por defecto
+    start = today.replace(day=1)
+    return start, (start + datetime.timedelta(days=32)).replace(day=1)
+
+
+def format_money(value):
+    return f"${int(value):,}".replace(',', '.')
+
+
+class AnalyticsService:
+    """
+    Estadísticas del negocio sobre el historial de reservas (log de Sheets + calendario),
+    guardado en SQLite y agregado en memoria con pandas. El DataFrame se construye una vez
+    y se invalida al registrar o sincronizar, así las consultas de un mes tardan milisegundos.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._frame = None
+        self._lock = threading.Lock()
+
+    # --- Ingesta ---
+
+    def record(self, values):
+        """Registra una fila recién enviada a Sheets (mismo formato que log_to_sheet)."""
+        row = row_from_values(values)
+        if row and self.db.add_booking_log(row):
+            self._invalidate()
+
+    def sync(self, services, spreadsheet_id, calendar_ids):
+        """
+        Reconstruye el log local desde Sheets y añade las citas de Calendar que no están en él
+        (calendar_ids: un calendario por silla).
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        time_min = (now - datetime.timedelta(days=CALENDAR_LOOKBACK_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        time_max = (now + datetime.timedelta(days=CALENDAR_LOOKAHEAD_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        try:
+            rows = [r for r in (row_from_values(v) for v in services.read_sheet(spreadsheet_id, LOG_SHEET_RANGE)) if r] \
+                if spreadsheet_id else []
+            events = [e for calendar_id in calendar_ids for e in services.list_events(calendar_id, time_min, time_max)]
+        except Exception as e:
+            # Nunca vaciar el log por un fallo de red (ni dejar fuera las citas de una silla)
+            logger.error(f"Error sincronizando la analítica: {e}")
+            return None
+
+        logged = {r['event_id'] for r in rows if r['event_id']}
+        for row in (row_from_event(e) for e in events):
+            if row and row['event_id'] not in logged:
+                logged.add(row['event_id'])
+                rows.append(row)
+        if self.db.replace_booking_log(rows):
+            self._invalidate()
+            logger.info(f"Analítica sincronizada: {len(rows)} registros.")
+        return len(rows)
+
+    def _invalidate(self):
+        # Con el lock: no pisar un DataFrame que se está construyendo con datos viejos
+        with self._lock:
+            self._frame = None
+
+    # --- Consultas ---
+
+    def frame(self):
+        """DataFrame con el estado final de cada reserva (última fila por event_id)."""
+        frame = self._frame
+        if frame is not None:
+            return frame
+        with self._lock:
+            if self._frame is None:
+                self._frame = self._build_frame(self.db.get_booking_log())
+            return self._frame
+
+    @staticmethod
+    def _build_frame(records):
+        import pandas as pd  # import diferido: pandas solo se carga al pedir estadísticas
+
+        df = pd.DataFrame.from_records(records, columns=('id',) + COLUMNS)
+        df['precio'] = pd.to_numeric(df['precio'], errors='coerce').fillna(0).astype('int64')
+        df['fecha'] = pd.to_datetime(df['dia'], format='%Y-%m-%d', errors='coerce')
+        df['hora_num'] = pd.to_numeric(df['hora'].str.slice(0, 2), errors='coerce')
+        df['cliente'] = df['celular'].where(df['celular'] != '', df['nombre'].str.lower())
+        # Las filas sin event_id se cuentan cada una por separado
+        df['key'] = df['event_id'].where(df['event_id'] != '', 'row-' + df['id'].astype(str))
+        df = df.drop_duplicates('key', keep='last')
+        for column in ('servicio', 'estatus', 'origen'):
+            df[column] = df[column].astype('category')
+        return df.reset_index(drop=True)
+
+    def summary(self, start, end, top=5):
+        """Métricas del periodo [start, end) como tipos nativos de Python."""
+        import pandas as pd
+
+        started = time.perf_counter()
+        df = self.frame()
+        period = df[(df['fecha'] >= pd.Timestamp(start)) & (df['fecha'] < pd.Timestamp(end))]
+        booked = period[period['estatus'].isin(BOOKED)]
+        no_shows = int(period['estatus'].isin(NO_SHOW).sum())
+        cancelled = int(period['estatus'].isin(CANCELLED).sum())
+
+        by_service = booked.groupby('servicio', observed=True)['precio'].agg(['count', 'sum']) \
+            .sort_values('sum', ascending=False)
+        per_day = booked.groupby('dia').size()
+        per_hour = booked.groupby('hora_num').size().sort_values(ascending=False)
+        customers = booked.groupby('cliente').agg(nombre=('nombre', 'last'), citas=('key', 'size'), total=('precio', 'sum')) \
+            .sort_values(['citas', 'total'], ascending=False).head(top)
+
+        attended = len(booked) + no_shows
+        result = {
+            'start': str(start),
+            'end': str(end - datetime.timedelta(days=1)),
+            'bookings': int(len(booked)),
+            'cancelled': cancelled,
+            'no_shows': no_shows,
+            'no_show_rate': no_shows / attended if attended else 0.0,
+            'revenue': int(booked['precio'].sum()),
+            'by_service': [{'servicio': name, 'citas': int(row['count']), 'ingresos': int(row['sum'])}
+                           for name, row in by_service.iterrows()],
+            'per_day': {day: int(count) for day, count in per_day.items()},
+            'peak_hours': [{'hora': f"{int(hour):02d}:00", 'citas': int(count)}
+                           for hour, count in per_hour.head(3).items()],
+            'top_customers': [{'nombre': row['nombre'], 'citas': int(row['citas']), 'total': int(row['total'])}
+                              for _, row in customers.iterrows()],
+        }
+        logger.debug(f"Estadísticas {start}..{end} en {(time.perf_counter() - started) * 1000:.1f}ms")
+        return result
+
+    def report(self, period='mes', start_date=None, end_date=None):
+        """Resumen en texto para /stats y la herramienta del admin."""
+        start, end = resolve_period(period, start_date, end_date)
+        stats = self.summary(start, end)
+        lines = [
+            f"📊 Estadísticas del {stats['start']} al {stats['end']}",
+            f"Citas: {stats['bookings']} | Canceladas: {stats['cancelled']} | "
+            f"No asistieron: {stats['no_shows']} ({stats['no_show_rate']:.0%})",
+            f"Ingresos: {format_money(stats['revenue'])} COP",
+        ]
+        if stats['by_service']:
+            lines.append("\n💈 Por servicio:")
+            lines += [f"• {s['servicio']}: {s['citas']} citas · {format_money(s['ingresos'])}" for s in stats['by_service']]
+        if stats['per_day']:
+            busiest = max(stats['per_day'].items(), key=lambda item: item[1])
+            lines.append(f"\n📅 Día más ocupado: {busiest[0]} ({busiest[1]} citas)")
+        if stats['peak_hours']:
+            lines.append("🕒 Horas pico: " + ", ".join(f"{h['hora']} ({h['citas']})" for h in stats['peak_hours']))
+        if stats['top_customers']:
+            lines.append("\n👑 Mejores clientes:")
+            lines += [f"• {c['nombre']}: {c['citas']} citas · {format_money(c['total'])}" for c in stats['top_customers']]
+        return "\n".join(lines)
@@ -0,0 +1,131 @@
+import re
+import datetime
+import logging
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Las citas se crean con timeZone America/Bogota (ver GoogleServices.create_event)
+CALENDAR_TZ = ZoneInfo('America/Bogota')
+
+REF_RE = re.compile(r"Ref: (\d+)")
+
+SYNC_HORIZON_DAYS = 60
+BACKFILL_HORIZON_DAYS = 180
+BACKFILL_FLAG = 'appointments_backfilled'
+
+
+def extract_ref(description):
+    """Telegram ID del cliente a partir del 'Ref: <id>' de la descripción."""
+    match = REF_RE.search(description or '')
+    return match.group(1) if match else None
+
+
+def to_utc_iso(value):
+    """Normaliza un datetime ISO (con o sin offset) a UTC 'YYYY-MM-DDTHH:MM:SSZ'."""
+    dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=CALENDAR_TZ)
+    return dt.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def to_local(value):
+    """datetime en la zona del calendario a partir de un ISO UTC del índice."""
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(CALENDAR_TZ)
+
+
+def to_local_dt(value):
+    """datetime local (aware) a partir de un ISO con o sin offset (sin offset es hora del calendario)."""
+    dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt.astimezone(CALENDAR_TZ) if dt.tzinfo else dt.replace(tzinfo=CALENDAR_TZ)
+
+
+def utc_now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def event_to_appointment(event, telegram_id=None, calendar_id=None):
+    """Convierte un evento de Calendar en una fila del índice (None si no es de un cliente)."""
+    telegram_id = telegram_id or extract_ref(event.get('description'))
+    start = event.get('start', {}).get('dateTime')
+    if not telegram_id or not start or not event.get('id'):
+        return None
+    end = event.get('end', {}).get('dateTime')
+    return {
+        'event_id': event['id'],
+        'telegram_id': str(telegram_id),
+        'start_time': to_utc_iso(start),
+        'end_time': to_utc_iso(end) if end else None,
+        'summary': event.get('summary'),
+        'calendar_id': calendar_id,
+    }
+
+
+class AppointmentIndex:
+    """
+    Índice telegram_id -> próximas citas, guardado en la BD.
+    Se alimenta al crear/cancelar citas y se mantiene al día con la sincronización
+    periódica del calendario (con un backfill inicial más amplio).
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def record_created(self, telegram_id, event, calendar_id=None):
+        appointment = event_to_appointment(event, telegram_id, calendar_id)
+        if appointment:
+            self.db.save_appointment(**appointment)
+
+    def record_deleted(self, event_id):
+        self.db.delete_appointment(event_id)
+
+    def get(self, event_id):
+        """Cita indexada (inicio/fin UTC, silla), o None si el índice no la conoce."""
+        return self.db.get_appointment(event_id)
+
+    def calendar_of(self, event_id):
+        """Calendario (silla) donde está una cita, si el índice lo conoce."""
+        appointment = self.get(event_id)
+        return appointment.get('calendar_id') if appointment else None
+
+    def get_upcoming(self, telegram_id):
+        return self.db.get_user_appointments(str(telegram_id), utc_now_iso())
+
+    def sync(self, services, calendar_ids, on_removed=None):
+        """
+        Reconstruye la ventana próxima del índice a partir de los calendarios (uno por silla).
+        on_removed(cita) se llama por cada cita futura que desapareció del calendario
+        (cancelada directamente en Google Calendar, no a través del bot).
+        """
+        backfill = not self.db.get_config_value(BACKFILL_FLAG)
+        horizon = BACKFILL_HORIZON_DAYS if backfill else SYNC_HORIZON_DAYS
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        time_min = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        time_max = (now + datetime.timedelta(days=horizon)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        if isinstance(calendar_ids, str):
+            calendar_ids = [calendar_ids]
+        if not services.calendar_service:
+            return None
+        appointments = []
+        try:
+            for calendar_id in calendar_ids:
+                events = services.list_events(calendar_id, time_min, time_max)
+                appointments += [a for a in (event_to_appointment(e, calendar_id=calendar_id) for e in events) if a]
+        except Exception as e:
+            # Nunca vaciar el índice por un fallo de red (ni dejarlo a medias)
+            logger.error(f"Error sincronizando el índice de citas: {e}")
+            return None
+        previous = self.db.get_appointments_between(time_min, time_max) if on_removed else []
+        if self.db.replace_appointments(appointments, time_min, time_max):
+            current = {a['event_id'] for a in appointments}
+            for appointment in previous:
+                if appointment['event_id'] not in current:
+                    on_removed(appointment)
+            if backfill:
+                self.db.set_config_value(BACKFILL_FLAG, time_min)
+                logger.info(f"Backfill del índice de citas completado: {len(appointments)} citas.")
+            else:
+                logger.info(f"Índice de citas sincronizado: {len(appointments)} citas.")
+        return appointments
@@ -0,0 +1,67 @@
+import os
+import json
+import logging
+import datetime
+from services.appointment_index import CALENDAR_TZ, to_local_dt
+
+logger = logging.getLogger(__name__)
+
+# Horario de la barbería: límites para medir los huecos que deja cada cita
+BUSINESS_OPEN = os.getenv('BUSINESS_OPEN', '08:00')
+BUSINESS_CLOSE = os.getenv('BUSINESS_CLOSE', '20:00')
+
+
+def load_barbers():
+    """
+    Sillas/barberos de la barbería, cada uno con su propio calendario.
+    BARBERS es un JSON: [{"name": "Kevin", "calendar_id": "primary", "telegram_id": "123"}, ...]
+    (telegram_id es opcional: a quién mandarle sus recordatorios y su agenda del día).
+    Sin BARBERS hay una sola silla con GOOGLE_CALENDAR_ID, como siempre.
+    """
+    raw = os.getenv('BARBERS')
+    if raw:
+        try:
+            barbers = [{'name': b.get('name') or b['calendar_id'], 'calendar_id': b['calendar_id'],
+                        'telegram_id': str(b['telegram_id']) if b.get('telegram_id') else None}
+                       for b in json.loads(raw)]
+            if barbers:
+                return barbers
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"BARBERS inválido, se usa un solo calendario: {e}")
+    return [{'name': None, 'calendar_id': os.getenv('GOOGLE_CALENDAR_ID', 'primary'), 'telegram_id': None}]
+
+
+def find_barber(barbers, name):
+    """Barbero por nombre (sin distinguir mayúsculas); None si no hay coincidencia."""
+    name = (name or '').strip().lower()
+    if not name:
+        return None
+    return next((b for b in barbers if b['name'] and b['name'].lower() == name), None) or \
+        next((b for b in barbers if b['name'] and name in b['name'].lower()), None)
+
+
+def business_bounds(day):
+    """Apertura y cierre (datetimes locales) de un día."""
+    return tuple(datetime.datetime.combine(day, datetime.time.fromisoformat(t), tzinfo=CALENDAR_TZ)
+                 for t in (BUSINESS_OPEN, BUSINESS_CLOSE))
+
+
+def pick_chair(barbers, busy, start, end):
+    """
+    Motor de asignación: de los barberos libres en [start, end) elige el que deja
+    menos tiempo muerto alrededor de la cita (best-fit), para no fragmentar la agenda
+    en huecos cortos que nadie puede tomar. En empate gana el primero de la lista.
+    busy: {calendar_id: [{'start': ISO, 'end': ISO}, ...]} (respuesta de freeBusy).
+    """
+    opening, closing = business_bounds(start.date())
+    best, best_gap = None, None
+    for barber in barbers:
+        intervals = [(to_local_dt(b['start']), to_local_dt(b['end'])) for b in busy.get(barber['calendar_id'], [])]
+        if any(b_start < end and start < b_end for b_start, b_end in intervals):
+            continue
+        previous_end = max([e for s, e in intervals if e <= start] + [min(opening, start)])
+        next_start = min([s for s, e in intervals if s >= end] + [max(closing, end)])
+        gap = (start - previous_end) + (next_start - end)
+        if best_gap is None or gap < best_gap:
+            best, best_gap = barber, gap
+    return best
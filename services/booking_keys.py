@@ -0,0 +1,90 @@
+import base64
+import hashlib
+import logging
+import datetime
+import threading
+from services.appointment_index import to_utc_iso
+from services.analytics_service import infer_service
+
+logger = logging.getLogger(__name__)
+
+# Locks por franja de claves: dos envíos iguales en el mismo proceso se serializan
+LOCK_STRIPES = 64
+
+
+def booking_key(telegram_id, start_time, summary):
+    """
+    Clave de idempotencia de una reserva: cliente + inicio (UTC) + servicio.
+    Sirve tal cual como ID de evento de Calendar (base32hex en minúsculas, 32 caracteres).
+    """
+    # El título es "Servicio - Nombre": el nombre del cliente no debe confundirse con un servicio
+    label = (summary or '').split(' - ')[0]
+    service = infer_service(label)
+    name = service['nombre'] if service else label
+    raw = f"{telegram_id}|{to_utc_iso(start_time)}|{name.strip().lower()}"
+    return base64.b32hexencode(hashlib.sha1(raw.encode()).digest()).decode().lower().rstrip('=')
+
+
+def event_id_for(key, generation):
+    # Calendar no deja reutilizar el ID de un evento borrado: cada re-reserva usa otra generación
+    return key if not generation else f"{key}{generation}"
+
+
+class BookingKeys:
+    """
+    Reservas idempotentes. El ID del evento en Calendar se deriva de la clave, así que
+    un reintento del modelo o un "sí, agéndame" repetido no crea un segundo evento: si la
+    clave ya tiene un evento vivo se devuelve ese, y si otro proceso lo insertó primero
+    Calendar responde 409 y también se devuelve el existente. La clave queda en la BD
+    para saber qué generación usar tras una cancelación y para no registrar dos veces
+    la misma cita en Google Sheets.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock_for(self, key):
+        return self._locks[int(key[:6], 32) % LOCK_STRIPES]
+
+    def _live_event(self, services, record, calendar_id):
+        existing = services.get_event(record['calendar_id'] or calendar_id, record['event_id'])
+        return existing if existing and existing.get('status') != 'cancelled' else None
+
+    def find(self, services, calendar_id, telegram_id, summary, start_time):
+        """Evento vivo ya creado para esta reserva (None si no hay o se canceló)."""
+        record = self.db.get_booking_key(booking_key(telegram_id, start_time, summary))
+        return self._live_event(services, record, calendar_id) if record else None
+
+    def create_once(self, services, calendar_id, telegram_id, summary, description, start_time, end_time):
+        """Crea el evento una sola vez por clave. Devuelve (evento o None, duplicate)."""
+        key = booking_key(telegram_id, start_time, summary)
+        with self._lock_for(key):
+            record = self.db.get_booking_key(key)
+            generation = 0
+            if record:
+                existing = self._live_event(services, record, calendar_id)
+                if existing:
+                    logger.info(f"Reserva repetida ({key}): se devuelve el evento {record['event_id']}.")
+                    return existing, True
+                generation = record['generation'] + 1
+
+            event = services.create_event(calendar_id, summary, description, start_time, end_time,
+                                          event_id=event_id_for(key, generation))
+            if event and event.get('status') == 'cancelled':
+                # El ID ya se usó en una cita cancelada que la BD no conocía
+                generation += 1
+                event = services.create_event(calendar_id, summary, description, start_time, end_time,
+                                              event_id=event_id_for(key, generation))
+            if not event:
+                return None, False
+            self.db.save_booking_key({
+                'key': key, 'telegram_id': str(telegram_id), 'event_id': event['id'], 'calendar_id': calendar_id,
+                'generation': generation, 'logged': bool(record and record['event_id'] == event['id'] and record['logged']),
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+            return event, bool(event.pop('duplicate', False))
+
+    def first_log(self, event_id):
+        """False si la cita ya se registró como agendada en Sheets (el registro repetido se omite)."""
+        return self.db.mark_booking_logged(event_id) is not False
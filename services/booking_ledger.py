@@ -0,0 +1,262 @@
+import os
+import re
+import uuid
+import logging
+import datetime
+import threading
+from google_services import LOG_SHEET_RANGE
+from services.appointment_index import CALENDAR_TZ, to_utc_iso, extract_ref
+from services.analytics_service import (
+    BOOKED, infer_service, row_from_values, row_from_event, parse_day, parse_time, normalize_status
+)
+
+logger = logging.getLogger(__name__)
+
+# Ventana de Calendar que revisa el reconciliador (citas movidas, borradas o creadas a mano)
+LEDGER_LOOKBACK_DAYS = 1
+LEDGER_LOOKAHEAD_DAYS = int(os.getenv('LEDGER_LOOKAHEAD_DAYS', 60))
+
+# Columnas de la hoja (A:I), en el mismo orden que escribía log_to_sheet
+SHEET_FIELDS = ('nombre', 'servicio', 'precio', 'hora', 'estatus', 'dia', 'celular', 'event_id', 'origen')
+# Campos que se comparan con la hoja (el origen no cuenta como diferencia)
+COMPARED = ('nombre', 'servicio', 'precio', 'dia', 'hora', 'estatus', 'celular')
+DETAIL_FIELDS = ('nombre', 'servicio', 'precio', 'celular', 'origen')
+BOT_ORIGIN = 'Python-Bot'
+CALENDAR_ORIGIN = 'Calendar'
+SHEET_NAME = LOG_SHEET_RANGE.split('!')[0]
+RANGE_ROW_RE = re.compile(r"![A-Z]+(\d+)")
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _start_from(dia, hora):
+    """Inicio UTC a partir de día y hora locales de la hoja (None si no se reconocen)."""
+    day, time = parse_day(dia), parse_time(hora)
+    if not day or not time:
+        return None
+    return to_utc_iso(f"{day}T{time}")
+
+
+def sheet_values(entry):
+    return [entry.get(field) or '' for field in SHEET_FIELDS]
+
+
+def _same_row(sheet_row, expected):
+    # Comparar ya normalizado: la hoja devuelve precios como número y horas/fechas en su formato
+    a, b = row_from_values(sheet_row), row_from_values(expected)
+    if a is None or b is None:
+        return [str(v).strip() for v in sheet_row[:len(expected)]] == [str(v).strip() for v in expected]
+    return all(a[field] == b[field] for field in COMPARED)
+
+
+def _sheet_index(rows):
+    """event_id -> número de fila (1-based) en la hoja."""
+    by_event = {}
+    for number, values in enumerate(rows, start=1):
+        event_id = str(values[7]).strip() if len(values) > 7 else ''
+        if event_id:
+            by_event[event_id] = number  # si hay varias filas (log viejo), manda la última
+    return by_event
+
+
+class BookingLedger:
+    """
+    Registro de reservas (SQLite, replicado en Supabase): la fuente de verdad de la hoja de Google Sheets.
+    Cada creación, cancelación o cambio se escribe aquí de forma síncrona (milisegundos);
+    el reconciliador lo compara con Calendar y con la hoja y empuja las correcciones en
+    lote (un append para las filas nuevas y un values().batchUpdate para las que
+    cambiaron). Así el agente no espera a Sheets y una escritura fallida se reintenta
+    en la siguiente pasada en vez de perderse.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        # Un solo reconciliador a la vez: dos appends simultáneos duplicarían filas
+        self._sync_lock = threading.Lock()
+
+    # --- Escrituras (síncronas, en el turno) ---
+
+    def _save(self, entry_id, changes, fill_only=()):
+        """Aplica cambios a una entrada (los de fill_only solo si estaba vacía) y la deja pendiente de subir."""
+        with self._lock:
+            entry = self.db.get_ledger_entry(entry_id) or {
+                'id': entry_id, 'event_id': '', 'telegram_id': None, 'calendar_id': None, 'nombre': '', 'servicio': '',
+                'precio': '', 'hora': '', 'estatus': '', 'dia': '', 'celular': '', 'origen': '', 'start_time': None,
+                'sheet_row': None, 'synced': 0, 'version': 0,
+            }
+            updated = dict(entry)
+            for field, value in changes.items():
+                if value in (None, '') or (field in fill_only and entry.get(field)):
+                    continue
+                updated[field] = value
+            if updated == entry and entry['version']:
+                return entry
+            updated.update(synced=0, version=entry['version'] + 1, updated_at=_now())
+            self.db.save_ledger_entry(updated)
+            return updated
+
+    def record_created(self, event, telegram_id=None, calendar_id=None, origen=BOT_ORIGIN):
+        """Cita creada en Calendar (por el agente, la cola de reservas o una serie)."""
+        row = row_from_event(event)
+        if not row:
+            return None
+        telegram_id = telegram_id or extract_ref(event.get('description'))
+        return self._save(event['id'], {
+            'event_id': event['id'], 'telegram_id': telegram_id, 'calendar_id': calendar_id,
+            'nombre': row['nombre'], 'servicio': row['servicio'], 'precio': str(row['precio'] or ''),
+            'celular': telegram_id, 'origen': origen,
+            'dia': row['dia'], 'hora': row['hora'], 'estatus': 'agendado',
+            'start_time': to_utc_iso(event['start']['dateTime']),
+        }, fill_only=DETAIL_FIELDS)
+
+    def record_deleted(self, event_id):
+        # Una cita que el registro no conoce la corrige el reconciliador (adopta la fila de la hoja y ve que ya no está en Calendar)
+        if not self.db.get_ledger_entry(event_id):
+            return None
+        return self._save(event_id, {'estatus': 'eliminado'})
+
+    def record_values(self, values):
+        """Fila con el formato de log_to_sheet: [Nombre, Servicio, Precio, Hora, Estatus, Dia, Celular, ID, Origen]."""
+        changes = dict(zip(SHEET_FIELDS, (str(v).strip() for v in values)))
+        entry_id = changes.get('event_id') or f"local-{uuid.uuid4().hex[:12]}"
+        changes['start_time'] = _start_from(changes.get('dia'), changes.get('hora'))
+        return self._save(entry_id, changes, fill_only=('start_time',))
+
+    # --- Reconciliación (job en segundo plano) ---
+
+    def pending(self):
+        return len(self.db.get_ledger_entries(unsynced=True))
+
+    def reconcile(self, services, spreadsheet_id, calendar_ids, check_calendar=True):
+        """
+        Adopta las filas de la hoja, corrige el registro con Calendar (check_calendar) y lleva
+        a la hoja lo que difiere. Un fallo de red deja las entradas pendientes para la siguiente pasada.
+        """
+        with self._sync_lock:
+            report = {'calendar_fixes': 0, 'appended': 0, 'updated': 0}
+            rows = None
+            if spreadsheet_id and (check_calendar or self.pending()):
+                try:
+                    rows = services.read_sheet(spreadsheet_id, LOG_SHEET_RANGE)
+                    # Antes de Calendar: sin disco ni Supabase el registro arranca vacío en cada deploy, y las
+                    # citas que ya tienen fila no deben reconstruirse desde el título del evento
+                    self._adopt_rows(rows)
+                except Exception as e:
+                    logger.error(f"Registro de reservas: no se pudo leer la hoja: {e}")
+            if check_calendar and calendar_ids:
+                try:
+                    report['calendar_fixes'] = self._reconcile_calendar(services, calendar_ids)
+                except Exception as e:
+                    logger.error(f"Registro de reservas: no se pudo revisar Calendar: {e}")
+            if rows is not None:
+                try:
+                    report.update(self._push_sheet(services, spreadsheet_id, rows))
+                except Exception as e:
+                    logger.error(f"Registro de reservas: no se pudo actualizar la hoja: {e}")
+            report['pending'] = self.pending()
+            if report['calendar_fixes'] or report['appended'] or report['updated']:
+                logger.info(f"Registro de reservas reconciliado: {report}")
+            return report
+
+    def _reconcile_calendar(self, services, calendar_ids):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        time_min = (now - datetime.timedelta(days=LEDGER_LOOKBACK_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        time_max = (now + datetime.timedelta(days=LEDGER_LOOKAHEAD_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        events = {}
+        for calendar_id in calendar_ids:
+            # Si un calendario falla no se corrige nada: un error no debe verse como citas borradas
+            for event in services.list_events(calendar_id, time_min, time_max):
+                events[event['id']] = (event, calendar_id)
+
+        fixes = 0
+        for entry in self.db.get_ledger_entries(start=time_min, end=time_max):
+            found = events.pop(entry['event_id'], None) if entry['event_id'] else None
+            if normalize_status(entry['estatus']) not in BOOKED or not entry['event_id']:
+                continue
+            if not found:
+                if entry['calendar_id'] and entry['calendar_id'] not in calendar_ids:
+                    continue  # silla que ya no está configurada
+                self._save(entry['id'], {'estatus': 'eliminado'})
+                fixes += 1
+                continue
+            event, calendar_id = found
+            start = event.get('start', {}).get('dateTime')
+            if start and to_utc_iso(start) != entry['start_time']:
+                local = datetime.datetime.fromisoformat(to_utc_iso(start).replace('Z', '+00:00')).astimezone(CALENDAR_TZ)
+                self._save(entry['id'], {'start_time': to_utc_iso(start), 'dia': local.strftime('%Y-%m-%d'),
+                                         'hora': local.strftime('%H:%M:%S'), 'estatus': 'actualizado',
+                                         'calendar_id': calendar_id})
+                fixes += 1
+
+        # Citas que no pasaron por el bot (creadas a mano en Calendar). Solo las que son de un
+        # cliente (Ref) o de un servicio del catálogo: almuerzos y bloqueos personales no son reservas
+        for event_id, (event, calendar_id) in events.items():
+            known = self.db.get_ledger_entry(event_id)
+            if known:
+                # Fila adoptada con día/hora que no se reconocen (fuera de la ventana): no es un cambio de horario
+                if not known['start_time'] and event.get('start', {}).get('dateTime'):
+                    self._save(event_id, {'start_time': to_utc_iso(event['start']['dateTime']), 'calendar_id': calendar_id})
+                continue
+            if not extract_ref(event.get('description')) and not infer_service((event.get('summary') or '').split(' - ')[0]):
+                continue
+            if self.record_created(event, calendar_id=calendar_id, origen=CALENDAR_ORIGIN):
+                fixes += 1
+        return fixes
+
+    def _adopt_rows(self, rows):
+        """
+        Filas de la hoja que el registro aún no conoce (historial previo, escritas a mano o de
+        antes de un redeploy sin disco ni Supabase): se adoptan tal cual. Si una cita se tomó de Calendar,
+        los datos del cliente de la hoja mandan sobre los que salen del título del evento.
+        """
+        known = {entry['event_id']: entry for entry in self.db.get_ledger_entries() if entry['event_id']}
+        for event_id, number in _sheet_index(rows).items():
+            values = rows[number - 1]
+            if not row_from_values(values):
+                continue
+            sheet = dict(zip(SHEET_FIELDS, (str(v).strip() for v in values)))
+            entry = known.get(event_id)
+            if entry is None:
+                entry = self._save(event_id, {**sheet, 'start_time': _start_from(sheet.get('dia'), sheet.get('hora'))})
+                self.db.mark_ledger_synced(entry['id'], number, entry['version'])
+            elif entry['origen'] == CALENDAR_ORIGIN:
+                self._save(entry['id'], {field: sheet.get(field) for field in DETAIL_FIELDS})
+
+    def _push_sheet(self, services, spreadsheet_id, rows):
+        by_event = _sheet_index(rows)
+        updates, appends = [], []
+        for entry in self.db.get_ledger_entries():
+            number = by_event.get(entry['event_id']) if entry['event_id'] else entry['sheet_row']
+            if number and number > len(rows):
+                number = None
+            if number:
+                current = list(rows[number - 1])
+                # Lo que el registro no sabe (p. ej. una cita borrada sin datos) se completa con la hoja
+                missing = {f: str(current[i]).strip() for i, f in enumerate(SHEET_FIELDS)
+                           if i < len(current) and not entry.get(f) and str(current[i]).strip()}
+                if missing:
+                    entry = self._save(entry['id'], missing, fill_only=SHEET_FIELDS)
+                if _same_row(current, sheet_values(entry)):
+                    if not entry['synced'] or entry['sheet_row'] != number:
+                        self.db.mark_ledger_synced(entry['id'], number, entry['version'])
+                    continue
+                updates.append((entry, number))
+            else:
+                appends.append(entry)
+
+        if updates:
+            services.batch_update_values(spreadsheet_id, [
+                {'range': f"{SHEET_NAME}!A{number}:I{number}", 'values': [sheet_values(entry)]} for entry, number in updates
+            ])
+            for entry, number in updates:
+                self.db.mark_ledger_synced(entry['id'], number, entry['version'])
+        if appends:
+            updated_range = services.append_rows(spreadsheet_id, LOG_SHEET_RANGE, [sheet_values(e) for e in appends])
+            match = RANGE_ROW_RE.search(updated_range or '')
+            first = int(match.group(1)) if match else None
+            for i, entry in enumerate(appends):
+                self.db.mark_ledger_synced(entry['id'], first + i if first else None, entry['version'])
+        return {'appended': len(appends), 'updated': len(updates)}
@@ -0,0 +1,100 @@
+import uuid
+import logging
+import datetime
+import threading
+from services import resilience
+from services.resilience import CircuitOpenError
+from services.appointment_index import to_utc_iso, to_local_dt
+
+logger = logging.getLogger(__name__)
+
+
+class BookingQueue:
+    """
+    Reservas aceptadas mientras Google Calendar no respondía (timeout, 5xx o circuito
+    abierto). Se guardan en SQLite y un job las crea cuando la API vuelve: antes de
+    crear cada una se revisa con freeBusy que el espacio siga libre, y el cliente
+    recibe la confirmación (o la mala noticia) por la cola de salida.
+    """
+
+    def __init__(self, db, outbox=None, appointment_index=None, agenda=None, booking_keys=None, ledger=None):
+        self.db = db
+        self.ledger = ledger
+        self.booking_keys = booking_keys
+        self.outbox = outbox
+        self.appointment_index = appointment_index
+        self.agenda = agenda
+        self._lock = threading.Lock()
+
+    def enqueue(self, telegram_id, calendar_id, summary, description, start_time, end_time):
+        booking = {
+            'id': uuid.uuid4().hex[:12], 'telegram_id': str(telegram_id) if telegram_id else None,
+            'calendar_id': calendar_id, 'summary': summary, 'description': description,
+            'start_time': start_time, 'end_time': end_time, 'status': 'pending', 'attempts': 0,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        if not self.db.save_pending_booking(booking):
+            return None
+        logger.warning(f"Calendar no disponible: reserva {booking['id']} en cola ({start_time}).")
+        return booking
+
+    def _notify(self, booking, text):
+        if self.outbox and booking['telegram_id']:
+            self.outbox.send(booking['telegram_id'], text)
+
+    def _finish(self, booking, status, text):
+        booking['status'] = status
+        self.db.save_pending_booking(booking)
+        self._notify(booking, text)
+
+    def flush(self, services):
+        """Crea las reservas pendientes; se detiene si Calendar sigue caído. Devuelve cuántas se crearon."""
+        if resilience.breaker('calendar').is_open():
+            return 0
+        created = 0
+        with self._lock:
+            for booking in self.db.get_pending_bookings():
+                start = to_local_dt(booking['start_time'])
+                when = start.strftime('%d/%m %H:%M')
+                if start <= datetime.datetime.now(start.tzinfo):
+                    self._finish(booking, 'expired', f"😔 No pude confirmar tu cita del {when} a tiempo. Escríbeme para buscar otro horario.")
+                    continue
+                keyed = self.booking_keys and booking['telegram_id']
+                try:
+                    # El cliente pudo repetir la reserva mientras estaba en cola: no crear otra
+                    if keyed and self.booking_keys.find(services, booking['calendar_id'], booking['telegram_id'],
+                                                        booking['summary'], booking['start_time']):
+                        self._finish(booking, 'booked', f"✅ Tu cita del {when} quedó confirmada.")
+                        continue
+                    busy = services.free_busy([booking['calendar_id']], to_utc_iso(booking['start_time']), to_utc_iso(booking['end_time']))
+                    if busy.get(booking['calendar_id']):
+                        event = None
+                    elif keyed:
+                        event, _ = self.booking_keys.create_once(services, booking['calendar_id'], booking['telegram_id'],
+                                                                 booking['summary'], booking['description'],
+                                                                 booking['start_time'], booking['end_time'])
+                    else:
+                        event = services.create_event(booking['calendar_id'], booking['summary'], booking['description'],
+                                                      booking['start_time'], booking['end_time'])
+                except Exception as e:
+                    booking['attempts'] += 1
+                    self.db.save_pending_booking(booking)
+                    if isinstance(e, CircuitOpenError) or resilience.is_transient(e):
+                        logger.warning(f"Calendar sigue sin responder; quedan reservas en cola: {e}")
+                        break
+                    logger.error(f"Error creando la reserva en cola {booking['id']}: {e}")
+                    continue
+                if not event:
+                    self._finish(booking, 'failed', f"😔 El horario del {when} ya no está disponible. Escríbeme para buscar otro.")
+                    continue
+                if self.appointment_index and booking['telegram_id']:
+                    self.appointment_index.record_created(booking['telegram_id'], event, booking['calendar_id'])
+                if self.agenda:
+                    self.agenda.apply_created(event, booking['calendar_id'])
+                if self.ledger:
+                    self.ledger.record_created(event, booking['telegram_id'], booking['calendar_id'])
+                self._finish(booking, 'booked', f"✅ Tu cita del {when} quedó confirmada.")
+                created += 1
+        if created:
+            logger.info(f"{created} reservas en cola creadas en el calendario.")
+        return created
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+import threading
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# Claves maestras (Fernet, separadas por coma). La primera cifra; las demás solo descifran (rotación)
+KEYS_ENV = 'CREDENTIALS_ENCRYPTION_KEYS'
+ENCRYPTED_PREFIX = 'enc:v1:'
+# Segundos que se guardan en memoria las credenciales ya descifradas
+CREDENTIALS_CACHE_TTL = float(os.getenv('CREDENTIALS_CACHE_TTL', 300))
+MAX_CACHED = 64
+
+
+class CredentialsKeyError(Exception):
+    """Las credenciales guardadas están cifradas y ninguna clave configurada las descifra."""
+
+
+def load_keys(value=None):
+    raw = os.getenv(KEYS_ENV, '') if value is None else value
+    return [key.strip() for key in raw.split(',') if key.strip()]
+
+
+class CredentialCipher:
+    """
+    Cifrado de sobre para credentials_json: cada registro se cifra con su propia clave
+    de datos (Fernet) y esa clave se guarda envuelta con la clave maestra del entorno.
+    Rotar la maestra solo re-envuelve la clave de datos (rewrap), sin tocar el contenido.
+    Formato: 'enc:v1:<clave de datos envuelta>:<datos cifrados>'. El JSON en texto plano
+    de antes se sigue leyendo y se cifra en la siguiente escritura o rotación.
+    """
+
+    def __init__(self, keys, ttl=CREDENTIALS_CACHE_TTL):
+        self._keys = [Fernet(key) for key in keys]
+        self._kek = MultiFernet(self._keys) if self._keys else None
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._warned = False
+
+    @property
+    def enabled(self):
+        return self._kek is not None
+
+    def encrypt(self, credentials):
+        data = json.dumps(credentials)
+        if not self.enabled:
+            if not self._warned:
+                logger.warning(f"⚠️ {KEYS_ENV} no configurada: las credenciales de Google se guardan sin cifrar.")
+                self._warned = True
+            return data
+        dek = Fernet.generate_key()
+        wrapped = self._kek.encrypt(dek).decode()
+        return f"{ENCRYPTED_PREFIX}{wrapped}:{Fernet(dek).encrypt(data.encode()).decode()}"
+
+    def decrypt(self, stored):
+        """dict de credenciales (copia) a partir de lo guardado; usa la caché en memoria."""
+        if not stored:
+            return None
+        if not stored.startswith(ENCRYPTED_PREFIX):
+            return json.loads(stored)
+
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(stored)
+            if hit and hit[0] > now:
+                return dict(hit[1])
+
+        if not self.enabled:
+            logger.error(f"Credenciales cifradas pero {KEYS_ENV} no está configurada.")
+            raise CredentialsKeyError(f"{KEYS_ENV} no configurada")
+        wrapped, data = _split(stored)
+        try:
+            dek = self._kek.decrypt(wrapped.encode())
+            credentials = json.loads(Fernet(dek).decrypt(data.encode()))
+        except InvalidToken:
+            logger.error(f"Ninguna clave de {KEYS_ENV} descifra las credenciales guardadas (¿se quitó una clave antigua?).")
+            raise CredentialsKeyError("clave de cifrado incorrecta")
+
+        with self._lock:
+            if len(self._cache) >= MAX_CACHED:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            self._cache[stored] = (now + self.ttl, credentials)
+        return dict(credentials)
+
+    def needs_rewrap(self, stored):
+        """True si el registro está en texto plano o su clave de datos no usa la clave maestra actual."""
+        if not self.enabled or not stored:
+            return False
+        if not stored.startswith(ENCRYPTED_PREFIX):
+            return True
+        wrapped = stored[len(ENCRYPTED_PREFIX):].split(':', 1)[0]
+        try:
+            self._keys[0].decrypt(wrapped.encode())
+            return False
+        except InvalidToken:
+            return True
+
+    def rewrap(self, stored):
+        """Re-envuelve la clave de datos con la clave maestra actual (o cifra un registro en texto plano)."""
+        if not stored.startswith(ENCRYPTED_PREFIX):
+            return self.encrypt(json.loads(stored))
+        wrapped, data = _split(stored)
+        try:
+            return f"{ENCRYPTED_PREFIX}{self._kek.rotate(wrapped.encode()).decode()}:{data}"
+        except InvalidToken:
+            raise CredentialsKeyError("ninguna clave configurada descifra la clave de datos")
+
+
+def _split(stored):
+    """(clave de datos envuelta, datos) de un registro 'enc:v1:'; un registro truncado es como una clave incorrecta."""
+    parts = stored[len(ENCRYPTED_PREFIX):].split(':', 1)
+    if len(parts) != 2 or not all(parts):
+        raise CredentialsKeyError("registro cifrado mal formado")
+    return parts
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cipher():
+    """Cifrador del proceso con las claves de CREDENTIALS_ENCRYPTION_KEYS (se lee al primer uso)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CredentialCipher(load_keys())
+        return _default
@@ -0,0 +1,30 @@
+import time
+import asyncio
+import contextlib
+
+
+class InFlight:
+    """
+    Contador de trabajos en curso (turnos de handle_message) para el apagado ordenado:
+    al drenar se espera, con un deadline, a que terminen los que ya empezaron.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.completed = 0
+
+    @contextlib.asynccontextmanager
+    async def track(self):
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+
+    async def wait_idle(self, timeout, poll=0.05):
+        """True si no queda nada en curso antes de `timeout` segundos."""
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+        return not self.active
@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+from services import resilience
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se sondean las dependencias y cuánto se espera a cada sonda (segundos)
+PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', 30))
+PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', 5))
+
+# Sondas cuyo fallo deja al servicio "no listo"; el resto solo lo marca como degradado
+CRITICAL_PROBES = ('sqlite',)
+BOT_READY_STATES = ('polling', 'webhook')
+
+
+def credentials_probe(db):
+    """Credenciales de Google del dueño, leídas de la BD (no se llama a Google)."""
+    def probe():
+        admin_id = db.get_admin_id()
+        if not admin_id:
+            return 'no_admin'
+        creds = db.get_user_credentials(admin_id)
+        if not creds:
+            return 'missing'
+        return 'ok' if creds.get('refresh_token') else 'no_refresh_token'
+    return probe
+
+
+def default_probes(db):
+    return {
+        'sqlite': db.ping_sqlite,
+        'supabase': db.ping_supabase,
+        'credentials': credentials_probe(db),
+    }
+
+
+class HealthMonitor:
+    """
+    Sondea las dependencias en segundo plano cada PROBE_INTERVAL y guarda el último
+    resultado: /healthz y /readyz responden desde la caché, sin tocar Supabase ni Google.
+    Una sonda que no vuelve no se relanza hasta que termine.
+    """
+
+    def __init__(self, probes, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.results = {name: {'status': 'unknown'} for name in probes}
+        self.started_at = time.monotonic()
+        self._running = {}
+        self._task = None
+
+    async def _probe(self, name, probe):
+        pending = self._running.get(name)
+        if pending is None or pending.done():
+            pending = self._running[name] = asyncio.ensure_future(asyncio.to_thread(probe))
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(asyncio.shield(pending), self.timeout)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except Exception as e:
+            logger.warning(f"Health: la sonda '{name}' falló: {e}")
+            status = 'error'
+        self.results[name] = {
+            'status': status,
+            'latency_ms': round((time.perf_counter() - start) * 1000),
+            'checked_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        }
+
+    async def probe_once(self):
+        await asyncio.gather(*(self._probe(name, probe) for name, probe in self.probes.items()))
+
+    async def _loop(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def liveness(self):
+        """El proceso y el event loop responden (no depende de nada externo)."""
+        return {'status': 'ok', 'uptime_s': round(time.monotonic() - self.started_at)}
+
+    def readiness(self, bot, scheduler):
+        """
+        Listo para atender si el bot recibe updates, el scheduler corre y la BD local
+        responde. Supabase caído, un circuito abierto o credenciales faltantes solo
+        lo marcan como 'degraded' (hay fallbacks). Devuelve (listo, reporte).
+        """
+        circuits = resilience.breaker_states()
+        ready = (bot in BOT_READY_STATES and scheduler == 'running'
+                 and all(self.results[name]['status'] == 'ok' for name in CRITICAL_PROBES if name in self.results))
+        degraded = (any(result['status'] not in ('ok', 'disabled') for result in self.results.values())
+                    or any(state != 'closed' for state in circuits.values()))
+        report = {
+            'status': 'degraded' if ready and degraded else ('ready' if ready else 'not_ready'),
+            'bot': bot,
+            'scheduler': scheduler,
+            'dependencies': self.results,
+            'circuits': circuits,
+        }
+        return ready, report
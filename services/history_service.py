@@ -0,0 +1,189 @@
+import os
+import json
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Aproximación barata: ~4 caracteres por token (evita llamar a count_tokens en cada turno)
+CHARS_PER_TOKEN = 4
+
+SUMMARY_HEADER = "[System: Resumen de la conversación anterior]"
+
+
+def _to_dict(content):
+    """Normaliza un Content de Gemini (proto) o un dict al formato dict."""
+    if isinstance(content, dict):
+        return content
+    return type(content).to_dict(content)
+
+
+def estimate_tokens(content):
+    return len(json.dumps(_to_dict(content), ensure_ascii=False)) // CHARS_PER_TOKEN + 1
+
+
+def split_turns(history):
+    """
+    Agrupa el historial en turnos. Un turno empieza con un mensaje de texto del
+    usuario e incluye las llamadas a herramientas y la respuesta del modelo.
+    """
+    turns = []
+    for content in history:
+        content = _to_dict(content)
+        parts = content.get('parts', [])
+        starts_turn = content.get('role') == 'user' and any('text' in p for p in parts)
+        if starts_turn or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+class ConversationHistory:
+    """
+    Historial de chat por sesión con compactación automática.
+    Mantiene los últimos N turnos literales y resume los anteriores en hechos conocidos
+    (nombre del cliente, servicio habitual y citas próximas), con un tope de tokens.
+    Guarda como mucho max_sessions sesiones: al pasarse olvida la usada hace más tiempo.
+    """
+
+    def __init__(self, keep_turns=None, max_tokens=None, max_sessions=None):
+        self.keep_turns = keep_turns or int(os.getenv('HISTORY_KEEP_TURNS', 6))
+        self.max_tokens = max_tokens or int(os.getenv('HISTORY_MAX_TOKENS', 3000))
+        self.max_sessions = max_sessions or int(os.getenv('HISTORY_MAX_SESSIONS', 1000))
+        self._histories = OrderedDict()  # session_key -> list[dict], de la usada hace más tiempo a la última
+        self._facts = {}  # session_key -> dict
+        self._lock = threading.Lock()
+
+    def _touch(self, session_key):
+        """Marca la sesión como la última usada y descarta las más viejas por encima del tope (con el lock)."""
+        self._histories.move_to_end(session_key)
+        while len(self._histories) > self.max_sessions:
+            oldest, _ = self._histories.popitem(last=False)
+            self._facts.pop(oldest, None)
+
+    def get(self, session_key):
+        with self._lock:
+            if session_key in self._histories:
+                self._touch(session_key)
+            history = list(self._histories.get(session_key, []))
+            facts = self._facts.get(session_key)
+        if facts and self._render_facts(facts):
+            return self._summary_contents(facts) + history
+        return history
+
+    def save(self, session_key, history):
+        """Guarda el historial devuelto por la sesión, compactándolo si hace falta."""
+        history = [_to_dict(c) for c in history]
+        # Quitar el resumen inyectado por get(); se regenera a partir de los hechos
+        if history and self._is_summary(history[0]):
+            history = history[2:]
+
+        with self._lock:
+            facts = self._facts.setdefault(session_key, self._empty_facts())
+            kept = self._compact(history, facts)
+            self._histories[session_key] = kept
+            self._touch(session_key)
+
+    def append_exchange(self, session_key, user_text, reply_text):
+        """Registra un intercambio respondido fuera del LLM (p. ej. por el router)."""
+        with self._lock:
+            self._histories.setdefault(session_key, []).extend([
+                {'role': 'user', 'parts': [{'text': user_text}]},
+                {'role': 'model', 'parts': [{'text': reply_text}]},
+            ])
+            self._touch(session_key)
+
+    def clear(self, session_key):
+        with self._lock:
+            self._histories.pop(session_key, None)
+            self._facts.pop(session_key, None)
+
+    # --- Compactación ---
+
+    def _compact(self, history, facts):
+        turns = split_turns(history)
+        old, recent = turns[:-self.keep_turns], turns[-self.keep_turns:]
+
+        # Recortar por tokens (siempre se conserva el último turno)
+        budget = self.max_tokens - estimate_tokens({'parts': [{'text': self._render_facts(facts)}]})
+        while len(recent) > 1 and sum(estimate_tokens(c) for t in recent for c in t) > budget:
+            old.append(recent.pop(0))
+
+        if old:
+            for turn in old:
+                self._absorb(turn, facts)
+            logger.info(f"Historial compactado: {len(old)} turnos resumidos, {len(recent)} conservados.")
+
+        return [c for t in recent for c in t]
+
+    def _absorb(self, turn, facts):
+        """Extrae hechos de las llamadas a herramientas de un turno antiguo."""
+        pending_event = None
+        for content in turn:
+            for part in content.get('parts', []):
+                call = part.get('function_call')
+                if call:
+                    args = call.get('args', {})
+                    name = call.get('name')
+                    if name == 'create_event':
+                        pending_event = {
+                            'summary': args.get('summary'),
+                            'start': args.get('start_time'),
+                        }
+                    elif name == 'log_to_sheet':
+                        if args.get('nombre'):
+                            facts['name'] = args['nombre']
+                        if args.get('servicio'):
+                            facts['service'] = args['servicio']
+                        if args.get('estatus') == 'eliminado':
+                            facts['bookings'].pop(args.get('event_id'), None)
+                    elif name == 'delete_event':
+                        facts['bookings'].pop(args.get('event_id'), None)
+                    elif name == 'cancel_my_appointment':
+                        event_id = args.get('event_id')
+                        # Sin ID cancela la única cita próxima del cliente
+                        if not event_id and len(facts['bookings']) == 1:
+                            event_id = next(iter(facts['bookings']))
+                        facts['bookings'].pop(event_id, None)
+
+                response = part.get('function_response')
+                if response and response.get('name') == 'create_event' and pending_event:
+                    result = response.get('response', {}).get('result') or {}
+                    event_id = result.get('id') if isinstance(result, dict) else None
+                    facts['bookings'][event_id or pending_event['start']] = pending_event
+                    pending_event = None
+
+    @staticmethod
+    def _empty_facts():
+        return {'name': None, 'service': None, 'bookings': {}}
+
+    @staticmethod
+    def _render_facts(facts):
+        lines = []
+        if facts.get('name'):
+            lines.append(f"Nombre del cliente: {facts['name']}")
+        if facts.get('service'):
+            lines.append(f"Servicio habitual: {facts['service']}")
+
+        now = datetime.datetime.now().isoformat()[:19]
+        upcoming = sorted(
+            (b for b in facts.get('bookings', {}).values() if (b.get('start') or '')[:19] >= now),
+            key=lambda b: b.get('start') or ''
+        )
+        if upcoming:
+            lines.append("Citas próximas: " + "; ".join(f"{b['start']} ({b.get('summary') or 'Cita'})" for b in upcoming))
+        return "\n".join(lines)
+
+    def _summary_contents(self, facts):
+        return [
+            {'role': 'user', 'parts': [{'text': f"{SUMMARY_HEADER}\n{self._render_facts(facts)}"}]},
+            {'role': 'model', 'parts': [{'text': "Entendido."}]},
+        ]
+
+    @staticmethod
+    def _is_summary(content):
+        parts = content.get('parts', [])
+        return bool(parts) and parts[0].get('text', '').startswith(SUMMARY_HEADER)
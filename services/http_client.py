@@ -0,0 +1,66 @@
+import os
+import random
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Configuración centralizada de timeouts y reintentos para las llamadas HTTP async
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 15))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 20))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS'}
+
+_client = None
+
+
+def get_http_client():
+    """Cliente compartido (pool de conexiones + HTTP/2) para todo el proceso."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            # Reintenta errores de conexión a nivel de transporte
+            transport=httpx.AsyncHTTPTransport(http2=True, retries=HTTP_MAX_RETRIES),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def request(method, url, retry=None, **kwargs):
+    """
+    Petición HTTP con reintentos exponenciales (con jitter) ante 429/5xx.
+    Por defecto solo se reintentan los métodos idempotentes.
+    """
+    method = method.upper()
+    if retry is None:
+        retry = method in IDEMPOTENT_METHODS
+    attempts = HTTP_MAX_RETRIES + 1 if retry else 1
+
+    client = get_http_client()
+    for attempt in range(attempts):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TimeoutException as e:
+            if attempt + 1 >= attempts:
+                raise
+            logger.warning(f"Timeout en {method} {url} (intento {attempt + 1}/{attempts}): {e}")
+        else:
+            if response.status_code not in RETRY_STATUS or attempt + 1 >= attempts:
+                return response
+            logger.warning(f"{method} {url} respondió {response.status_code} (intento {attempt + 1}/{attempts})")
+
+        await asyncio.sleep(HTTP_BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5))
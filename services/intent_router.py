@@ -0,0 +1,236 @@
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from prompts import SERVICES
+from services.appointment_index import to_local
+from services.logging_config import sampled
+from services.metrics import FAST_PATH_TOTAL, FAST_PATH_MISSES, FAST_PATH_SAVED_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Minúsculas y sin tildes para que los patrones sean simples."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+# Patrones precompilados (sobre texto normalizado)
+PRICE_RE = re.compile(r"\b(precios?|cuanto (cuesta|vale|cobran|sale|es)|valor|tarifas?|costo)\b")
+ADDRESS_RE = re.compile(r"\b(direccion|donde (estan|quedan?|se ubican|los encuentro)|ubicacion|como llego)\b")
+PHONE_RE = re.compile(r"\b(telefono|numero de contacto|a que numero)\b")
+HOURS_RE = re.compile(r"\b(horarios?|a que hora (abren|cierran)|hasta que hora|que dias (abren|atienden|trabajan))\b")
+CANCEL_RE = re.compile(r"\b(cancela\w*|anula\w*)\b.*\bcitas?\b")
+NEXT_APPOINTMENT_RE = re.compile(r"\b(mi|mis) (proxima |siguiente )?citas?\b|\bcuando (es|tengo) (mi )?(proxima )?cita\b")
+# Si el mensaje intenta agendar o menciona fechas, lo decide el LLM
+BOOKING_RE = re.compile(
+    r"\b(agend\w*|reserv\w*|apart\w*|reagend\w*|cambi\w*|mover|manana|hoy|pasado|lunes|martes|miercoles|jueves|viernes|sabado|domingo|\d{1,2}(:\d{2})?\s*(am|pm|a\.m\.|p\.m\.))\b"
+)
+CONFIRM_RE = re.compile(r"^(si|sip|dale|confirmo|de una|ok|okay|claro)\b")
+DENY_RE = re.compile(r"^(no|mejor no|nel|dejala)\b")
+
+MAX_FAST_PATH_WORDS = 15
+PENDING_CANCEL_TTL = 300  # segundos
+
+
+class IntentRouter:
+    """
+    Router determinista delante del agente: responde intenciones comunes
+    (precios, dirección, horario, próxima cita, cancelar cita) con datos en caché
+    y solo deja pasar al LLM las peticiones abiertas.
+    """
+
+    def __init__(self, db, owner_ttl=300):
+        self.db = db
+        self.owner_ttl = owner_ttl
+        self.hours_text = os.getenv('BARBERIA_HORARIO')
+        self._owner_cache = (None, 0.0)
+        self._pending_cancel = {}  # user_id -> (event, expires_at)
+        self._service_matchers = [
+            (service, re.compile(r"\b(" + "|".join(re.escape(k) for k in sorted(service['keywords'], key=len, reverse=True)) + r")\b"))
+            for service in SERVICES
+        ]
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'fast_seconds': 0.0, 'llm_seconds': 0.0, 'llm_turns': 0, 'by_intent': {}}
+
+    # --- Datos en caché ---
+
+    def get_owner_info(self):
+        info, loaded_at = self._owner_cache
+        if info is None or time.monotonic() - loaded_at > self.owner_ttl:
+            info = self.db.get_owner_info() or {}
+            self._owner_cache = (info, time.monotonic())
+        return info
+
+    def match_service(self, text):
+        """Devuelve el servicio cuyo keyword más largo aparece en el texto."""
+        best, best_len = None, 0
+        for service, pattern in self._service_matchers:
+            for match in pattern.finditer(text):
+                if len(match.group(0)) > best_len:
+                    best, best_len = service, len(match.group(0))
+        return best
+
+    # --- Router ---
+
+    def route(self, agent, user_id, text):
+        """
+        Intenta responder sin LLM. Devuelve el texto de respuesta o None si el
+        mensaje debe ir al agente.
+        """
+        start = time.perf_counter()
+        normalized = normalize(text)
+        intent, reply = self._dispatch(agent, str(user_id), normalized)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            if reply is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+                self.stats['fast_seconds'] += elapsed
+                self.stats['by_intent'][intent] = self.stats['by_intent'].get(intent, 0) + 1
+
+        if reply is None:
+            FAST_PATH_MISSES.inc()
+        else:
+            FAST_PATH_TOTAL.labels(intent=intent).inc()
+            stats = self.get_stats()
+            FAST_PATH_SAVED_SECONDS.set(stats['seconds_saved'])
+            logger.info(
+                f"Fast-path '{intent}' en {elapsed * 1000:.1f}ms "
+                f"(hit ratio {stats['hit_ratio']:.0%}, ahorro estimado {stats['seconds_saved']:.1f}s)",
+                extra=sampled(0.1)
+            )
+        return reply
+
+    def _dispatch(self, agent, user_id, text):
+        # Respuesta a una oferta de la lista de espera
+        waitlist = getattr(agent, 'waitlist', None)
+        if waitlist and waitlist.pending_offer(user_id):
+            if CONFIRM_RE.match(text):
+                return 'waitlist_accept', waitlist.accept(agent, user_id)
+            if DENY_RE.match(text):
+                return 'waitlist_decline', waitlist.decline(user_id)
+
+        pending = self._pending_cancel.get(user_id)
+        if pending:
+            event, expires_at = pending
+            if time.monotonic() < expires_at:
+                if CONFIRM_RE.match(text):
+                    return 'cancel_confirm', self._confirm_cancel(agent, user_id, event)
+                if DENY_RE.match(text):
+                    self._pending_cancel.pop(user_id, None)
+                    return 'cancel_abort', "¡Perfecto! Tu cita sigue en pie. 💈"
+            self._pending_cancel.pop(user_id, None)
+
+        if not text or len(text.split()) > MAX_FAST_PATH_WORDS or BOOKING_RE.search(text):
+            return None, None
+
+        if CANCEL_RE.search(text):
+            return 'cancel', self._cancel_request(agent, user_id)
+        if NEXT_APPOINTMENT_RE.search(text):
+            return 'next_appointment', self._next_appointment(agent, user_id)
+        if PRICE_RE.search(text):
+            return 'prices', self._prices(text)
+        if ADDRESS_RE.search(text):
+            return 'address', self._address()
+        if PHONE_RE.search(text):
+            return 'phone', self._phone()
+        if HOURS_RE.search(text):
+            return 'hours', self._hours()
+        return None, None
+
+    # --- Respuestas ---
+
+    def _prices(self, text):
+        service = self.match_service(text)
+        if service:
+            return f"{service['emoji']} {service['nombre']}: ${service['precio']} COP. ¿Te agendo? ✂️"
+        lines = "\n".join(f"{s['emoji']} {s['nombre']}: ${s['precio']} COP" for s in SERVICES)
+        return f"¡Claro! Estos son nuestros servicios:\n\n{lines}\n\n¿Cuál te gustaría agendar? ✨"
+
+    def _address(self):
+        address = self.get_owner_info().get('address')
+        if not address:
+            return None
+        name = self.get_owner_info().get('barberia_name') or "la barbería"
+        return f"📍 Nos encuentras en {name}: {address}. ¡Te esperamos! 💈"
+
+    def _phone(self):
+        phone = self.get_owner_info().get('phone')
+        if not phone:
+            return None
+        return f"📞 Puedes comunicarte al {phone}."
+
+    def _hours(self):
+        if not self.hours_text:
+            return None
+        return f"🕘 Nuestro horario: {self.hours_text}"
+
+    def _upcoming_appointments(self, agent, user_id):
+        if not agent.appointment_index:
+            return None
+        return agent.appointment_index.get_upcoming(user_id)
+
+    def _next_appointment(self, agent, user_id):
+        appointments = self._upcoming_appointments(agent, user_id)
+        if appointments is None:
+            return None
+        if not appointments:
+            return "No tienes citas próximas agendadas. ¿Quieres que te agende una? 📅"
+        lines = "\n".join(f"• {format_start(a)} - {a.get('summary') or 'Cita'}" for a in appointments)
+        return f"📅 Tus próximas citas:\n{lines}"
+
+    def _cancel_request(self, agent, user_id):
+        appointments = self._upcoming_appointments(agent, user_id)
+        if appointments is None:
+            return None
+        if not appointments:
+            return "No encontré citas próximas a tu nombre. 🤔"
+        if len(appointments) > 1:
+            # Con varias citas hace falta que el LLM aclare cuál
+            return None
+        appointment = appointments[0]
+        self._pending_cancel[user_id] = (appointment, time.monotonic() + PENDING_CANCEL_TTL)
+        return f"Tienes cita el {format_start(appointment)} ({appointment.get('summary') or 'Cita'}). ¿Confirmas que quieres cancelarla? (sí/no)"
+
+    def _confirm_cancel(self, agent, user_id, appointment):
+        self._pending_cancel.pop(user_id, None)
+        if agent.cancel_my_appointment(appointment['event_id']) is not True:
+            return "No pude cancelar tu cita en este momento. Intenta de nuevo en un rato. 🙏"
+        # Import diferido: analytics_service importa normalize de este módulo
+        from services.analytics_service import infer_service
+        start = to_local(appointment['start_time'])
+        # El título es "Servicio - Nombre" (como en booking_keys.booking_key)
+        label, _, name = (appointment.get('summary') or '').partition(' - ')
+        service = infer_service(label)
+        agent.log_to_sheet(
+            nombre=name.strip(), servicio=service['nombre'] if service else label.strip(),
+            precio=str(service['precio']) if service else '', hora=start.strftime('%H:%M:%S'),
+            estatus='eliminado', dia=start.strftime('%Y-%m-%d'), celular=user_id, event_id=appointment['event_id']
+        )
+        return "✅ Listo, tu cita quedó cancelada. ¡Cuando quieras vuelves a agendar! 💈"
+
+    # --- Métricas ---
+
+    def record_llm_latency(self, seconds):
+        with self._lock:
+            self.stats['llm_turns'] += 1
+            self.stats['llm_seconds'] += seconds
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats['hits'] + stats['misses']
+        avg_llm = stats['llm_seconds'] / stats['llm_turns'] if stats['llm_turns'] else 0.0
+        stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+        stats['seconds_saved'] = max(0.0, stats['hits'] * avg_llm - stats['fast_seconds'])
+        return stats
+
+
+def format_start(appointment):
+    return to_local(appointment['start_time']).strftime('%d/%m %H:%M')
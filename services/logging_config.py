@@ -0,0 +1,158 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import datetime
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# IDs de correlación (se propagan a los hilos de asyncio.to_thread)
+request_id_var = contextvars.ContextVar('request_id', default=None)
+user_id_var = contextvars.ContextVar('user_id', default=None)
+
+# Librerías ruidosas: por defecto solo avisos
+DEFAULT_LEVELS = {
+    'httpx': 'WARNING',
+    'httpcore': 'WARNING',
+    'hpack': 'WARNING',
+    'googleapiclient.discovery_cache': 'ERROR',
+    'apscheduler.executors.default': 'WARNING',
+    'apscheduler.scheduler': 'WARNING',
+    'telegram.ext.Updater': 'WARNING',
+}
+
+# Teléfonos con prefijo internacional, o 9+ dígitos sueltos (celulares, Telegram IDs).
+# Fechas y horas ISO ("2026-03-10T09:00:00") no se tocan: son la señal principal de los logs de herramientas
+PHONE_RE = re.compile(r"\+\d[\d\s\-]{6,}\d|(?<![\w\-:.])(?!\d{4}-\d{2}-\d{2})\d(?:[\s\-]?\d){8,}(?![\w:])")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+_listener = None
+
+
+def pseudonymize(value):
+    """Hash corto y estable para correlacionar usuarios sin exponer su Telegram ID."""
+    if value is None:
+        return None
+    return hashlib.sha256(f"barberbot:{value}".encode()).hexdigest()[:12]
+
+
+def sampled(rate):
+    """extra=sampled(0.1) => solo se emite ~10% de esa línea."""
+    return {'sample_rate': rate}
+
+
+@contextmanager
+def log_context(request_id=None, user_id=None):
+    """Asocia request_id/user_id (pseudonimizado) a todas las líneas del bloque."""
+    tokens = [request_id_var.set(request_id)]
+    if user_id is not None:
+        tokens.append(user_id_var.set(pseudonymize(user_id)))
+    try:
+        yield
+    finally:
+        for token in reversed(tokens):
+            token.var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        return rate is None or record.levelno >= logging.WARNING or random.random() < rate
+
+
+class PiiRedactionFilter(logging.Filter):
+    """Enmascara teléfonos, Telegram IDs y emails salvo con LOG_PII=1."""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = EMAIL_RE.sub('<email>', PHONE_RE.sub('<num>', message))
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            payload['request_id'] = record.request_id
+        if getattr(record, 'user_id', None):
+            payload['user_id'] = record.user_id
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def parse_levels(spec):
+    """'agent=DEBUG,httpx=WARNING' -> {'agent': 'DEBUG', 'httpx': 'WARNING'}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    Configuración única de logging para todo el proceso: JSON (o texto con LOG_FORMAT=text),
+    emitido desde un hilo aparte vía QueueHandler/QueueListener para no bloquear el event loop.
+    Idempotente: se puede llamar desde main.py, bot.py o scripts.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    # Los filtros corren en el hilo que loguea (ahí viven los contextvars)
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter())
+    if os.getenv('LOG_PII') != '1':
+        queue_handler.addFilter(PiiRedactionFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    for name, level in {**DEFAULT_LEVELS, **parse_levels(os.getenv('LOG_LEVELS'))}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Vacía la cola y detiene el hilo de logging."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
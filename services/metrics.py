@@ -0,0 +1,101 @@
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Buckets pensados para el hot path del bot (de milisegundos a decenas de segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    'barberbot_stage_seconds', 'Duración de cada etapa de handle_message', ['stage'], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter('barberbot_stage_errors_total', 'Errores por etapa', ['stage'])
+TOOL_SECONDS = Histogram(
+    'barberbot_tool_seconds', 'Duración de cada herramienta del agente', ['tool'], buckets=LATENCY_BUCKETS
+)
+TOOL_ERRORS = Counter('barberbot_tool_errors_total', 'Herramientas del agente que lanzaron excepción', ['tool'])
+JOB_SECONDS = Histogram(
+    'barberbot_scheduler_job_seconds', 'Duración de los jobs del scheduler', ['job'], buckets=LATENCY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    'barberbot_db_seconds', 'Duración de las operaciones de Database', ['operation'], buckets=LATENCY_BUCKETS
+)
+HTTP_SECONDS = Histogram(
+    'barberbot_http_request_seconds', 'Peticiones HTTP al servidor FastAPI', ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+MESSAGES_TOTAL = Counter('barberbot_messages_total', 'Mensajes recibidos por tipo y rol', ['kind', 'role'])
+FAST_PATH_TOTAL = Counter('barberbot_fast_path_total', 'Mensajes respondidos por el router sin LLM', ['intent'])
+FAST_PATH_MISSES = Counter('barberbot_fast_path_misses_total', 'Mensajes que pasaron al LLM')
+FAST_PATH_SAVED_SECONDS = Gauge('barberbot_fast_path_saved_seconds', 'Latencia ahorrada estimada por el router')
+OUTBOX_MESSAGES = Counter('barberbot_outbox_messages_total', 'Mensajes salientes de la cola por resultado', ['result'])
+GOOGLE_RESPONSE_BYTES = Histogram(
+    'barberbot_google_response_bytes', 'Tamaño de las respuestas de Google Calendar por llamada', ['call'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+GOOGLE_PARSE_SECONDS = Histogram(
+    'barberbot_google_parse_seconds', 'Tiempo de parseo (JSON) de las respuestas de Google Calendar', ['call'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+TOOL_RESULT_BYTES = Histogram(
+    'barberbot_tool_result_bytes', 'Tamaño (JSON) de cada resultado de herramienta devuelto a Gemini', ['tool', 'stage'],
+    buckets=(64, 256, 1024, 4096, 16384, 65536)
+)
+CIRCUIT_STATE = Gauge('barberbot_circuit_state', 'Estado del circuit breaker (0 cerrado, 1 half-open, 2 abierto)', ['dependency'])
+CIRCUIT_REJECTIONS = Counter('barberbot_circuit_rejections_total', 'Llamadas rechazadas con el circuito abierto', ['dependency'])
+DEPENDENCY_RETRIES = Counter('barberbot_dependency_retries_total', 'Reintentos por errores transitorios', ['dependency'])
+DEGRADED_RESPONSES = Counter('barberbot_degraded_responses_total', 'Respuestas servidas por un fallback', ['fallback'])
+RATE_LIMITED = Counter('barberbot_rate_limited_total', 'Mensajes rechazados antes del LLM por límite', ['scope'])
+WAITLIST_EVENTS = Counter('barberbot_waitlist_events_total', 'Eventos de la lista de espera', ['event'])
+
+
+@contextmanager
+def span(stage, histogram=STAGE_SECONDS, errors=STAGE_ERRORS, label='stage'):
+    """Mide un bloque de código y lo registra en el histograma indicado."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.labels(**{label: stage}).inc()
+        raise
+    finally:
+        histogram.labels(**{label: stage}).observe(time.perf_counter() - start)
+
+
+def timed(histogram, name=None, label='operation', errors=None):
+    """Decorador (sync o async) que mide la función en histogram{label=name}."""
+    def decorator(func):
+        metric_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(metric_name, histogram, errors, label):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(metric_name, histogram, errors, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_db(func):
+    return timed(DB_SECONDS)(func)
+
+
+def timed_tool(func):
+    return timed(TOOL_SECONDS, label='tool', errors=TOOL_ERRORS)(func)
+
+
+def timed_job(func):
+    return timed(JOB_SECONDS, label='job')(func)
+
+
+def render_latest():
+    """Payload y content-type para la ruta /metrics."""
+    return generate_latest(), CONTENT_TYPE_LATEST
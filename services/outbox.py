@@ -0,0 +1,138 @@
+import os
+import asyncio
+import logging
+import datetime
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from services.metrics import OUTBOX_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Telegram permite ~30 mensajes/s por bot; vamos por debajo
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', 20))
+OUTBOX_MAX_ATTEMPTS = 3
+
+
+class Outbox:
+    """
+    Cola de mensajes salientes de Telegram con un único worker en el event loop del bot.
+    `send` se puede llamar desde cualquier hilo (p. ej. herramientas del agente o jobs
+    en asyncio.to_thread); el worker respeta el límite de envío y reintenta ante RetryAfter.
+    """
+
+    def __init__(self, db=None, rate=OUTBOX_RATE):
+        self.db = db
+        self.interval = 1 / rate if rate else 0
+        self.sent = 0
+        self._bot = None
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._current = None  # mensaje que el worker está enviando
+        self._delayed = {}  # reintentos programados: TimerHandle -> mensaje
+        self._stopped = False  # stop() ya vació la cola: lo que llegue después va directo a la BD
+
+    def start(self, bot):
+        """Arranca el worker; llamar desde el event loop (post_init). Reencola lo que quedó guardado al apagar."""
+        if self._worker is not None:
+            return
+        self._bot = bot
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped = False
+        if self.db:
+            restored = self.db.take_outbox_messages()
+            for chat_id, text, kwargs in restored:
+                self._queue.put_nowait((chat_id, text, kwargs, 1))
+            if restored:
+                logger.info(f"Outbox: {len(restored)} mensajes pendientes del apagado anterior.")
+        self._worker = self._loop.create_task(self._run())
+
+    def send(self, chat_id, text, **kwargs):
+        """Encola un mensaje (tras stop() lo guarda en la BD). Devuelve False si no se pudo encolar ni guardar."""
+        if self._stopped:
+            return self._persist([(chat_id, text, kwargs, 1)])
+        if self._loop is None or self._loop.is_closed():
+            logger.warning("Outbox sin arrancar: mensaje descartado.")
+            OUTBOX_MESSAGES.labels(result='dropped').inc()
+            return False
+        self._loop.call_soon_threadsafe(self._enqueue, (chat_id, text, kwargs, 1))
+        return True
+
+    def _enqueue(self, item):
+        # Un send() de otro hilo pudo programarse antes de stop() y llegar después: sin worker no saldría
+        if self._stopped:
+            self._persist([item])
+        else:
+            self._queue.put_nowait(item)
+
+    def _persist(self, items):
+        """Guarda mensajes en la BD para el próximo arranque; True si quedaron guardados."""
+        if items and self.db and self.db.save_outbox_messages([(chat_id, text, kwargs) for chat_id, text, kwargs, _ in items]):
+            return True
+        if items:
+            logger.error(f"Outbox: {len(items)} mensajes descartados al apagar.")
+        return False
+
+    def _retry_later(self, delay, item):
+        def requeue():
+            self._delayed.pop(handle, None)
+            self._queue.put_nowait(item)
+        handle = self._loop.call_later(delay, requeue)
+        self._delayed[handle] = item
+
+    async def _run(self):
+        while True:
+            self._current = chat_id, text, kwargs, attempt = await self._queue.get()
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self.sent += 1
+                OUTBOX_MESSAGES.labels(result='sent').inc()
+            except RetryAfter as e:
+                wait = e.retry_after.total_seconds() if isinstance(e.retry_after, datetime.timedelta) else e.retry_after
+                logger.warning(f"Telegram pidió esperar {wait}s; reencolando mensaje.")
+                await asyncio.sleep(wait)
+                self._queue.put_nowait((chat_id, text, kwargs, attempt))
+            except (Forbidden, BadRequest) as e:
+                # El usuario bloqueó el bot o el chat no existe: reintentar no sirve
+                logger.error(f"Mensaje descartado: {e}")
+                OUTBOX_MESSAGES.labels(result='failed').inc()
+            except Exception as e:
+                if attempt < OUTBOX_MAX_ATTEMPTS:
+                    logger.warning(f"Error enviando mensaje (intento {attempt}/{OUTBOX_MAX_ATTEMPTS}): {e}")
+                    self._retry_later(2 ** attempt, (chat_id, text, kwargs, attempt + 1))
+                else:
+                    logger.error(f"Mensaje descartado tras {attempt} intentos: {e}")
+                    OUTBOX_MESSAGES.labels(result='failed').inc()
+            finally:
+                self._current = None
+                self._queue.task_done()
+            if self.interval:
+                await asyncio.sleep(self.interval)
+
+    async def stop(self, timeout=5):
+        """
+        Intenta vaciar la cola hasta `timeout` y detiene el worker. Lo que no alcanzó a salir
+        (cola, reintentos programados y el mensaje en curso) se guarda en la BD y se envía
+        en el próximo arranque. Devuelve {'messages_sent', 'messages_persisted'}.
+        """
+        if self._worker is None:
+            return {'messages_sent': 0, 'messages_persisted': 0}
+        sent_before = self.sent
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbox detenida con {self._queue.qsize()} mensajes pendientes.")
+        self._worker.cancel()
+        self._worker = None
+        self._stopped = True
+
+        # Al menos una vez: el mensaje en curso pudo no haber salido
+        pending = [self._current] if self._current else []
+        for handle, item in list(self._delayed.items()):
+            handle.cancel()
+            pending.append(item)
+        self._delayed.clear()
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        persisted = len(pending) if self._persist(pending) else 0
+        return {'messages_sent': self.sent - sent_before, 'messages_persisted': persisted}
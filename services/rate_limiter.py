@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+from services.metrics import RATE_LIMITED
+
+# Mensajes por minuto y ráfaga máxima (por cliente y para todo el bot)
+USER_RATE_PER_MIN = float(os.getenv('USER_RATE_PER_MIN', 8))
+USER_BURST = float(os.getenv('USER_BURST', 5))
+GLOBAL_RATE_PER_MIN = float(os.getenv('GLOBAL_RATE_PER_MIN', 120))
+GLOBAL_BURST = float(os.getenv('GLOBAL_BURST', 30))
+# Un audio o una foto cuesta varios mensajes: subida al Files API + análisis + turno del agente
+MEDIA_COST = float(os.getenv('MEDIA_COST', 3))
+
+# Topes de medios, revisados con los metadatos de Telegram antes de descargar
+MAX_MEDIA_BYTES = int(os.getenv('MAX_MEDIA_BYTES', 5 * 1024 * 1024))
+MAX_AUDIO_SECONDS = int(os.getenv('MAX_AUDIO_SECONDS', 120))
+
+# Segundos entre avisos de "vas muy rápido" a un mismo cliente (el resto se ignora en silencio)
+NOTICE_INTERVAL = 60
+MAX_TRACKED_USERS = 10000
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` tokens por segundo hasta `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost=1, now=None):
+        self._refill(now if now is not None else time.monotonic())
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def refund(self, cost=1):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    Límite de mensajes antes del LLM: un bucket por cliente y uno global.
+    Un mensaje pasa solo si hay tokens en ambos; el rechazo no toca Gemini ni Google.
+    """
+
+    def __init__(self, user_rate=USER_RATE_PER_MIN, user_burst=USER_BURST,
+                 global_rate=GLOBAL_RATE_PER_MIN, global_burst=GLOBAL_BURST):
+        self.user_rate = user_rate / 60
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate / 60, global_burst)
+        self._users = {}
+        self._notified = {}
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user_id, now):
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            if len(self._users) >= MAX_TRACKED_USERS:
+                # Los buckets llenos equivalen a uno nuevo: se pueden olvidar
+                self._users = {u: b for u, b in self._users.items() if not b.is_full(now)}
+                self._notified = {u: t for u, t in self._notified.items() if u in self._users}
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def check(self, user_id, cost=1):
+        """None si el mensaje puede pasar; si no, el alcance del límite ('user' o 'global')."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._user_bucket(user_id, now)
+            if not bucket.take(cost, now):
+                scope = 'user'
+            elif not self.global_bucket.take(cost, now):
+                bucket.refund(cost)
+                scope = 'global'
+            else:
+                return None
+        RATE_LIMITED.labels(scope=scope).inc()
+        return scope
+
+    def should_notify(self, user_id):
+        """True si corresponde avisarle al cliente (como mucho una vez por NOTICE_INTERVAL)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._notified.get(user_id, -NOTICE_INTERVAL) < NOTICE_INTERVAL:
+                return False
+            self._notified[user_id] = now
+            return True
+
+
+def media_rejection(message):
+    """
+    Motivo para rechazar un audio/foto antes de descargarlo ('media_size' o 'media_duration'),
+    con los metadatos que ya trae el mensaje de Telegram. None si está dentro de los topes.
+    """
+    media = message.voice or message.audio or (message.photo[-1] if message.photo else None)
+    if media is None:
+        return None
+    if (getattr(media, 'file_size', None) or 0) > MAX_MEDIA_BYTES:
+        reason = 'media_size'
+    elif (getattr(media, 'duration', None) or 0) > MAX_AUDIO_SECONDS:
+        reason = 'media_duration'
+    else:
+        return None
+    RATE_LIMITED.labels(scope=reason).inc()
+    return reason
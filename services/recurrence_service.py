@@ -0,0 +1,183 @@
+import os
+import uuid
+import logging
+import datetime
+import threading
+from google_services import GoogleServices
+from services.appointment_index import CALENDAR_TZ, to_utc_iso, to_local, to_local_dt
+
+logger = logging.getLogger(__name__)
+
+# Semanas hacia adelante que se mantienen creadas en el calendario
+RECURRENCE_HORIZON_WEEKS = int(os.getenv('RECURRENCE_HORIZON_WEEKS', 8))
+MAX_EVERY_WEEKS = 12
+
+LOCAL_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _skipped(recurrence):
+    return {d for d in (recurrence.get('skipped') or '').split(',') if d}
+
+
+def _on_cadence(recurrence, start):
+    """True si start (local) es una instancia de la serie (mismo día de la semana, hora y cadencia)."""
+    first = to_local_dt(recurrence['first_start'])
+    days = (start.date() - first.date()).days
+    return days >= 0 and days % (7 * recurrence['every_weeks']) == 0 and start.time() == first.time()
+
+
+class RecurrenceService:
+    """
+    Citas recurrentes (cada N semanas) materializadas como eventos normales.
+
+    En vez de un evento con RRULE, cada serie mantiene creadas las instancias de las
+    próximas RECURRENCE_HORIZON_WEEKS semanas: se insertan todas en un solo batch
+    request y cada una es un evento con su 'Ref', así el índice de citas, la agenda,
+    los recordatorios y la lista de espera funcionan por instancia sin cambios.
+    Un job diario extiende el horizonte. Los choques se revisan con una sola consulta
+    freeBusy para todo el rango (incluye eventos del dueño y bloqueos personales); si
+    Calendar no responde se usa el índice de citas, que solo conoce citas de clientes.
+    """
+
+    def __init__(self, db, appointment_index=None, agenda=None, horizon_weeks=RECURRENCE_HORIZON_WEEKS, ledger=None):
+        self.db = db
+        self.appointment_index = appointment_index
+        self.agenda = agenda
+        self.ledger = ledger
+        self.horizon_weeks = horizon_weeks
+        self._lock = threading.Lock()
+
+    # --- Materialización ---
+
+    def _busy(self, services, instances, duration, calendar_id):
+        """Instancias que se cruzan con algo ocupado en la silla (freeBusy, o el índice si Calendar falla)."""
+        if not instances:
+            return set()
+        time_min = to_utc_iso(instances[0].isoformat())
+        time_max = to_utc_iso((instances[-1] + duration).isoformat())
+        try:
+            booked = [(to_utc_iso(b['start']), to_utc_iso(b['end']))
+                      for b in services.free_busy([calendar_id], time_min, time_max).get(calendar_id, [])]
+        except Exception as e:
+            logger.warning(f"freeBusy no disponible para la serie, se revisa el índice de citas: {e}")
+            time_min = to_utc_iso((instances[0] - datetime.timedelta(days=1)).isoformat())
+            booked = [(a['start_time'], a['end_time'] or a['start_time']) for a in self.db.get_appointments_between(time_min, time_max)
+                      if a.get('calendar_id') in (None, calendar_id)]
+        busy = set()
+        for start in instances:
+            start_utc, end_utc = to_utc_iso(start.isoformat()), to_utc_iso((start + duration).isoformat())
+            if any(b_start < end_utc and start_utc < b_end for b_start, b_end in booked):
+                busy.add(start)
+        return busy
+
+    def materialize(self, services, calendar_id, recurrence, now=None):
+        """
+        Crea en un batch las instancias pendientes hasta el horizonte.
+        Devuelve {'booked': [inicios], 'conflicts': [inicios]} (ISO local).
+        """
+        now = now or datetime.datetime.now(CALENDAR_TZ)
+        horizon = now + datetime.timedelta(weeks=self.horizon_weeks)
+        duration = datetime.timedelta(minutes=recurrence['duration_minutes'])
+        step = datetime.timedelta(weeks=recurrence['every_weeks'])
+        skipped = _skipped(recurrence)
+
+        instances = []
+        start = to_local_dt(recurrence['next_start'])
+        while start <= horizon:
+            if start > now and start.date().isoformat() not in skipped:
+                instances.append(start)
+            start += step
+        next_start = start
+
+        calendar_id = recurrence.get('calendar_id') or calendar_id
+        busy = self._busy(services, instances, duration, calendar_id)
+        wanted = [s for s in instances if s not in busy]
+        description = f"{recurrence['description']}\n\nSerie: {recurrence['id']}\n\nRef: {recurrence['telegram_id']}"
+        bodies = [GoogleServices._event_body(recurrence['summary'], description, s.strftime(LOCAL_FORMAT),
+                                             (s + duration).strftime(LOCAL_FORMAT)) for s in wanted]
+        created = services.batch_create_events(calendar_id, bodies) if bodies else []
+
+        booked, conflicts = [], [s.strftime(LOCAL_FORMAT) for s in sorted(busy)]
+        for start, event in zip(wanted, created):
+            if not event:
+                conflicts.append(start.strftime(LOCAL_FORMAT))
+                continue
+            booked.append(start.strftime(LOCAL_FORMAT))
+            if self.appointment_index:
+                self.appointment_index.record_created(recurrence['telegram_id'], event, calendar_id)
+            if self.agenda:
+                self.agenda.apply_created(event, calendar_id)
+            if self.ledger:
+                self.ledger.record_created(event, recurrence['telegram_id'], calendar_id)
+
+        recurrence['next_start'] = next_start.strftime(LOCAL_FORMAT)
+        self.db.save_recurrence(recurrence)
+        if instances:
+            logger.info(f"Serie {recurrence['id']}: {len(booked)} instancias creadas, {len(conflicts)} con choque.")
+        return {'booked': booked, 'conflicts': sorted(conflicts)}
+
+    def extend(self, services, calendar_id):
+        """Job diario: lleva todas las series activas hasta el horizonte (calendar_id: silla por defecto)."""
+        with self._lock:
+            recurrences = self.db.get_active_recurrences()
+            for recurrence in recurrences:
+                try:
+                    self.materialize(services, calendar_id, recurrence)
+                except Exception as e:
+                    logger.error(f"Error extendiendo la serie {recurrence['id']}: {e}")
+        return len(recurrences)
+
+    # --- Clientes ---
+
+    def create(self, services, calendar_id, telegram_id, summary, description, start_time, end_time, every_weeks):
+        """Crea la serie a partir de la primera cita y materializa el horizonte."""
+        start, end = to_local_dt(start_time), to_local_dt(end_time)
+        if end <= start:
+            raise ValueError("end_time must be after start_time")
+        if not 1 <= int(every_weeks) <= MAX_EVERY_WEEKS:
+            raise ValueError(f"every_weeks must be between 1 and {MAX_EVERY_WEEKS}")
+        recurrence = {
+            'id': uuid.uuid4().hex[:12], 'telegram_id': str(telegram_id), 'summary': summary, 'description': description,
+            'first_start': start.strftime(LOCAL_FORMAT), 'duration_minutes': int((end - start).total_seconds() // 60),
+            'every_weeks': int(every_weeks), 'next_start': start.strftime(LOCAL_FORMAT), 'skipped': '',
+            'status': 'active', 'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'calendar_id': calendar_id,
+        }
+        with self._lock:
+            result = self.materialize(services, calendar_id, recurrence)
+        return {'recurrence_id': recurrence['id'], 'every_weeks': recurrence['every_weeks'], **result}
+
+    def _instances(self, recurrence, telegram_id):
+        """Próximas citas del cliente que pertenecen a la serie."""
+        upcoming = self.appointment_index.get_upcoming(telegram_id) if self.appointment_index else []
+        return [a for a in upcoming
+                if a.get('summary') == recurrence['summary'] and _on_cadence(recurrence, to_local(a['start_time']))]
+
+    def skip(self, agent, telegram_id, day):
+        """Salta la instancia de un día (la cancela si ya estaba creada)."""
+        day = datetime.date.fromisoformat(day).isoformat()
+        cancelled = 0
+        for recurrence in self.db.get_active_recurrences(telegram_id):
+            first = to_local_dt(recurrence['first_start'])
+            target = datetime.datetime.combine(datetime.date.fromisoformat(day), first.timetz())
+            if not _on_cadence(recurrence, target):
+                continue
+            for appointment in self._instances(recurrence, telegram_id):
+                if to_local(appointment['start_time']).date().isoformat() == day and agent.delete_event(appointment['event_id']):
+                    cancelled += 1
+            recurrence['skipped'] = ','.join(sorted(_skipped(recurrence) | {day}))
+            self.db.save_recurrence(recurrence)
+            return {'skipped': day, 'cancelled': cancelled}
+        return None
+
+    def stop(self, agent, telegram_id):
+        """Detiene todas las series del cliente y cancela sus instancias futuras."""
+        stopped, cancelled = 0, 0
+        for recurrence in self.db.get_active_recurrences(telegram_id):
+            recurrence['status'] = 'stopped'
+            self.db.save_recurrence(recurrence)
+            stopped += 1
+            for appointment in self._instances(recurrence, telegram_id):
+                if agent.delete_event(appointment['event_id']):
+                    cancelled += 1
+        return {'stopped': stopped, 'cancelled': cancelled}
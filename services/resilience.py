@@ -0,0 +1,196 @@
+import os
+import time
+import socket
+import random
+import logging
+import threading
+import httpx
+from services.metrics import CIRCUIT_STATE, CIRCUIT_REJECTIONS, DEPENDENCY_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Timeouts por dependencia (segundos): fallar rápido en vez de esperar al timeout de gunicorn
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', 30))
+GOOGLE_TIMEOUT = float(os.getenv('GOOGLE_TIMEOUT', 10))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 5))
+
+RETRY_ATTEMPTS = int(os.getenv('RETRY_ATTEMPTS', 3))
+RETRY_BASE = float(os.getenv('RETRY_BASE', 0.25))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 4))
+
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 30))
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """La dependencia está marcada como caída: se falla de inmediato sin llamarla."""
+
+
+def status_of(error):
+    """Código HTTP de un error de googleapiclient, httpx, google.api_core o postgrest (None si no hay)."""
+    resp = getattr(error, 'resp', None)  # googleapiclient.errors.HttpError
+    if resp is not None and getattr(resp, 'status', None):
+        return int(resp.status)
+    response = getattr(error, 'response', None)  # httpx.HTTPStatusError
+    if response is not None and getattr(response, 'status_code', None):
+        return int(response.status_code)
+    code = getattr(error, 'code', None)  # google.api_core / postgrest
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error):
+    """True si vale la pena reintentar (y cuenta como fallo de la dependencia)."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, socket.timeout, ConnectionError, httpx.TransportError)):
+        return True
+    status = status_of(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    # httplib2 (ServerNotFoundError, etc.) y errores de socket sin código
+    return isinstance(error, OSError) or type(error).__module__.startswith('httplib2')
+
+
+def backoff_delay(attempt, base=RETRY_BASE, max_delay=RETRY_MAX_DELAY):
+    """Backoff exponencial con 'full jitter'."""
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por dependencia: tras BREAKER_FAILURES fallos transitorios seguidos
+    se abre y rechaza llamadas durante BREAKER_RESET_SECONDS; luego deja pasar una
+    sola llamada de prueba (half-open) que lo cierra o lo vuelve a abrir.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(dependency=name).set(0)
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def is_open(self):
+        """Consulta sin consumir la llamada de prueba."""
+        return self.state == 'open' or (self.state == 'half_open' and self._probing)
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+        CIRCUIT_REJECTIONS.labels(dependency=self.name).inc()
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuito '{self.name}' cerrado: la dependencia respondió de nuevo.")
+            self._failures, self._opened_at, self._probing = 0, None, False
+        CIRCUIT_STATE.labels(dependency=self.name).set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"Circuito '{self.name}' abierto tras {self._failures} fallos.")
+                self._opened_at, self._probing = time.monotonic(), False
+        CIRCUIT_STATE.labels(dependency=self.name).set(STATE_VALUES[self.state])
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} no disponible (circuito abierto)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_transient(e):
+                self.record_failure()
+            else:
+                # La dependencia respondió (p. ej. un 404): está arriba
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+
+class Guarded:
+    """
+    Proxy de un cliente con API encadenada (p. ej. supabase.table(...).select(...)):
+    cada .execute() pasa por el circuit breaker de la dependencia.
+    """
+
+    def __init__(self, target, dependency):
+        self._target = target
+        self._dependency = dependency
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == 'execute':
+            return lambda *args, **kwargs: breaker(self._dependency).call(attr, *args, **kwargs)
+        if callable(attr):
+            return lambda *args, **kwargs: self._wrap(attr(*args, **kwargs))
+        return self._wrap(attr)
+
+    def _wrap(self, value):
+        # Los builders intermedios (table(), select(), eq()...) también se envuelven
+        if value is None or isinstance(value, (str, bytes, int, float, bool, dict, list, tuple)):
+            return value
+        return Guarded(value, self._dependency)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    """Circuit breaker compartido del proceso para una dependencia ('gemini', 'calendar', 'sheets', 'supabase')."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states():
+    """Estado de los circuit breakers creados hasta ahora ({dependencia: 'closed' | 'half_open' | 'open'})."""
+    with _breakers_lock:
+        return {name: circuit.state for name, circuit in _breakers.items()}
+
+
+def call(dependency, fn, *args, idempotent=True, attempts=RETRY_ATTEMPTS, **kwargs):
+    """
+    Llama a fn a través del circuit breaker de la dependencia, con reintentos
+    exponenciales (con jitter) ante errores transitorios. Las llamadas no idempotentes
+    se intentan una sola vez: reintentarlas podría duplicar una cita.
+    """
+    circuit = breaker(dependency)
+    attempts = attempts if idempotent else 1
+    for attempt in range(attempts):
+        try:
+            return circuit.call(fn, *args, **kwargs)
+        except Exception as e:
+            if not is_transient(e) or attempt + 1 >= attempts or circuit.is_open():
+                raise
+            DEPENDENCY_RETRIES.labels(dependency=dependency).inc()
+            logger.warning(f"{dependency}: error transitorio (intento {attempt + 1}/{attempts}): {e}")
+            time.sleep(backoff_delay(attempt))
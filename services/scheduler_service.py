@@ -1,115 +1,251 @@
-import logging
-import datetime
-import asyncio
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from database import Database
-from google_services import GoogleServices
-from services.auth_service import AuthService
-
-logger = logging.getLogger(__name__)
-
-class SchedulerService:
-    def __init__(self, bot_app, db: Database, auth_service: AuthService):
-        self.bot_app = bot_app
-        self.db = db
-        self.auth_service = auth_service
-        self.scheduler = AsyncIOScheduler()
-        self.notified_events = set() # To prevent duplicate alerts in the current session
-
-    def start(self):
-        # 1. Check for reminders every 10 minutes
-        self.scheduler.add_job(self.check_reminders, 'interval', minutes=10)
-        
-        # 2. Daily summary at 8:00 AM
-        self.scheduler.add_job(self.send_daily_summary, CronTrigger(hour=8, minute=0))
-        
-        self.scheduler.start()
-        logger.info("Scheduler started.")
-
-    async def get_admin_services(self):
-        admin_id = self.db.get_admin_id()
-        if not admin_id:
-            return None, None
-            
-        creds = self.auth_service.get_credentials(admin_id)
-        if not creds:
-            return admin_id, None
-            
-        return admin_id, GoogleServices(credentials_object=creds)
-
-    async def check_reminders(self):
-        logger.info("Checking for reminders...")
-        admin_id, services = await self.get_admin_services()
-        if not services:
-            return
-
-        now = datetime.datetime.now()
-        # Look for events in the next 2 hours
-        time_min = now.isoformat() + 'Z'
-        time_max = (now + datetime.timedelta(hours=2)).isoformat() + 'Z'
-        
-        events = services.check_availability("primary", time_min, time_max)
-        if isinstance(events, str): # Error message
-            return
-
-        for event in events:
-            event_id = event['id']
-            start_str = event['start'].get('dateTime', event['start'].get('date'))
-            start_time = datetime.datetime.fromisoformat(start_str.replace('Z', '+00:00')).replace(tzinfo=None)
-            
-            diff = start_time - now
-            minutes_to_start = diff.total_seconds() / 60
-            
-            description = event.get('description', '')
-            
-            # --- 1. Customer Reminder (60 mins before) ---
-            if 50 <= minutes_to_start <= 70:
-                if f"customer_{event_id}" not in self.notified_events:
-                    # Extract Telegram ID from description "Ref: [ID]"
-                    import re
-                    match = re.search(r"Ref: (\d+)", description)
-                    if match:
-                        customer_id = match.group(1)
-                        await self.send_telegram_message(customer_id, 
-                            f"⏰ Recordatorio: Tienes una cita en la barbería en 1 hora ({start_time.strftime('%H:%M')}). ¡Te esperamos!")
-                        self.notified_events.add(f"customer_{event_id}")
-
-            # --- 2. Admin Alert (15 mins before) ---
-            if 10 <= minutes_to_start <= 20:
-                if f"admin_{event_id}" not in self.notified_events:
-                    await self.send_telegram_message(admin_id, 
-                        f"💈 Próximo cliente: En 15 minutos tienes a *{event.get('summary', 'Alguien')}*.")
-                    self.notified_events.add(f"admin_{event_id}")
-
-    async def send_daily_summary(self):
-        logger.info("Sending daily summary to admin...")
-        admin_id, services = await self.get_admin_services()
-        if not services:
-            return
-
-        now = datetime.datetime.now()
-        time_min = now.replace(hour=0, minute=0, second=0).isoformat() + 'Z'
-        time_max = now.replace(hour=23, minute=59, second=59).isoformat() + 'Z'
-        
-        events = services.check_availability("primary", time_min, time_max)
-        if isinstance(events, str) or not events:
-            message = "📅 Buenos días! Hoy no tienes citas programadas aún."
-        else:
-            message = "📅 *Agenda de Hoy:*\n\n"
-            # Sort events by time
-            sorted_events = sorted(events, key=lambda x: x['start'].get('dateTime', ''))
-            for e in sorted_events:
-                t = e['start'].get('dateTime', '')
-                if t:
-                    time_str = datetime.datetime.fromisoformat(t.replace('Z', '+00:00')).strftime('%H:%M')
-                    message += f"• {time_str} - {e.get('summary', 'Cita')}\n"
-            
-        await self.send_telegram_message(admin_id, message)
-
-    async def send_telegram_message(self, chat_id, text):
-        try:
-            await self.bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
-            logger.info(f"Notification sent to {chat_id}: {text[:30]}...")
-        except Exception as e:
-            logger.error(f"Error sending notification to {chat_id}: {e}")
+import os
+import time
+import logging
+import datetime
+import asyncio
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.schedulers.base import STATE_RUNNING, STATE_PAUSED
+from database import Database
+from google_services import GoogleServices
+from services.auth_service import AuthService, build_credentials
+from services.appointment_index import AppointmentIndex, extract_ref
+from services.analytics_service import AnalyticsService
+from services.agenda_cache import AgendaCache
+from services.waitlist_service import WaitlistService
+from services.recurrence_service import RecurrenceService
+from services.booking_queue import BookingQueue
+from services.booking_ledger import BookingLedger
+from services.barbers import load_barbers
+from services.metrics import timed_job
+
+logger = logging.getLogger(__name__)
+
+class SchedulerService:
+    def __init__(self, bot_app, db: Database, auth_service: AuthService, appointment_index: AppointmentIndex = None,
+                 analytics: AnalyticsService = None, agenda: AgendaCache = None, waitlist: WaitlistService = None,
+                 recurrences: RecurrenceService = None, booking_queue: BookingQueue = None, ledger: BookingLedger = None):
+        self.bot_app = bot_app
+        self.db = db
+        self.auth_service = auth_service
+        self.appointment_index = appointment_index or AppointmentIndex(db)
+        self.analytics = analytics or AnalyticsService(db)
+        self.agenda = agenda or AgendaCache()
+        self.waitlist = waitlist
+        self.recurrences = recurrences or RecurrenceService(db, self.appointment_index, self.agenda)
+        self.booking_queue = booking_queue
+        self.ledger = ledger
+        self.scheduler = AsyncIOScheduler()
+        self.notified_events = set() # To prevent duplicate alerts in the current session
+        # Jobs en ejecución, para esperarlos al apagar
+        self.running_jobs = 0
+        self.scheduler.add_listener(self._track_job, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+    def start(self):
+        # 1. Check for reminders every 10 minutes
+        self.scheduler.add_job(self.check_reminders, 'interval', minutes=10)
+        
+        # 2. Daily summary at 8:00 AM
+        self.scheduler.add_job(self.send_daily_summary, CronTrigger(hour=8, minute=0))
+
+        # 3. Keep the appointments index in sync with the calendar (first run backfills)
+        self.scheduler.add_job(self.sync_appointments, 'interval', minutes=30, next_run_time=datetime.datetime.now())
+
+        # 4. Rebuild the analytics store from the Sheets log + calendar
+        self.scheduler.add_job(self.sync_analytics, 'interval', hours=6, next_run_time=datetime.datetime.now())
+
+        # 5. Waitlist offers not answered within the hold time go to the next customer
+        if self.waitlist:
+            self.scheduler.add_job(self.expire_waitlist_offers, 'interval', minutes=1)
+
+        # 6. Keep recurring appointments materialized up to the horizon
+        self.scheduler.add_job(self.extend_recurrences, CronTrigger(hour=3, minute=0))
+
+        # 7. Create the bookings queued while Google Calendar was down
+        if self.booking_queue:
+            self.scheduler.add_job(self.flush_pending_bookings, 'interval', minutes=2)
+
+        # 8. Booking ledger -> Sheets: new changes every minute, full diff against Calendar and the sheet every 15
+        if self.ledger:
+            self.scheduler.add_job(self.push_ledger, 'interval', minutes=1)
+            self.scheduler.add_job(self.reconcile_bookings, 'interval', minutes=15, next_run_time=datetime.datetime.now())
+        
+        self.scheduler.start()
+        logger.info("Scheduler started.")
+
+    @property
+    def state(self):
+        """'running', 'paused' o 'stopped' (para /readyz)."""
+        return {STATE_RUNNING: 'running', STATE_PAUSED: 'paused'}.get(self.scheduler.state, 'stopped')
+
+    def _track_job(self, event):
+        self.running_jobs += 1 if event.code == EVENT_JOB_SUBMITTED else -1
+
+    async def stop(self, timeout):
+        """
+        Apagado ordenado: no lanza más jobs, espera hasta `timeout` a los que están
+        corriendo y detiene el scheduler. Devuelve cuántos jobs quedaron sin terminar.
+        """
+        if not self.scheduler.running:
+            return 0
+        self.scheduler.pause()
+        deadline = time.monotonic() + timeout
+        while self.running_jobs > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        abandoned = max(self.running_jobs, 0)
+        if abandoned:
+            logger.warning(f"Scheduler detenido con {abandoned} jobs en curso.")
+        self.scheduler.shutdown(wait=False)
+        return abandoned
+
+    async def get_admin_services(self):
+        tenant = self.db.get_tenant_context()
+        admin_id = tenant['admin_id']
+        if not admin_id:
+            return None, None
+            
+        creds = build_credentials(tenant['credentials'])
+        if not creds:
+            return admin_id, None
+            
+        return admin_id, GoogleServices(credentials_object=creds)
+
+    @timed_job
+    async def check_reminders(self):
+        logger.info("Checking for reminders...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+
+        now = datetime.datetime.now()
+        # Look for events in the next 2 hours
+        time_min = now.isoformat() + 'Z'
+        time_max = (now + datetime.timedelta(hours=2)).isoformat() + 'Z'
+        
+        # Una consulta por silla, en paralelo; el aviso de "próximo cliente" va a cada barbero
+        barbers = load_barbers()
+        results = await asyncio.gather(*(services.async_check_availability(b['calendar_id'], time_min, time_max) for b in barbers))
+        for barber, events in zip(barbers, results):
+            if isinstance(events, str): # Error message
+                continue
+            await self._remind(events, now, barber.get('telegram_id') or admin_id)
+
+    async def _remind(self, events, now, barber_chat_id):
+        for event in events:
+            event_id = event['id']
+            start_str = event['start'].get('dateTime', event['start'].get('date'))
+            start_time = datetime.datetime.fromisoformat(start_str.replace('Z', '+00:00')).replace(tzinfo=None)
+            
+            diff = start_time - now
+            minutes_to_start = diff.total_seconds() / 60
+            
+            description = event.get('description', '')
+            
+            # --- 1. Customer Reminder (60 mins before) ---
+            if 50 <= minutes_to_start <= 70:
+                if f"customer_{event_id}" not in self.notified_events:
+                    # Extract Telegram ID from description "Ref: [ID]"
+                    customer_id = extract_ref(description)
+                    if customer_id:
+                        await self.send_telegram_message(customer_id, 
+                            f"⏰ Recordatorio: Tienes una cita en la barbería en 1 hora ({start_time.strftime('%H:%M')}). ¡Te esperamos!")
+                        self.notified_events.add(f"customer_{event_id}")
+
+            # --- 2. Barber Alert (15 mins before; the admin if the barber has no Telegram) ---
+            if 10 <= minutes_to_start <= 20:
+                if f"admin_{event_id}" not in self.notified_events:
+                    await self.send_telegram_message(barber_chat_id, 
+                        f"💈 Próximo cliente: En 15 minutos tienes a *{event.get('summary', 'Alguien')}*.")
+                    self.notified_events.add(f"admin_{event_id}")
+
+    @timed_job
+    async def sync_appointments(self):
+        logger.info("Syncing appointments index...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        calendar_ids = [b['calendar_id'] for b in load_barbers()]
+        # Citas canceladas directamente en Calendar también liberan espacio para la lista de espera
+        on_removed = (lambda a: self.waitlist.slot_freed(a['start_time'], a['end_time'])) \
+            if self.waitlist else None
+        await asyncio.to_thread(self.appointment_index.sync, services, calendar_ids, on_removed)
+
+    @timed_job
+    async def expire_waitlist_offers(self):
+        await asyncio.to_thread(self.waitlist.expire_offers)
+
+    @timed_job
+    async def extend_recurrences(self):
+        logger.info("Extending recurring appointments...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        await asyncio.to_thread(self.recurrences.extend, services, load_barbers()[0]['calendar_id'])
+
+    @timed_job
+    async def flush_pending_bookings(self):
+        if not self.db.get_pending_bookings():
+            return
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        await asyncio.to_thread(self.booking_queue.flush, services)
+
+    @timed_job
+    async def push_ledger(self):
+        """Sube a la hoja las entradas del registro que aún no están (sin revisar Calendar)."""
+        if not self.ledger.pending():
+            return
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        await asyncio.to_thread(self.ledger.reconcile, services, os.getenv('GOOGLE_SPREADSHEET_ID'), [], False)
+
+    @timed_job
+    async def reconcile_bookings(self):
+        logger.info("Reconciling booking ledger...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        await asyncio.to_thread(self.ledger.reconcile, services, os.getenv('GOOGLE_SPREADSHEET_ID'),
+                                [b['calendar_id'] for b in load_barbers()])
+
+    @timed_job
+    async def sync_analytics(self):
+        logger.info("Syncing analytics store...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+        await asyncio.to_thread(self.analytics.sync, services, os.getenv('GOOGLE_SPREADSHEET_ID'),
+                                [b['calendar_id'] for b in load_barbers()])
+
+    @timed_job
+    async def send_daily_summary(self):
+        logger.info("Sending daily summary to admin...")
+        admin_id, services = await self.get_admin_services()
+        if not services:
+            return
+
+        # Se reconstruye la agenda del día (un events().list por silla) y queda en caché para /hoy y el agente
+        barbers = load_barbers()
+        agenda, per_barber = await self.agenda.async_get_combined(services, barbers, refresh=True)
+        if agenda:
+            message = f"☀️ ¡Buenos días!\n\n{agenda}"
+        else:
+            message = "⚠️ Buenos días. No pude cargar la agenda de hoy; prueba con /hoy en un rato."
+
+        await self.send_telegram_message(admin_id, message)
+
+        # Cada barbero con Telegram recibe solo su agenda
+        for barber in barbers:
+            text = per_barber.get(barber['calendar_id'])
+            if barber.get('telegram_id') and barber['telegram_id'] != str(admin_id) and text:
+                await self.send_telegram_message(barber['telegram_id'], f"☀️ ¡Buenos días, {barber['name']}!\n\n{text}")
+
+    async def send_telegram_message(self, chat_id, text):
+        try:
+            await self.bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+            logger.info(f"Notification sent to {chat_id}: {text[:30]}...")
+        except Exception as e:
+            logger.error(f"Error sending notification to {chat_id}: {e}")
@@ -0,0 +1,33 @@
+import time
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# SDKs que se importan de forma diferida en el camino de arranque (ver `python -m benchmarks.run --scenario cold_import`)
+HEAVY_MODULES = (
+    'google.generativeai',
+    'googleapiclient.discovery',
+    'supabase',
+)
+
+
+def warm_up(db, modules=HEAVY_MODULES):
+    """
+    Calentamiento en segundo plano tras arrancar el servidor: conecta (y migra) la BD
+    y precarga los SDKs pesados para que el primer mensaje no pague ese costo.
+    Bloqueante: ejecutar con asyncio.to_thread.
+    """
+    start = time.perf_counter()
+    db.connect()
+    db_seconds = time.perf_counter() - start
+    # Tras agregar una clave nueva al frente de CREDENTIALS_ENCRYPTION_KEYS, re-envolver lo guardado
+    db.rotate_credentials()
+
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Warm-up: no se pudo importar {name}: {e}")
+
+    logger.info(f"Warm-up completo en {time.perf_counter() - start:.2f}s (BD {db_seconds:.2f}s)")
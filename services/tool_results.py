@@ -0,0 +1,70 @@
+"""
+Proyección de los resultados de herramientas antes de devolvérselos a Gemini.
+
+Todo lo que devuelve una herramienta se serializa en el contexto del modelo y se
+vuelve a enviar en cada turno siguiente. Un evento de Calendar completo (o una lista
+de ellos) pesa mucho más que lo que el modelo necesita para responder, así que se
+reduce a registros mínimos: id, start, end, title, status.
+A los clientes nunca se les devuelven descripciones ni el 'Ref' (Telegram ID) de
+otras personas; el dueño conserva la descripción de cada cita.
+"""
+import json
+from services.metrics import TOOL_RESULT_BYTES
+
+
+def _when(value):
+    if isinstance(value, dict):
+        return value.get('dateTime') or value.get('date')
+    return value
+
+
+def _compact(record):
+    return {k: v for k, v in record.items() if v not in (None, '')}
+
+
+def project_event(event, customer=True):
+    """Evento de Calendar -> {'id', 'start', 'end', 'title', 'status'} (+ barber / description del dueño)."""
+    record = {
+        'id': event.get('id'), 'start': _when(event.get('start')), 'end': _when(event.get('end')),
+        'title': event.get('summary'), 'status': event.get('status'), 'barber': event.get('barber'),
+        'duplicate': event.get('duplicate'),
+    }
+    if not customer:
+        record['description'] = event.get('description')
+    return _compact(record)
+
+
+def project_appointment(appointment, customer=True):
+    """Fila del índice de citas -> mismo registro que un evento (el Telegram ID solo para el dueño)."""
+    record = {
+        'id': appointment.get('event_id'), 'start': appointment.get('start_time'), 'end': appointment.get('end_time'),
+        'title': appointment.get('summary'),
+    }
+    if not customer:
+        record['customer'] = appointment.get('telegram_id')
+    return _compact(record)
+
+
+def project(result, customer=True):
+    """Reduce recursivamente eventos y citas dentro de cualquier resultado; el resto pasa igual."""
+    if isinstance(result, list):
+        return [project(item, customer) for item in result]
+    if not isinstance(result, dict):
+        return result
+    if isinstance(result.get('start'), dict) and 'id' in result:
+        return project_event(result, customer)
+    if 'event_id' in result and 'start_time' in result:
+        return project_appointment(result, customer)
+    return {key: project(value, customer) for key, value in result.items()}
+
+
+def to_model(tool, result, customer=True):
+    """
+    Resultado listo para la FunctionResponse (JSON plano y proyectado).
+    Registra el tamaño antes y después de proyectar en barberbot_tool_result_bytes.
+    """
+    raw = json.dumps(result, default=str, ensure_ascii=False)
+    compact = project(json.loads(raw), customer)
+    TOOL_RESULT_BYTES.labels(tool=tool, stage='raw').observe(len(raw.encode()))
+    TOOL_RESULT_BYTES.labels(tool=tool, stage='projected').observe(len(json.dumps(compact, ensure_ascii=False).encode()))
+    return compact
@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import bisect
+import logging
+import datetime
+import threading
+from services.appointment_index import CALENDAR_TZ, to_local_dt
+from services.analytics_service import infer_service
+from services.metrics import WAITLIST_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Minutos que se le guarda el espacio al cliente antes de ofrecérselo al siguiente
+WAITLIST_HOLD_MINUTES = int(os.getenv('WAITLIST_HOLD_MINUTES', 15))
+
+TIME_FORMAT = '%H:%M'
+
+
+def make_slot(start, end):
+    """Espacio liberado a partir de ISO start/end (con o sin offset)."""
+    start_dt, end_dt = to_local_dt(start), to_local_dt(end)
+    return {
+        'start': start_dt.isoformat(), 'end': end_dt.isoformat(), 'day': start_dt.strftime('%Y-%m-%d'),
+        'from': start_dt.strftime(TIME_FORMAT), 'to': end_dt.strftime(TIME_FORMAT),
+    }
+
+
+def _hhmm(value, default):
+    value = (value or '').strip() or default
+    return datetime.datetime.strptime(value[:5], TIME_FORMAT).strftime(TIME_FORMAT)
+
+
+class WaitlistService:
+    """
+    Lista de espera con relleno automático de espacios liberados.
+
+    Las entradas en espera viven en la BD y en un índice en memoria por día, ordenado
+    por hora de inicio de la ventana que pidió el cliente: para un espacio liberado se
+    hace bisect sobre ese día y solo se revisan las ventanas que empiezan antes.
+    Cada día es una lista de tuplas (start_time, id, entrada): bisect sin key= (Python 3.9)
+    y el id, único, evita que se lleguen a comparar las entradas.
+    El mejor candidato (el que lleva más tiempo esperando) recibe la oferta por la
+    cola de salida y tiene WAITLIST_HOLD_MINUTES para responder sí/no; si no responde
+    o dice que no, se le ofrece al siguiente.
+    """
+
+    def __init__(self, db, outbox=None, hold_minutes=WAITLIST_HOLD_MINUTES):
+        self.db = db
+        self.outbox = outbox
+        self.hold_seconds = hold_minutes * 60
+        self._days = None  # day -> [(start_time, id, entrada)] ordenadas
+        self._offers = {}  # telegram_id -> {'entry', 'slot', 'expires_at', 'tried'}
+        self._lock = threading.RLock()
+
+    # --- Índice ---
+
+    def _index(self):
+        if self._days is None:
+            today = datetime.datetime.now(CALENDAR_TZ).strftime('%Y-%m-%d')
+            self._days = {}
+            for entry in self.db.get_waiting_entries(today):
+                self._insert(entry)
+        return self._days
+
+    def _insert(self, entry):
+        bisect.insort(self._days.setdefault(entry['day'], []), (entry['start_time'], entry['id'], entry))
+
+    def _remove(self, entry):
+        bucket = self._days.get(entry['day'], [])
+        bucket[:] = [item for item in bucket if item[1] != entry['id']]
+        if not bucket:
+            self._days.pop(entry['day'], None)
+
+    def _entries(self, day=None):
+        days = [self._index().get(day, [])] if day else self._index().values()
+        return [entry for bucket in days for _, _, entry in bucket]
+
+    def match(self, slot, exclude=()):
+        """Entrada en espera más antigua cuya ventana cubre el espacio (None si no hay)."""
+        with self._lock:
+            bucket = self._index().get(slot['day'], [])
+            # Solo las ventanas que empiezan a la hora del espacio o antes (los ids son hex: '~' va después)
+            candidates = [entry for _, _, entry in bucket[:bisect.bisect_right(bucket, (slot['from'], '~'))]]
+            offered = {o['entry']['id'] for o in self._offers.values()}
+            candidates = [e for e in candidates
+                          if e['end_time'] >= slot['to'] and e['id'] not in exclude and e['id'] not in offered
+                          and e['telegram_id'] not in self._offers]
+            return min(candidates, key=lambda e: e['created_at'], default=None)
+
+    # --- Clientes ---
+
+    def join(self, telegram_id, day, start_time='', end_time='', service='', name=''):
+        """Anota al cliente para un día (y opcionalmente una franja HH:MM-HH:MM)."""
+        entry = {
+            'id': uuid.uuid4().hex, 'telegram_id': str(telegram_id), 'name': name, 'service': service,
+            'day': datetime.date.fromisoformat(day).isoformat(),
+            'start_time': _hhmm(start_time, '00:00'), 'end_time': _hhmm(end_time, '23:59'),
+            'status': 'waiting', 'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        if entry['end_time'] <= entry['start_time']:
+            raise ValueError("end_time must be after start_time")
+        with self._lock:
+            # Una sola entrada activa por cliente y día: la nueva reemplaza a la anterior
+            for old in [e for e in self._entries(entry['day']) if e['telegram_id'] == entry['telegram_id']]:
+                self._remove(old)
+                self.db.update_waitlist_status(old['id'], 'cancelled')
+            if not self.db.save_waitlist_entry(entry):
+                return None
+            self._insert(entry)
+        WAITLIST_EVENTS.labels(event='joined').inc()
+        return entry
+
+    def leave(self, telegram_id):
+        telegram_id = str(telegram_id)
+        with self._lock:
+            entries = [e for e in self._entries() if e['telegram_id'] == telegram_id]
+            for entry in entries:
+                self._remove(entry)
+                self.db.update_waitlist_status(entry['id'], 'cancelled')
+            self._offers.pop(telegram_id, None)
+        return len(entries)
+
+    def get_entries(self, telegram_id):
+        telegram_id = str(telegram_id)
+        with self._lock:
+            return [dict(e) for e in self._entries() if e['telegram_id'] == telegram_id]
+
+    # --- Ofertas ---
+
+    def slot_freed(self, start, end):
+        """Un espacio quedó libre (cancelación): ofrecérselo al mejor candidato."""
+        try:
+            slot = make_slot(start, end)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Espacio liberado con fechas inválidas: {e}")
+            return None
+        if to_local_dt(slot['start']) <= datetime.datetime.now(CALENDAR_TZ):
+            return None
+        WAITLIST_EVENTS.labels(event='slot_freed').inc()
+        return self._offer(slot, tried=set())
+
+    def _offer(self, slot, tried):
+        with self._lock:
+            entry = self.match(slot, exclude=tried)
+            if entry is None:
+                return None
+            tried.add(entry['id'])
+            self._offers[entry['telegram_id']] = {
+                'entry': entry, 'slot': slot, 'expires_at': time.monotonic() + self.hold_seconds, 'tried': tried,
+            }
+        WAITLIST_EVENTS.labels(event='offered').inc()
+        day = datetime.date.fromisoformat(slot['day']).strftime('%d/%m')
+        service = f" ({entry['service']})" if entry['service'] else ''
+        if self.outbox:
+            self.outbox.send(entry['telegram_id'], (
+                f"🎉 ¡Se liberó un espacio! {day} a las {slot['from']}{service}.\n"
+                f"¿Lo quieres? Responde sí o no. Te lo guardo {self.hold_seconds // 60} minutos. 💈"
+            ))
+        return entry
+
+    def pending_offer(self, telegram_id):
+        offer = self._offers.get(str(telegram_id))
+        return offer if offer and time.monotonic() < offer['expires_at'] else None
+
+    def decline(self, telegram_id):
+        with self._lock:
+            offer = self._offers.pop(str(telegram_id), None)
+        if offer:
+            WAITLIST_EVENTS.labels(event='declined').inc()
+            self._offer(offer['slot'], offer['tried'])
+        return "¡Entendido! Sigues en la lista de espera por si sale otro espacio. 🙌"
+
+    def expire_offers(self):
+        """Ofertas sin respuesta dentro del tiempo de reserva: pasan al siguiente candidato."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [(user, o) for user, o in self._offers.items() if now >= o['expires_at']]
+            for user, _ in expired:
+                self._offers.pop(user, None)
+        for user, offer in expired:
+            WAITLIST_EVENTS.labels(event='expired').inc()
+            if self.outbox:
+                self.outbox.send(user, "⌛ Se acabó el tiempo para tomar el espacio que te ofrecimos. Sigues en la lista de espera.")
+            self._offer(offer['slot'], offer['tried'])
+        return len(expired)
+
+    def accept(self, agent, telegram_id):
+        """El cliente aceptó la oferta: agendar el espacio a su nombre."""
+        telegram_id = str(telegram_id)
+        with self._lock:
+            offer = self._offers.pop(telegram_id, None)
+        if not offer or time.monotonic() >= offer['expires_at']:
+            return "Esa oferta ya expiró. Sigues en la lista de espera. 🙏"
+        entry, slot = offer['entry'], offer['slot']
+
+        # Puede que alguien lo haya tomado mientras tanto (con varias sillas, basta una libre)
+        try:
+            barber = agent.free_barber(slot['start'], slot['end'])
+        except Exception as e:
+            logger.error(f"Error revisando disponibilidad para la lista de espera: {e}")
+            barber = {}
+        if barber is None:
+            # No se le pasa al siguiente: free_barber ya revisó todas las sillas y el espacio
+            # está ocupado. Si esa cita se cancela, delete_event/sync lo vuelven a liberar.
+            WAITLIST_EVENTS.labels(event='taken').inc()
+            return "Uy, alguien tomó ese espacio justo antes. Sigues en la lista de espera. 🙏"
+
+        service = infer_service(entry['service'])
+        service_name = service['nombre'] if service else (entry['service'] or "Cita")
+        event = agent.create_event(
+            summary=f"{service_name} - {entry['name']}".strip(' -'),
+            description=f"{service_name} (desde la lista de espera)",
+            start_time=slot['start'], end_time=slot['end'], barber=barber.get('name') or '',
+        ) if barber else None
+        if not isinstance(event, dict):
+            with self._lock:
+                self._offers[telegram_id] = offer
+            return "No pude agendar el espacio en este momento. Intenta responder de nuevo en un minuto. 🙏"
+
+        # En cola (Calendar caído) la registra BookingQueue.flush con el ID real del evento
+        if event.get('status') != 'queued':
+            agent.log_to_sheet(
+                nombre=entry['name'], servicio=service_name, precio=str(service['precio']) if service else '',
+                hora=f"{slot['from']}:00", estatus='agendado', dia=slot['day'], celular=telegram_id,
+                event_id=event.get('id') or ''
+            )
+        with self._lock:
+            self._remove(entry)
+        self.db.update_waitlist_status(entry['id'], 'booked')
+        WAITLIST_EVENTS.labels(event='booked').inc()
+        day = datetime.date.fromisoformat(slot['day']).strftime('%d/%m')
+        if event.get('status') == 'queued':
+            return f"🕒 Te guardé el {day} a las {slot['from']}. El calendario está lento; te confirmo en cuanto quede registrado."
+        return f"✅ ¡Listo! Quedaste agendado el {day} a las {slot['from']}. ¡Te esperamos! 💈"
@@ -0,0 +1,121 @@
+-- Tablas adicionales en Supabase (ejecutar en el SQL Editor del proyecto).
+-- Las tablas config, users y bot_info ya existen desde la configuración inicial.
+
+-- Índice de citas por cliente (telegram_id -> próximas citas)
+create table if not exists appointments (
+    event_id text primary key,
+    telegram_id text not null,
+    start_time text not null,  -- ISO UTC: YYYY-MM-DDTHH:MM:SSZ
+    end_time text,
+    summary text,
+    calendar_id text           -- calendario (silla/barbero) donde está la cita
+);
+create index if not exists idx_appointments_user on appointments (telegram_id, start_time);
+alter table appointments add column if not exists calendar_id text;
+
+-- Lista de espera (clientes que quieren un espacio que estaba ocupado)
+create table if not exists waitlist (
+    id text primary key,
+    telegram_id text not null,
+    name text,
+    service text,
+    day text not null,          -- YYYY-MM-DD (hora local de la barbería)
+    start_time text not null,   -- HH:MM
+    end_time text not null,     -- HH:MM
+    status text not null default 'waiting',  -- waiting | booked | cancelled
+    created_at text not null
+);
+create index if not exists idx_waitlist_day on waitlist (status, day);
+
+-- Citas recurrentes (cada N semanas); las instancias se crean como eventos normales
+create table if not exists recurrences (
+    id text primary key,
+    telegram_id text not null,
+    summary text,
+    description text,
+    first_start text not null,         -- ISO local: YYYY-MM-DDTHH:MM:SS
+    duration_minutes integer not null,
+    every_weeks integer not null,
+    next_start text not null,          -- siguiente instancia aún sin crear (ISO local)
+    skipped text not null default '',  -- días saltados, separados por coma (YYYY-MM-DD)
+    status text not null default 'active',  -- active | stopped
+    created_at text not null,
+    calendar_id text
+);
+alter table recurrences add column if not exists calendar_id text;
+create index if not exists idx_recurrences_status on recurrences (status, telegram_id);
+
+-- Claves de idempotencia de reservas (cliente + inicio + servicio); el event_id de Calendar sale de la clave
+create table if not exists booking_keys (
+    key text primary key,
+    telegram_id text,
+    event_id text not null,
+    calendar_id text,
+    generation integer not null default 0,  -- sube cuando la cita anterior con la misma clave se canceló
+    logged boolean not null default false,  -- ya se registró 'agendado' en Google Sheets
+    created_at text not null
+);
+create index if not exists idx_booking_keys_event on booking_keys (event_id);
+
+-- Reservas aceptadas mientras Google Calendar no respondía (se crean cuando vuelve).
+-- Aquí y en SQLite: sin disco persistente en Render, un redeploy empieza con SQLite vacío
+create table if not exists pending_bookings (
+    id text primary key,
+    telegram_id text,
+    calendar_id text not null,
+    summary text,
+    description text,
+    start_time text not null,
+    end_time text not null,
+    status text not null default 'pending',  -- pending | booked | failed
+    attempts integer not null default 0,
+    created_at text not null
+);
+create index if not exists idx_pending_bookings_status on pending_bookings (status, created_at);
+
+-- Mensajes de Telegram que la cola de salida no alcanzó a enviar al apagar; se reenvían al arrancar
+create table if not exists outbox (
+    id bigserial primary key,
+    chat_id text not null,
+    text text not null,
+    kwargs jsonb not null default '{}'::jsonb,
+    created_at timestamptz not null default now()
+);
+
+-- Registro de reservas que el reconciliador lleva a la hoja de Sheets (services/booking_ledger.py).
+-- Aquí y en SQLite, como pending_bookings: las entradas sin sincronizar sobreviven a un redeploy
+create table if not exists booking_ledger (
+    id text primary key,  -- event_id de Calendar (o 'local-...' si la fila no tiene evento)
+    event_id text,
+    telegram_id text,
+    calendar_id text,
+    nombre text,
+    servicio text,
+    precio text,
+    hora text,
+    estatus text,
+    dia text,
+    celular text,
+    origen text,
+    start_time text,
+    sheet_row integer,
+    synced integer not null default 0,
+    version integer not null default 0,  -- sube con cada cambio; marcar sincronizada exige la misma versión
+    updated_at text not null
+);
+create index if not exists idx_booking_ledger_event on booking_ledger (event_id);
+create index if not exists idx_booking_ledger_start on booking_ledger (start_time);
+
+-- Contexto del tenant en un solo round trip: admin, último bot_info y credenciales del admin
+-- (lo lee Database.get_tenant_context en cada mensaje; sin la vista se usan tres consultas)
+create or replace view tenant_context as
+select c.value as admin_id,
+       u.credentials_json,
+       b.owner_telegram_id, b.owner_name, b.owner_username, b.barberia_name,
+       b.owner_phone, b.owner_address, b.created_at
+from (select 1) as one
+left join config c on c.key = 'admin_id'
+left join users u on u.telegram_id = c.value
+left join lateral (select * from bot_info order by created_at desc limit 1) b on true;
+-- Incluye credenciales: solo la service key debe poder leerla
+revoke all on tenant_context from anon, authenticated;
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database import Database
+
+
+def use_local_db(path, monkeypatch):
+    """Database solo SQLite en `path` (sin Supabase aunque esté configurada en el entorno)."""
+    os.makedirs(path, exist_ok=True)
+    monkeypatch.setenv('DB_DIR', str(path))
+    monkeypatch.delenv('SUPABASE_URL', raising=False)
+    monkeypatch.delenv('SUPABASE_KEY', raising=False)
+    return Database()
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    return use_local_db(tmp_path, monkeypatch)
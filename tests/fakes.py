@@ -0,0 +1,179 @@
+import re
+import time
+import datetime
+import threading
+from services.appointment_index import CALENDAR_TZ, to_utc_iso
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+class FakeGoogle:
+    """
+    Calendar y Sheets en memoria con la interfaz de GoogleServices que usan los servicios.
+    events: lista (calendario 'primary') o {calendar_id: [eventos]}; rows: filas de la hoja.
+    """
+    calendar_service = object()
+
+    def __init__(self, events=None, rows=None):
+        self.events = events if isinstance(events, dict) else {'primary': list(events or [])}
+        self.rows = [list(r) for r in rows or []]
+        self.blocks = {}  # calendar_id -> [(inicio, fin)] ocupado en freeBusy que no es un evento (bloqueos)
+        self.down = False  # Calendar no responde (True) o solo esas llamadas ({'free_busy'})
+        self.fail_append = False  # Sheets no responde al append
+        self.insert_delay = 0  # ventana para que los envíos simultáneos se crucen
+        self.calls = []  # llamadas a Calendar
+        self.sheet_calls = []
+        self.inserts = 0
+        self._lock = threading.Lock()
+
+    def _calendar(self, call):
+        self.calls.append(call)
+        if self.down is True or call in (self.down or ()):
+            raise TimeoutError('calendar timeout')
+
+    # --- Calendar ---
+
+    def list_events(self, calendar_id, time_min, time_max):
+        self._calendar('list')
+        return [dict(e) for e in self.events.get(calendar_id, [])]
+
+    async def async_list_events(self, calendar_id, time_min, time_max):
+        return self.list_events(calendar_id, time_min, time_max)
+
+    def get_event(self, calendar_id, event_id):
+        self._calendar('get')
+        event = next((e for e in self.events.get(calendar_id, []) if e['id'] == event_id), None)
+        return dict(event) if event else None
+
+    def create_event(self, calendar_id, summary, description, start_time, end_time, event_id=None):
+        """Con event_id propio: si ya existe (aunque esté cancelado) se devuelve como duplicado (409)."""
+        self._calendar('create')
+        time.sleep(self.insert_delay)
+        with self._lock:
+            self.inserts += 1
+            events = self.events.setdefault(calendar_id, [])
+            existing = next((e for e in events if event_id and e['id'] == event_id), None)
+            if existing:
+                return {**existing, 'duplicate': True}
+            event = {'id': event_id or f"e{self.inserts}", 'status': 'confirmed', 'summary': summary,
+                     'description': description, 'start': {'dateTime': start_time}, 'end': {'dateTime': end_time}}
+            events.append(event)
+            return dict(event)
+
+    def batch_create_events(self, calendar_id, bodies):
+        self._calendar('batch')
+        created = []
+        for body in bodies:
+            start = datetime.datetime.fromisoformat(body['start']['dateTime']).replace(tzinfo=CALENDAR_TZ)
+            end = datetime.datetime.fromisoformat(body['end']['dateTime']).replace(tzinfo=CALENDAR_TZ)
+            with self._lock:
+                self.inserts += 1
+                event = {'id': f"e{self.inserts}", 'status': 'confirmed', 'summary': body['summary'],
+                         'description': body['description'], 'start': {'dateTime': start.isoformat()},
+                         'end': {'dateTime': end.isoformat()}}
+                self.events.setdefault(calendar_id, []).append(event)
+            created.append(dict(event))
+        return created
+
+    def delete_event(self, calendar_id, event_id):
+        self._calendar('delete')
+        events = self.events.get(calendar_id, [])
+        self.events[calendar_id] = [e for e in events if e['id'] != event_id]
+        return len(self.events[calendar_id]) < len(events)
+
+    def free_busy(self, calendar_ids, time_min, time_max):
+        """Eventos vivos con hora y bloqueos que se cruzan con [time_min, time_max), en UTC."""
+        self._calendar('free_busy')
+        busy = {}
+        for calendar_id in calendar_ids:
+            intervals = [(e['start']['dateTime'], e['end']['dateTime']) for e in self.events.get(calendar_id, [])
+                         if e.get('status') != 'cancelled' and e.get('start', {}).get('dateTime') and e.get('end')]
+            intervals += [(_iso(start), _iso(end)) for start, end in self.blocks.get(calendar_id, [])]
+            busy[calendar_id] = [{'start': to_utc_iso(start), 'end': to_utc_iso(end)} for start, end in intervals
+                                 if to_utc_iso(start) < time_max and time_min < to_utc_iso(end)]
+        return busy
+
+    # --- Sheets ---
+
+    def read_sheet(self, spreadsheet_id, range_name):
+        self.sheet_calls.append('read')
+        return [list(r) for r in self.rows]
+
+    def append_rows(self, spreadsheet_id, range_name, rows):
+        self.sheet_calls.append('append')
+        if self.fail_append:
+            raise ConnectionError('Sheets no responde')
+        first = len(self.rows) + 1
+        self.rows += [list(r) for r in rows]
+        return f"Hoja 1!A{first}:I{len(self.rows)}"
+
+    def batch_update_values(self, spreadsheet_id, data):
+        self.sheet_calls.append('batchUpdate')
+        for item in data:
+            self.rows[int(re.search(r"!A(\d+):", item['range']).group(1)) - 1] = list(item['values'][0])
+
+
+class MemoryTable:
+    """Lo mínimo de postgrest que usan las tablas replicadas en Supabase."""
+
+    def __init__(self, rows):
+        self.rows, self.filters, self.op, self.payload, self.window = rows, [], 'select', None, (0, None)
+
+    def select(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row[column] <= value)
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, row):
+        self.op, self.payload = 'upsert', row
+        return self
+
+    def update(self, values):
+        self.op, self.payload = 'update', values
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def execute(self):
+        if self.op == 'insert':
+            for row in self.payload:
+                self.rows.append({'id': len(self.rows) + 1, **row})
+        elif self.op == 'upsert':
+            self.rows[:] = [r for r in self.rows if r['id'] != self.payload['id']] + [dict(self.payload)]
+        matching = [r for r in self.rows if all(f(r) for f in self.filters)]
+        if self.op == 'update':
+            for row in matching:
+                row.update(self.payload)
+        elif self.op == 'delete':
+            self.rows[:] = [r for r in self.rows if r not in matching]
+        matching = matching[slice(*self.window)]
+        return type('Res', (), {'data': [dict(r) for r in matching]})()
+
+
+class MemorySupabase:
+    def __init__(self):
+        self.tables = {}
+
+    def table(self, name):
+        return MemoryTable(self.tables.setdefault(name, []))
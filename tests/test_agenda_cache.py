@@ -0,0 +1,46 @@
+import os
+import sys
+import asyncio
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.agenda_cache import AgendaCache, day_bounds, local_day
+from tests.fakes import FakeGoogle
+
+TODAY = local_day()
+
+
+def _event(event_id, hour, summary):
+    return {'id': event_id, 'summary': summary, 'start': {'dateTime': f"{TODAY.isoformat()}T{hour:02d}:00:00-05:00"}}
+
+
+def test_day_bounds_cover_local_day():
+    assert day_bounds(datetime.date(2026, 3, 10)) == ('2026-03-10T05:00:00Z', '2026-03-11T05:00:00Z')
+
+
+def test_agenda_is_built_once_and_updated_incrementally():
+    services = FakeGoogle([_event('b', 15, 'Corte y barba - Pedro'), _event('a', 9, 'Corte - Juan')])
+    agenda = AgendaCache(ttl=600)
+
+    text = agenda.get_text(services, 'primary')
+    assert text.index('09:00 - Corte - Juan') < text.index('15:00 - Corte y barba - Pedro')
+    assert agenda.get_text(services, 'primary') is text
+    assert services.calls == ['list']
+
+    agenda.apply_created(_event('c', 11, 'Afeitado - Ana'), 'primary')
+    agenda.apply_deleted('b')
+    text = agenda.get_text(services, 'primary')
+    assert '11:00 - Afeitado - Ana' in text and 'Pedro' not in text
+    assert '(2 citas)' in text
+    assert services.calls == ['list']
+
+
+def test_refresh_failure_serves_last_known_agenda():
+    services = FakeGoogle([_event('a', 9, 'Corte - Juan')])
+    agenda = AgendaCache(ttl=600)
+    assert 'Juan' in asyncio.run(agenda.async_get_text(services, 'primary'))
+
+    services.down = True
+    assert 'Juan' in asyncio.run(agenda.async_get_text(services, 'primary', refresh=True))
+    assert AgendaCache().get_text(services, 'primary') is None
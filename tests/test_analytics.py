@@ -0,0 +1,72 @@
+import os
+import sys
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.analytics_service import AnalyticsService, parse_price, parse_time, resolve_period
+from tests.fakes import FakeGoogle
+
+DAY = datetime.date(2026, 3, 10)
+
+
+def _row(nombre, servicio, precio, hora, estatus, dia, celular, event_id):
+    return [nombre, servicio, precio, hora, estatus, dia, celular, event_id, "Python-Bot"]
+
+
+def test_parsers():
+    assert parse_price('$17.000 COP') == 17000
+    assert parse_price('17.000,00') == 17000
+    assert parse_price(20000) == 20000
+    assert parse_price('') is None
+    assert parse_time('3:30 p. m.') == '15:30:00'
+    assert parse_time('09:00:00') == '09:00:00'
+    assert resolve_period('mes', today=DAY) == (datetime.date(2026, 3, 1), datetime.date(2026, 4, 1))
+    assert resolve_period('mes_pasado', today=DAY) == (datetime.date(2026, 2, 1), datetime.date(2026, 3, 1))
+    assert resolve_period(start_date='2026-03-02', end_date='2026-03-08', today=DAY) == \
+        (datetime.date(2026, 3, 2), datetime.date(2026, 3, 9))
+
+
+def test_summary_uses_final_status_per_booking(local_db):
+    analytics = AnalyticsService(local_db)
+    sheet = [
+        ['Nombre', 'Servicio', 'Precio', 'Hora', 'Estatus', 'Dia', 'Celular', 'ID', 'Origen'],
+        _row('Juan', 'Corte para caballero', 17000, '15:00:00', 'agendado', '2026-03-02', '42', 'e1'),
+        _row('Juan', 'Corte y barba', '$20.000', '16:00:00', 'agendado', '2026-03-09', '42', 'e2'),
+        _row('Pedro', 'Afeitado tradicional', '9000', '10:00:00', 'agendado', '2026-03-09', '7', 'e3'),
+        _row('Pedro', 'Afeitado tradicional', '9000', '10:00:00', 'eliminado', '2026-03-09', '7', 'e3'),
+        _row('Ana', 'Tinte y arreglo', '7000', '15:00:00', 'agendado', '2026-03-05', '9', 'e4'),
+        _row('Ana', 'Tinte y arreglo', '7000', '15:00:00', 'No asistió', '2026-03-05', '9', 'e4'),
+        _row('Luis', 'Corte para caballero', '17000', '11:00:00', 'agendado', '2026-02-20', '5', 'e5'),
+    ]
+    # Cita creada a mano en el calendario de la segunda silla, sin fila en Sheets
+    events = {'primary': [], 'chair2': [{'id': 'cal1', 'summary': 'Corte para caballero - Mario',
+                                         'start': {'dateTime': '2026-03-09T15:00:00-05:00'}}]}
+    assert analytics.sync(FakeGoogle(events, sheet), 'sheet', ['primary', 'chair2']) == 8
+
+    stats = analytics.summary(datetime.date(2026, 3, 1), datetime.date(2026, 4, 1))
+    assert stats['bookings'] == 3
+    assert stats['cancelled'] == 1
+    assert stats['no_shows'] == 1
+    assert stats['revenue'] == 17000 + 20000 + 17000
+    assert stats['by_service'][0] == {'servicio': 'Corte para caballero', 'citas': 2, 'ingresos': 34000}
+    assert stats['per_day'] == {'2026-03-02': 1, '2026-03-09': 2}
+    assert stats['peak_hours'][0] == {'hora': '15:00', 'citas': 2}
+    assert stats['top_customers'][0] == {'nombre': 'Juan', 'citas': 2, 'total': 37000}
+
+    # Una fila nueva invalida el DataFrame en caché
+    analytics.record(_row('Juan', 'Corte para caballero', '17000', '09:00:00', 'agendado', '2026-03-20', '42', 'e6'))
+    assert analytics.summary(datetime.date(2026, 3, 1), datetime.date(2026, 4, 1))['bookings'] == 4
+
+    report = analytics.report(start_date='2026-03-01', end_date='2026-03-31')
+    assert "Citas: 4" in report and "$71.000" in report and "Juan" in report
+
+
+def test_failed_sync_keeps_existing_log(local_db):
+    analytics = AnalyticsService(local_db)
+    analytics.record(_row('Juan', 'Corte para caballero', '17000', '15:00:00', 'agendado', '2026-03-02', '42', 'e1'))
+    services = FakeGoogle()
+    services.down = True
+
+    assert analytics.sync(services, 'sheet', ['primary']) is None
+    assert analytics.summary(datetime.date(2026, 3, 1), datetime.date(2026, 4, 1))['bookings'] == 1
@@ -0,0 +1,58 @@
+import os
+import sys
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.appointment_index import AppointmentIndex, to_utc_iso
+from tests.fakes import FakeGoogle
+
+
+def _event(event_id, ref, start):
+    return {
+        'id': event_id, 'summary': f"Corte - {event_id}",
+        'description': f"Corte\n\nRef: {ref}" if ref else "Bloqueo personal",
+        'start': {'dateTime': start}, 'end': {'dateTime': start},
+    }
+
+
+def _days_ahead(days, hour):
+    day = datetime.date.today() + datetime.timedelta(days=days)
+    return f"{day.isoformat()}T{hour:02d}:00:00-05:00"
+
+
+def test_to_utc_iso_assumes_calendar_timezone():
+    assert to_utc_iso('2099-01-01T10:00:00') == '2099-01-01T15:00:00Z'
+    assert to_utc_iso('2099-01-01T10:00:00-05:00') == '2099-01-01T15:00:00Z'
+
+
+def test_sync_backfills_and_tracks_creates_and_deletes(local_db):
+    index = AppointmentIndex(local_db)
+    services = FakeGoogle([
+        _event('a', '42', _days_ahead(2, 10)),
+        _event('b', '7', _days_ahead(1, 10)),
+        _event('c', None, _days_ahead(1, 12)),
+    ])
+    assert len(index.sync(services, 'primary')) == 2
+    assert index.db.get_config_value('appointments_backfilled')
+
+    index.record_created('42', _event('d', None, _days_ahead(1, 9)))
+    assert [a['event_id'] for a in index.get_upcoming('42')] == ['d', 'a']
+
+    index.record_deleted('d')
+    assert [a['event_id'] for a in index.get_upcoming('42')] == ['a']
+
+    # Una cancelación hecha directamente en el calendario desaparece en la siguiente sincronización
+    services.events['primary'] = services.events['primary'][1:]
+    index.sync(services, 'primary')
+    assert index.get_upcoming('42') == []
+    assert [a['event_id'] for a in index.get_upcoming('7')] == ['b']
+
+
+def test_sync_covers_every_chair_and_remembers_the_calendar(local_db):
+    index = AppointmentIndex(local_db)
+    services = FakeGoogle({'kevin': [_event('a', '42', _days_ahead(1, 10))],
+                              'juan': [_event('b', '42', _days_ahead(2, 10))]})
+    assert len(index.sync(services, ['kevin', 'juan'])) == 2
+    assert index.calendar_of('a') == 'kevin' and index.calendar_of('b') == 'juan'
+    assert index.calendar_of('missing') is None
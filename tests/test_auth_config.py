@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import pytest
+from urllib.parse import urlparse, parse_qs
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import auth_service
+from services.auth_service import OAuthConfigError, get_client_config, parse_client_config, resolve_redirect_uri
+
+
+@pytest.fixture(autouse=True)
+def reset_cache(monkeypatch):
+    monkeypatch.setattr(auth_service, '_client_config', None)
+    monkeypatch.setattr(auth_service, '_client_config_error', None)
+    monkeypatch.delenv('OAUTH_REDIRECT_URI', raising=False)
+    monkeypatch.delenv('RENDER_EXTERNAL_URL', raising=False)
+
+
+def test_redirect_uri_priority(monkeypatch):
+    assert resolve_redirect_uri() == 'http://localhost:8000/auth/callback'
+    monkeypatch.setenv('RENDER_EXTERNAL_URL', 'https://barber.onrender.com')
+    assert resolve_redirect_uri() == 'https://barber.onrender.com/auth/callback'
+    monkeypatch.setenv('OAUTH_REDIRECT_URI', 'https://custom/cb')
+    assert resolve_redirect_uri() == 'https://custom/cb'
+
+
+def test_config_is_loaded_once(monkeypatch):
+    monkeypatch.setenv('GOOGLE_CREDENTIALS_JSON', json.dumps({'web': {'client_id': 'id', 'client_secret': 'secret'}}))
+    config = get_client_config()
+    monkeypatch.setenv('GOOGLE_CREDENTIALS_JSON', '{broken')
+    assert get_client_config() is config
+
+    query = parse_qs(urlparse(config.authorization_url('42')).query)
+    assert query['state'] == ['42']
+    assert query['redirect_uri'] == ['http://localhost:8000/auth/callback']
+    assert query['access_type'] == ['offline']
+
+
+def test_invalid_config_fails_with_clear_error(monkeypatch):
+    with pytest.raises(OAuthConfigError, match='client_secret'):
+        parse_client_config({'installed': {'client_id': 'id'}}, 'http://x')
+
+    monkeypatch.setenv('GOOGLE_CREDENTIALS_JSON', '{broken')
+    monkeypatch.setattr(auth_service, 'CLIENT_SECRETS_FILE', '/nonexistent/credentials.json')
+    with pytest.raises(OAuthConfigError, match='GOOGLE_CREDENTIALS_JSON'):
+        get_client_config()
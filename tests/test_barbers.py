@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.appointment_index import CALENDAR_TZ
+from services.barbers import load_barbers, find_barber, pick_chair
+
+DAY = datetime.date(2026, 3, 10)
+BARBERS = [{'name': 'Kevin', 'calendar_id': 'kevin', 'telegram_id': '1'},
+           {'name': 'Juan', 'calendar_id': 'juan', 'telegram_id': None},
+           {'name': 'Pedro', 'calendar_id': 'pedro', 'telegram_id': None}]
+
+
+def _at(hour, minute=0):
+    return datetime.datetime.combine(DAY, datetime.time(hour, minute), tzinfo=CALENDAR_TZ)
+
+
+def _busy(*ranges):
+    return [{'start': _at(*s).isoformat(), 'end': _at(*e).isoformat()} for s, e in ranges]
+
+
+def test_load_barbers(monkeypatch):
+    monkeypatch.delenv('BARBERS', raising=False)
+    monkeypatch.setenv('GOOGLE_CALENDAR_ID', 'shop@group.calendar.google.com')
+    assert [b['calendar_id'] for b in load_barbers()] == ['shop@group.calendar.google.com']
+
+    monkeypatch.setenv('BARBERS', json.dumps([{'name': 'Kevin', 'calendar_id': 'primary', 'telegram_id': 1},
+                                              {'calendar_id': 'juan@group.calendar.google.com'}]))
+    barbers = load_barbers()
+    assert barbers[0] == {'name': 'Kevin', 'calendar_id': 'primary', 'telegram_id': '1'}
+    assert barbers[1]['name'] == 'juan@group.calendar.google.com'
+    assert find_barber(barbers, 'kevin')['calendar_id'] == 'primary'
+    assert find_barber(barbers, 'nadie') is None
+
+    monkeypatch.setenv('BARBERS', 'not json')
+    assert len(load_barbers()) == 1
+
+
+def test_pick_chair_minimizes_fragmentation():
+    busy = {
+        'kevin': _busy(((9, 0), (10, 0)), ((13, 0), (14, 0))),   # 10:00-11:00 deja hueco de 2h después
+        'juan': _busy(((9, 0), (10, 0)), ((11, 0), (12, 0))),    # 10:00-11:00 encaja exacto
+        'pedro': [],
+    }
+    assert pick_chair(BARBERS, busy, _at(10), _at(11))['name'] == 'Juan'
+    # Juan ocupado: entre Kevin y Pedro gana el que deja menos tiempo muerto
+    busy['juan'] = _busy(((10, 0), (11, 0)))
+    assert pick_chair(BARBERS, busy, _at(10), _at(11))['name'] == 'Kevin'
+    # Solo el barbero pedido
+    assert pick_chair([BARBERS[2]], busy, _at(10), _at(11))['name'] == 'Pedro'
+    # Nadie libre
+    busy['pedro'] = _busy(((10, 30), (11, 30)))
+    assert pick_chair(BARBERS[1:], busy, _at(10), _at(11)) is None
@@ -0,0 +1,27 @@
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.run import run_benchmarks, find_regressions, SCENARIOS
+
+
+def test_benchmark_smoke(tmp_path, monkeypatch):
+    # run_benchmarks prepara su propio entorno; monkeypatch lo restaura al terminar
+    for key in ('DB_DIR', 'SUPABASE_URL', 'SUPABASE_KEY', 'GEMINI_API_KEY', 'GOOGLE_SPREADSHEET_ID', 'GOOGLE_CALENDAR_ID'):
+        monkeypatch.setenv(key, os.environ.get(key, ''))
+    results = run_benchmarks(iterations=1)
+
+    for name in SCENARIOS:
+        assert results[name]['iterations'] == 1
+        assert results[name]['p95_ms'] > 0
+    assert results['_backend']['google_requests'] > 0
+    assert results['_backend']['gemini_round_trips'] > 0
+
+
+def test_find_regressions():
+    baseline = {'database': {'p95_ms': 1.0}, 'check_reminders': {'p95_ms': 10.0}}
+    results = {'database': {'p95_ms': 1.2}, 'check_reminders': {'p95_ms': 20.0}, '_backend': {}}
+    regressions = find_regressions(results, baseline, tolerance=0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('check_reminders')
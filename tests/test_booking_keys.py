@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.booking_keys import BookingKeys, booking_key
+from tests.fakes import FakeGoogle
+
+START, END = '2026-03-10T10:00:00', '2026-03-10T10:45:00'
+
+
+def _calendar():
+    calendar = FakeGoogle()
+    calendar.insert_delay = 0.01  # ventana para que los envíos simultáneos se crucen
+    return calendar
+
+
+def _submit_concurrently(instances, calendar, times=6):
+    results = []
+
+    def submit(keys):
+        results.append(keys.create_once(calendar, 'primary', '42', 'Corte - Juan', 'Corte', START, END))
+    threads = [threading.Thread(target=submit, args=(instances[i % len(instances)],)) for i in range(times)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_key_ignores_customer_name_and_time_format():
+    assert booking_key('42', START, 'Corte - Juan') == booking_key('42', f"{START}-05:00", 'corte - Juan Pablo')
+    assert booking_key('42', START, 'Corte - Juan') != booking_key('43', START, 'Corte - Juan')
+    assert len(booking_key('42', START, 'Corte - Juan')) == 32
+
+
+def test_duplicate_submits_create_a_single_event(local_db):
+    keys = BookingKeys(local_db)
+    calendar = _calendar()
+
+    # Mismo proceso: el lock por clave deja pasar un solo insert
+    results = _submit_concurrently([keys], calendar)
+    assert len(calendar.events['primary']) == 1 and calendar.inserts == 1
+    assert {event['id'] for event, _ in results} == {e['id'] for e in calendar.events['primary']}
+    assert sorted(duplicate for _, duplicate in results) == [False] + [True] * 5
+
+    # Solo el primer registro en Sheets pasa
+    event_id = results[0][0]['id']
+    assert keys.first_log(event_id) is True
+    assert keys.first_log(event_id) is False
+    assert keys.first_log('manual-event') is True
+
+
+def test_concurrent_workers_rely_on_calendar_ids(local_db):
+    # Dos "procesos" (locks distintos): Calendar rechaza el segundo insert con el mismo ID
+    keys = BookingKeys(local_db)
+    calendar = _calendar()
+    results = _submit_concurrently([keys, BookingKeys(keys.db)], calendar, times=2)
+    assert len(calendar.events['primary']) == 1
+    assert len({event['id'] for event, _ in results}) == 1
+
+
+def test_rebooking_after_cancellation_uses_next_generation(local_db):
+    keys = BookingKeys(local_db)
+    calendar = _calendar()
+    first, _ = keys.create_once(calendar, 'primary', '42', 'Corte - Juan', 'Corte', START, END)
+    calendar.events['primary'][0]['status'] = 'cancelled'
+
+    second, duplicate = keys.create_once(calendar, 'primary', '42', 'Corte - Juan', 'Corte', START, END)
+    assert not duplicate
+    assert second['id'] == f"{first['id']}1"
+    assert keys.db.get_booking_key(first['id'])['generation'] == 1
+
+
+def test_repeated_booking_with_several_chairs_returns_the_existing_event(local_db):
+    from agent import BarberAgent
+
+    # 10:00-10:45: la cita creada ocupa su silla, y Luis tiene un bloqueo personal
+    calendar = _calendar()
+    calendar.blocks['luis'] = [(START, END)]
+    agent = BarberAgent.__new__(BarberAgent)
+    agent.services, agent.booking_keys, agent.current_user_id = calendar, BookingKeys(local_db), '42'
+    agent.barbers = [{'name': 'Kevin', 'calendar_id': 'kevin'}, {'name': 'Luis', 'calendar_id': 'luis'}]
+    agent.CALENDAR_ID = 'kevin'
+    agent.appointment_index = agent.agenda = agent.ledger = agent.notify_admin_callback = None
+    agent.is_admin, agent._writes = True, 0
+
+    first = agent.create_event('Corte - Juan', 'Corte', START, END)
+    again = agent.create_event('Corte - Juan', 'Corte', START, END)
+    assert again['duplicate'] and again['id'] == first['id']
+    assert calendar.inserts == 1 and sum(len(e) for e in calendar.events.values()) == 1
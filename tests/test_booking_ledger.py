@@ -0,0 +1,118 @@
+import os
+import sys
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.booking_ledger import BookingLedger
+from services.appointment_index import CALENDAR_TZ
+from tests.conftest import use_local_db
+from tests.fakes import FakeGoogle, MemorySupabase
+
+SHEET = 'sheet-id'
+DAY = (datetime.datetime.now(CALENDAR_TZ) + datetime.timedelta(days=2)).date().isoformat()
+
+
+def _event(event_id, hour, summary='Corte para caballero - Juan', ref='42'):
+    return {'id': event_id, 'summary': summary, 'description': f"Ref: {ref}",
+            'start': {'dateTime': f"{DAY}T{hour:02d}:00:00-05:00"}, 'end': {'dateTime': f"{DAY}T{hour:02d}:45:00-05:00"}}
+
+
+def test_writes_are_local_and_pushed_in_one_batch(local_db):
+    ledger = BookingLedger(local_db)
+    services = FakeGoogle(rows=[['Nombre', 'Servicio', 'Precio', 'Hora', 'Estatus', 'Dia', 'Celular', 'ID', 'Origen']])
+
+    ledger.record_created(_event('evt1', 10), '42', 'primary')
+    # log_to_sheet completa lo que el evento no trae (precio, nombre)
+    ledger.record_values(['Juan Pérez', 'Corte para caballero', '17000', '10:00:00', 'agendado', DAY, '42', 'evt1', 'Python-Bot'])
+    ledger.record_created(_event('evt2', 11, 'Barba - Ana', '43'), '43', 'primary')
+    assert ledger.pending() == 2 and services.sheet_calls == []
+
+    report = ledger.reconcile(services, SHEET, [], check_calendar=False)
+    assert report == {'calendar_fixes': 0, 'appended': 2, 'updated': 0, 'pending': 0}
+    assert services.sheet_calls == ['read', 'append']
+    assert services.rows[1][:3] == ['Juan Pérez', 'Corte para caballero', '17000']
+    assert services.rows[2][7] == 'evt2'
+
+    # Sin cambios no hay escrituras; la cancelación corrige la misma fila
+    ledger.record_deleted('evt1')
+    services.sheet_calls.clear()
+    ledger.reconcile(services, SHEET, [], check_calendar=False)
+    assert services.sheet_calls == ['read', 'batchUpdate']
+    assert services.rows[1][4] == 'eliminado' and len(services.rows) == 3
+
+
+def test_failed_push_is_retried_not_lost(local_db):
+    ledger = BookingLedger(local_db)
+    services = FakeGoogle()
+    ledger.record_created(_event('evt1', 10), '42', 'primary')
+
+    services.fail_append = True
+    assert ledger.reconcile(services, SHEET, [], check_calendar=False)['pending'] == 1
+    services.fail_append = False
+    assert ledger.reconcile(services, SHEET, [], check_calendar=False)['appended'] == 1
+    assert len(services.rows) == 1
+
+
+def test_reconciler_follows_calendar_and_fixes_the_sheet(local_db):
+    ledger = BookingLedger(local_db)
+    legacy = ['Pedro', 'Barba', '12000', '09:00:00', 'agendado', DAY, '44', 'evt-old', 'Python-Bot']
+    services = FakeGoogle(rows=[legacy], events=[_event('evt1', 15), _event('manual', 17, 'Corte - Luis', '45')])
+    ledger.record_created(_event('evt1', 10), '42', 'primary')
+    ledger.reconcile(services, SHEET, [], check_calendar=False)
+    # Alguien editó la hoja a mano
+    services.rows[1][4] = 'no asistió?'
+    services.sheet_calls.clear()
+
+    report = ledger.reconcile(services, SHEET, ['primary'])
+    # evt1 se movió a las 15:00, evt-old ya no está en Calendar y 'manual' se creó a mano
+    assert report['calendar_fixes'] == 3
+    assert services.sheet_calls == ['read', 'batchUpdate', 'append']
+    by_id = {row[7]: row for row in services.rows}
+    assert by_id['evt1'][3:5] == ['15:00:00', 'actualizado']
+    assert by_id['evt-old'][:4] == legacy[:4] and by_id['evt-old'][4] == 'eliminado'
+    assert by_id['manual'][0] == 'Luis' and by_id['manual'][8] == 'Calendar'
+    assert ledger.reconcile(services, SHEET, ['primary'])['calendar_fixes'] == 0
+
+
+def test_first_reconcile_keeps_existing_sheet_rows(local_db):
+    # Redeploy sin disco: registro vacío, la hoja ya tiene la cita con los datos del cliente
+    ledger = BookingLedger(local_db)
+    row = ['Juan Pérez', 'Corte para caballero', '17000', '10:00:00', 'agendado', DAY, '3001234567', 'evt1', 'Python-Bot']
+    lunch = {'id': 'lunch', 'summary': 'Almuerzo', 'description': '',
+             'start': {'dateTime': f"{DAY}T13:00:00-05:00"}, 'end': {'dateTime': f"{DAY}T14:00:00-05:00"}}
+    services = FakeGoogle(rows=[row], events=[_event('evt1', 10), lunch])
+
+    report = ledger.reconcile(services, SHEET, ['primary'])
+    assert report == {'calendar_fixes': 0, 'appended': 0, 'updated': 0, 'pending': 0}
+    assert services.sheet_calls == ['read']
+    assert services.rows == [row]
+    assert ledger.db.get_ledger_entry('lunch') is None
+
+    # Una cita tomada de Calendar antes de ver su fila tampoco pisa los datos de la hoja
+    ledger.record_created(_event('evt2', 11, 'Corte para caballero - Ana', '43'), calendar_id='primary', origen='Calendar')
+    services.rows.append(['Ana María', 'Corte para caballero', '17000', '11:00:00', 'agendado', DAY, '3110000000', 'evt2', 'Python-Bot'])
+    services.events['primary'].append(_event('evt2', 11, 'Corte para caballero - Ana', '43'))
+    services.sheet_calls.clear()
+    ledger.reconcile(services, SHEET, ['primary'])
+    assert services.sheet_calls == ['read'] and services.rows[1][0] == 'Ana María'
+
+
+def test_unsynced_entries_survive_a_redeploy_without_disk(tmp_path, monkeypatch):
+    supabase = MemorySupabase()
+    db = use_local_db(tmp_path / 'deploy1', monkeypatch)
+    db._supabase = supabase
+    ledger = BookingLedger(db)
+    services = FakeGoogle()
+    ledger.record_created(_event('evt1', 10), '42', 'primary')
+    ledger.reconcile(services, SHEET, [], check_calendar=False)
+    ledger.record_values(['Ana', 'Barba', '12000', '11:00:00', 'agendado', DAY, '43', 'evt2', 'Python-Bot'])
+
+    # Nuevo deploy: SQLite vacío, misma Supabase; evt1 ya tiene fila y evt2 sigue pendiente
+    fresh = use_local_db(tmp_path / 'deploy2', monkeypatch)
+    fresh._supabase = supabase
+    ledger = BookingLedger(fresh)
+    assert fresh.get_ledger_entry('evt1')['sheet_row'] == 1 and ledger.pending() == 1
+
+    assert ledger.reconcile(services, SHEET, [], check_calendar=False)['appended'] == 1
+    assert [row[7] for row in services.rows] == ['evt1', 'evt2']
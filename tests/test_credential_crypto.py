@@ -0,0 +1,82 @@
+import os
+import sys
+import sqlite3
+from cryptography.fernet import Fernet
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import credential_crypto
+from services.credential_crypto import CredentialCipher, CredentialsKeyError
+
+CREDS = {'token': 't', 'refresh_token': 'secreto-refresh', 'client_secret': 'secreto-cliente'}
+
+
+def test_envelope_round_trip_and_cache(monkeypatch):
+    cipher = CredentialCipher([Fernet.generate_key()])
+    stored = cipher.encrypt(CREDS)
+    assert stored.startswith('enc:v1:') and 'secreto' not in stored
+    # Cada registro lleva su propia clave de datos
+    assert cipher.encrypt(CREDS) != stored
+
+    assert cipher.decrypt(stored) == CREDS
+    calls = []
+    monkeypatch.setattr(credential_crypto.Fernet, 'decrypt', lambda *a, **k: calls.append(a))
+    assert cipher.decrypt(stored) == CREDS and calls == []
+    # Texto plano heredado se sigue leyendo
+    assert cipher.decrypt('{"token": "x"}') == {'token': 'x'}
+
+
+def test_rotation_rewraps_only_the_data_key():
+    old, new = Fernet.generate_key(), Fernet.generate_key()
+    stored = CredentialCipher([old]).encrypt(CREDS)
+
+    rotating = CredentialCipher([new, old])
+    assert rotating.needs_rewrap(stored) and rotating.needs_rewrap('{"token": "x"}')
+    rewrapped = rotating.rewrap(stored)
+    assert rewrapped.rsplit(':', 1)[1] == stored.rsplit(':', 1)[1]
+    assert not rotating.needs_rewrap(rewrapped)
+    assert CredentialCipher([new]).decrypt(rewrapped) == CREDS
+
+    try:
+        CredentialCipher([Fernet.generate_key()]).decrypt(stored)
+        assert False, "una clave ajena no debe descifrar"
+    except CredentialsKeyError:
+        pass
+
+
+def test_database_stores_ciphertext_and_rotates(local_db, monkeypatch):
+    old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([old]))
+    db = local_db
+    db.save_user_credentials('42', CREDS)
+
+    def raw():
+        with sqlite3.connect(db.sqlite_db) as conn:
+            return conn.execute('SELECT credentials_json FROM users WHERE telegram_id = ?', ('42',)).fetchone()[0]
+
+    assert 'secreto' not in raw()
+    assert db.get_user_credentials('42') == CREDS
+
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([new, old]))
+    assert db.rotate_credentials() == 1 and db.rotate_credentials() == 0
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([new]))
+    assert db.get_user_credentials('42') == CREDS
+
+
+def test_rotation_skips_unreadable_rows(local_db, monkeypatch):
+    old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([old]))
+    db = local_db
+    db.save_user_credentials('1', {'token': 'huerfano'})
+    db.save_user_credentials('2', CREDS)
+    with sqlite3.connect(db.sqlite_db) as conn:
+        # '1' quedó con una clave que ya no está configurada; '3' es un registro truncado
+        conn.execute("UPDATE users SET credentials_json = ? WHERE telegram_id = '1'",
+                     (CredentialCipher([Fernet.generate_key()]).encrypt({'token': 'x'}),))
+        conn.execute("INSERT INTO users (telegram_id, credentials_json) VALUES ('3', 'enc:v1:truncado')")
+
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([new, old]))
+    assert db.rotate_credentials() == 1
+    monkeypatch.setattr(credential_crypto, '_default', CredentialCipher([new]))
+    assert db.get_user_credentials('2') == CREDS
+    assert db.get_user_credentials('3') is None
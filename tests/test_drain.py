@@ -0,0 +1,119 @@
+import os
+import sys
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.drain import InFlight
+from services.outbox import Outbox
+from tests.conftest import use_local_db
+from tests.fakes import MemorySupabase
+
+
+class SlowBot:
+    """Bot cuyo primer envío nunca termina (simula Telegram lento durante el apagado)."""
+
+    def __init__(self, hang_first=False):
+        self.sent = []
+        self.hang_first = hang_first
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.hang_first:
+            self.hang_first = False
+            await asyncio.sleep(3600)
+        self.sent.append((chat_id, text, kwargs))
+
+
+def test_unsent_messages_survive_a_restart(local_db):
+    db = local_db
+
+    async def shutdown():
+        outbox = Outbox(db, rate=0)
+        outbox.start(SlowBot(hang_first=True))
+        for i in range(3):
+            outbox.send('1', f"mensaje {i}", parse_mode='Markdown')
+        await asyncio.sleep(0.05)
+        return await outbox.stop(timeout=0.1)
+
+    # El mensaje en curso también se guarda (al menos una vez)
+    assert asyncio.run(shutdown()) == {'messages_sent': 0, 'messages_persisted': 3}
+
+    async def restart():
+        bot = SlowBot()
+        outbox = Outbox(db, rate=0)
+        outbox.start(bot)
+        report = await outbox.stop(timeout=1)
+        return bot.sent, report
+
+    sent, report = asyncio.run(restart())
+    assert [text for _, text, _ in sent] == ['mensaje 0', 'mensaje 1', 'mensaje 2']
+    assert sent[0][2] == {'parse_mode': 'Markdown'}
+    assert report == {'messages_sent': 3, 'messages_persisted': 0}
+    assert db.take_outbox_messages() == []
+
+
+def test_redeploy_without_disk_keeps_messages_and_queued_bookings(tmp_path, monkeypatch):
+    supabase = MemorySupabase()
+    db = use_local_db(tmp_path / 'deploy1', monkeypatch)
+    db._supabase = supabase
+    booking = {'id': 'b1', 'telegram_id': '1', 'calendar_id': 'primary', 'summary': 'Corte - Juan', 'description': '',
+               'start_time': '2026-03-10T10:00:00', 'end_time': '2026-03-10T10:45:00', 'status': 'pending',
+               'attempts': 0, 'created_at': '2026-03-09T12:00:00+00:00'}
+    assert db.save_pending_booking(booking)
+
+    async def shutdown():
+        outbox = Outbox(db, rate=0)
+        outbox.start(SlowBot(hang_first=True))
+        outbox.send('1', "mensaje")
+        await asyncio.sleep(0.05)
+        return await outbox.stop(timeout=0.1)
+
+    assert asyncio.run(shutdown())['messages_persisted'] == 1
+
+    # Nuevo deploy: SQLite vacío, misma Supabase
+    fresh = use_local_db(tmp_path / 'deploy2', monkeypatch)
+    fresh._supabase = supabase
+    assert [b['id'] for b in fresh.get_pending_bookings()] == ['b1']
+    assert fresh.take_outbox_messages() == [('1', "mensaje", {})]
+    assert fresh.take_outbox_messages() == []
+
+    # Lo último que escribió este proceso manda sobre la copia de Supabase
+    fresh.save_pending_booking({**booking, 'status': 'booked'})
+    assert fresh.get_pending_bookings() == []
+
+
+def test_messages_sent_after_stop_are_kept_for_the_next_start(local_db):
+    async def shutdown():
+        outbox = Outbox(local_db, rate=0)
+        outbox.start(SlowBot())
+        report = await outbox.stop(timeout=1)
+        # send() de otro hilo que se programó antes de stop() y llega cuando el worker ya no existe
+        outbox._loop.call_soon_threadsafe(outbox._enqueue, ('1', "tardío desde un hilo", {}, 1))
+        await asyncio.sleep(0)
+        assert outbox.send('2', "tardío")
+        return report
+
+    assert asyncio.run(shutdown())['messages_persisted'] == 0
+    assert sorted(local_db.take_outbox_messages()) == [('1', "tardío desde un hilo", {}), ('2', "tardío", {})]
+
+
+def test_in_flight_turns_are_awaited_until_deadline():
+    turns = InFlight()
+
+    async def turn(seconds):
+        async with turns.track():
+            await asyncio.sleep(seconds)
+
+    async def scenario():
+        fast = asyncio.create_task(turn(0.05))
+        await asyncio.sleep(0)
+        assert turns.active == 1
+        assert await turns.wait_idle(1)
+        await fast
+        slow = asyncio.create_task(turn(10))
+        await asyncio.sleep(0)
+        assert not await turns.wait_idle(0.1)
+        slow.cancel()
+
+    asyncio.run(scenario())
+    assert turns.active == 0
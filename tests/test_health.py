@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import resilience
+from services.health import HealthMonitor, credentials_probe
+
+
+def test_probes_are_cached_and_hung_probes_not_stacked():
+    calls = {'db': 0, 'slow': 0}
+    release = threading.Event()
+
+    def db_probe():
+        calls['db'] += 1
+        return 'ok'
+
+    def slow_probe():
+        calls['slow'] += 1
+        release.wait(5)
+        return 'ok'
+
+    def broken_probe():
+        raise ConnectionError('supabase caído')
+
+    monitor = HealthMonitor({'sqlite': db_probe, 'supabase': broken_probe, 'google': slow_probe}, timeout=0.05)
+
+    async def scenario():
+        await monitor.probe_once()
+        await monitor.probe_once()
+        release.set()
+
+    asyncio.run(scenario())
+    assert calls == {'db': 2, 'slow': 1}
+    assert {name: r['status'] for name, r in monitor.results.items()} == {
+        'sqlite': 'ok', 'supabase': 'error', 'google': 'timeout'}
+
+    # Los endpoints leen la caché: no vuelven a ejecutar las sondas
+    for _ in range(10):
+        monitor.readiness('polling', 'running')
+    assert calls['db'] == 2
+
+
+def test_readiness_distinguishes_not_ready_and_degraded(monkeypatch):
+    monkeypatch.setattr(resilience, '_breakers', {})
+    monitor = HealthMonitor({'sqlite': None, 'supabase': None})
+    monitor.results = {'sqlite': {'status': 'ok'}, 'supabase': {'status': 'disabled'}}
+
+    assert monitor.readiness('polling', 'running') == (True, {
+        'status': 'ready', 'bot': 'polling', 'scheduler': 'running',
+        'dependencies': monitor.results, 'circuits': {}})
+    assert not monitor.readiness('failed', 'not_started')[0]
+
+    resilience.breaker('calendar')._opened_at = time.monotonic()
+    ready, report = monitor.readiness('polling', 'running')
+    assert ready and report['status'] == 'degraded' and report['circuits'] == {'calendar': 'open'}
+
+    monitor.results['sqlite'] = {'status': 'error'}
+    assert monitor.readiness('polling', 'running')[1]['status'] == 'not_ready'
+
+
+def test_database_and_credential_probes(local_db):
+    db = local_db
+    assert db.ping_sqlite() == 'ok' and db.ping_supabase() == 'disabled'
+
+    probe = credentials_probe(db)
+    assert probe() == 'no_admin'
+    db.set_admin_id('42')
+    assert probe() == 'missing'
+    db.save_user_credentials('42', {'token': 't', 'refresh_token': 'r'})
+    assert probe() == 'ok'
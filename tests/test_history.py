@@ -0,0 +1,90 @@
+import os
+import sys
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.history_service import ConversationHistory, SUMMARY_HEADER, split_turns
+
+
+def _booking_turn(i):
+    start = f"2099-01-{i + 1:02d}T10:00:00"
+    return [
+        {'role': 'user', 'parts': [{'text': f"Quiero cita el día {i + 1}"}]},
+        {'role': 'model', 'parts': [
+            {'function_call': {'name': 'create_event', 'args': {'summary': 'Corte - Juan', 'start_time': start}}},
+        ]},
+        {'role': 'user', 'parts': [
+            {'function_response': {'name': 'create_event', 'response': {'result': {'id': f"evt{i}"}}}},
+        ]},
+        {'role': 'model', 'parts': [
+            {'function_call': {'name': 'log_to_sheet', 'args': {'nombre': 'Juan', 'servicio': 'Corte para caballero', 'estatus': 'agendado', 'event_id': f"evt{i}"}}},
+        ]},
+        {'role': 'user', 'parts': [
+            {'function_response': {'name': 'log_to_sheet', 'response': {'result': {}}}},
+        ]},
+        {'role': 'model', 'parts': [{'text': "¡Listo! Ya quedó tu cita."}]},
+    ]
+
+
+def test_history_keeps_last_turns_and_summarizes_facts():
+    history = ConversationHistory(keep_turns=2, max_tokens=100000)
+    turns = [c for i in range(5) for c in _booking_turn(i)]
+    history.save("customer_1", turns)
+
+    restored = history.get("customer_1")
+    assert restored[0]['parts'][0]['text'].startswith(SUMMARY_HEADER)
+    summary = restored[0]['parts'][0]['text']
+    assert "Juan" in summary
+    assert "Corte para caballero" in summary
+    assert "2099-01-01T10:00:00" in summary
+    # Resumen (2 mensajes) + los 2 últimos turnos literales
+    assert len(split_turns(restored[2:])) == 2
+
+
+def test_history_round_trip_does_not_duplicate_summary():
+    history = ConversationHistory(keep_turns=1, max_tokens=100000)
+    history.save("customer_1", [c for i in range(3) for c in _booking_turn(i)])
+    restored = history.get("customer_1")
+    history.save("customer_1", restored + _booking_turn(3))
+
+    again = history.get("customer_1")
+    headers = [c for c in again if c['parts'][0].get('text', '').startswith(SUMMARY_HEADER)]
+    assert len(headers) == 1
+    assert "2099-01-03T10:00:00" in headers[0]['parts'][0]['text']
+
+
+def test_history_token_cap_keeps_latest_turn():
+    history = ConversationHistory(keep_turns=10, max_tokens=50)
+    history.save("admin_1", [c for i in range(4) for c in _booking_turn(i)])
+    restored = history.get("admin_1")
+    turns = split_turns(restored[2:])
+    assert len(turns) == 1
+    assert turns[0][0]['parts'][0]['text'] == "Quiero cita el día 4"
+
+
+@pytest.mark.parametrize('tool, event_id', [('delete_event', 'evt0'), ('cancel_my_appointment', 'evt0'),
+                                            ('cancel_my_appointment', '')])
+def test_cancelled_booking_is_dropped_from_summary(tool, event_id):
+    history = ConversationHistory(keep_turns=1, max_tokens=100000)
+    cancel_turn = [
+        {'role': 'user', 'parts': [{'text': "Cancela mi cita"}]},
+        {'role': 'model', 'parts': [{'function_call': {'name': tool, 'args': {'event_id': event_id}}}]},
+        {'role': 'user', 'parts': [{'function_response': {'name': tool, 'response': {'result': True}}}]},
+        {'role': 'model', 'parts': [{'text': "Cita cancelada."}]},
+    ]
+    history.save("customer_1", _booking_turn(0) + cancel_turn + [{'role': 'user', 'parts': [{'text': "Gracias"}]}])
+    summary = history.get("customer_1")[0]['parts'][0]['text']
+    assert "2099-01-01" not in summary
+
+
+def test_history_forgets_least_recently_used_sessions():
+    history = ConversationHistory(keep_turns=1, max_tokens=100000, max_sessions=2)
+    history.save("customer_1", _booking_turn(0) + _booking_turn(1))
+    history.append_exchange("customer_2", "Hola", "¡Hola!")
+    history.get("customer_1")
+    history.append_exchange("customer_3", "Hola", "¡Hola!")
+
+    assert history.get("customer_2") == []
+    assert history.get("customer_1") and history.get("customer_3")
+    assert set(history._facts) <= {"customer_1", "customer_3"}
@@ -0,0 +1,103 @@
+import os
+import sys
+import asyncio
+import httpx
+from google.oauth2.credentials import Credentials
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import http_client
+from google_services import GoogleServices
+
+
+def _use_transport(monkeypatch, handler):
+    monkeypatch.setattr(http_client, '_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(http_client, 'HTTP_BACKOFF_BASE', 0)
+
+
+def test_request_retries_idempotent_calls(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503 if len(calls) < 3 else 200, json={})
+
+    _use_transport(monkeypatch, handler)
+    response = asyncio.run(http_client.request('GET', 'https://example.com'))
+    assert response.status_code == 200
+    assert calls == ['GET'] * 3
+
+
+def test_request_does_not_retry_post_by_default(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503)
+
+    _use_transport(monkeypatch, handler)
+    response = asyncio.run(http_client.request('POST', 'https://example.com'))
+    assert response.status_code == 503
+    assert calls == ['POST']
+
+
+def test_async_calendar_calls(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.url.path, request.headers['Authorization']))
+        return httpx.Response(200, json={'items': [{'id': 'evt1'}]})
+
+    _use_transport(monkeypatch, handler)
+    services = GoogleServices(credentials_object=Credentials(token='test-token'))
+
+    events = asyncio.run(services.async_check_availability('barber@group.calendar.google.com', 'a', 'b'))
+    assert events == [{'id': 'evt1'}]
+    assert seen[0] == ('GET', '/calendar/v3/calendars/barber@group.calendar.google.com/events', 'Bearer test-token')
+
+
+def test_async_availability_survives_refresh_errors(monkeypatch):
+    from google.auth.exceptions import RefreshError
+
+    class RevokedCredentials(Credentials):
+        def refresh(self, request):
+            raise RefreshError('invalid_grant: Token has been expired or revoked.')
+
+    _use_transport(monkeypatch, lambda request: httpx.Response(200, json={'items': []}))
+    services = GoogleServices(credentials_object=RevokedCredentials(token=None, refresh_token='r', client_id='c',
+                                                                    client_secret='s', token_uri='https://oauth2.googleapis.com/token'))
+    assert asyncio.run(services.async_check_availability('primary', 'a', 'b')) == []
+
+
+def test_async_list_events_follows_pages_with_partial_response(monkeypatch):
+    pages = {None: {'items': [{'id': 'evt1'}], 'nextPageToken': 'p2'}, 'p2': {'items': [{'id': 'evt2'}]}}
+    seen = []
+
+    def handler(request):
+        seen.append(dict(request.url.params))
+        return httpx.Response(200, json=pages[request.url.params.get('pageToken')])
+
+    _use_transport(monkeypatch, handler)
+    services = GoogleServices(credentials_object=Credentials(token='test-token'))
+
+    events = asyncio.run(services.async_list_events('primary', 'a', 'b'))
+    assert [e['id'] for e in events] == ['evt1', 'evt2']
+    assert len(seen) == 2
+    assert seen[0]['fields'].startswith('items(id,') and 'nextPageToken' in seen[0]['fields']
+
+
+def test_list_events_follows_pages(monkeypatch):
+    import google_services
+    from benchmarks.run import fake_backends
+
+    monkeypatch.setattr(google_services, 'PAGE_SIZE', 2)
+    with fake_backends() as (backend, _):
+        for hour in range(9, 14):
+            backend.add_event(f"Corte {hour}", f"2026-03-10T{hour:02d}:00:00", f"2026-03-10T{hour:02d}:30:00", "Corte\n\nRef: 42")
+        services = GoogleServices(credentials_object=Credentials(token='test-token'))
+        events = services.list_events('primary', '2026-03-10T05:00:00Z', '2026-03-11T05:00:00Z')
+
+    assert [e['summary'] for e in events] == [f"Corte {hour}" for hour in range(9, 14)]
+    assert backend.requests == 3
+    # Partial response: no htmlLink, creator, etc.
+    assert set(events[0]) == {'id', 'status', 'summary', 'description', 'start', 'end'}
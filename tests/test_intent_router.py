@@ -0,0 +1,76 @@
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.intent_router import IntentRouter
+
+
+class FakeDB:
+    def get_owner_info(self):
+        return {'barberia_name': 'Barbería El Estilo', 'address': 'Calle 10 #20-30', 'phone': '+57 300 123 4567'}
+
+
+class FakeIndex:
+    def __init__(self, appointments):
+        self.appointments = appointments
+
+    def get_upcoming(self, telegram_id):
+        return [a for a in self.appointments if a['telegram_id'] == telegram_id]
+
+
+class FakeAgent:
+    def __init__(self, appointments=()):
+        self.appointment_index = FakeIndex(list(appointments))
+        self.deleted = []
+        self.sheet_rows = []
+
+    def cancel_my_appointment(self, event_id):
+        self.deleted.append(event_id)
+        return True
+
+    def log_to_sheet(self, **row):
+        self.sheet_rows.append(row)
+
+
+APPOINTMENT = {'event_id': 'evt1', 'telegram_id': '42', 'summary': 'Corte - Juan', 'start_time': '2099-01-01T15:00:00Z'}
+
+
+def test_prices_and_service_matcher():
+    router = IntentRouter(FakeDB())
+    agent = FakeAgent()
+    assert "$20000" in router.route(agent, '42', "¿Cuánto cuesta el corte y barba?")
+    assert "$9000" in router.route(agent, '42', "cuánto vale la barba")
+    assert "Tinte y arreglo" in router.route(agent, '42', "precios")
+
+
+def test_owner_data_and_fall_through():
+    router = IntentRouter(FakeDB())
+    agent = FakeAgent()
+    assert "Calle 10 #20-30" in router.route(agent, '42', "¿Cuál es la dirección?")
+    # Agendar siempre va al LLM
+    assert router.route(agent, '42', "Quiero agendar un corte mañana a las 3pm") is None
+    assert router.route(agent, '42', "hola, ¿qué cortes recomiendas para cara redonda?") is None
+    stats = router.get_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2
+
+
+def test_cancel_requires_confirmation():
+    router = IntentRouter(FakeDB())
+    agent = FakeAgent([APPOINTMENT, {**APPOINTMENT, 'event_id': 'other', 'telegram_id': '7'}])
+    assert "Confirmas" in router.route(agent, '42', "quiero cancelar mi cita")
+    assert agent.deleted == []
+    assert "cancelada" in router.route(agent, '42', "sí")
+    assert agent.deleted == ['evt1']
+    assert agent.sheet_rows[0]['estatus'] == 'eliminado'
+    assert agent.sheet_rows[0]['hora'] == '10:00:00'
+    # El título "Servicio - Nombre" se separa como en el registro de la reserva
+    assert {k: agent.sheet_rows[0][k] for k in ('nombre', 'servicio', 'precio')} == \
+        {'nombre': 'Juan', 'servicio': 'Corte para caballero', 'precio': '17000'}
+
+
+def test_next_appointment_only_lists_own_events():
+    router = IntentRouter(FakeDB())
+    agent = FakeAgent([APPOINTMENT, {**APPOINTMENT, 'event_id': 'other', 'summary': 'Corte - Pedro', 'telegram_id': '421'}])
+    reply = router.route(agent, '42', "¿cuándo es mi próxima cita?")
+    assert "Juan" in reply and "Pedro" not in reply
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import logging
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import logging_config
+from services.logging_config import (
+    ContextFilter, JsonFormatter, PiiRedactionFilter, SamplingFilter, log_context, parse_levels, pseudonymize, sampled
+)
+
+
+def _record(msg, level=logging.INFO, **extra):
+    record = logging.LogRecord('test', level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_line_carries_context_ids():
+    with log_context(request_id='tg-42', user_id=123456789):
+        record = _record("Mensaje procesado")
+        ContextFilter().filter(record)
+
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload['msg'] == "Mensaje procesado"
+    assert payload['level'] == 'INFO'
+    assert payload['request_id'] == 'tg-42'
+    assert payload['user_id'] == pseudonymize(123456789)
+    assert '123456789' not in json.dumps(payload)
+
+    # Fuera del bloque no queda contexto colgado
+    outside = _record("otro")
+    ContextFilter().filter(outside)
+    assert outside.request_id is None and outside.user_id is None
+
+
+def test_pii_is_masked():
+    record = _record("Cita para +57 300 123 4567 (user 987654321, juan@mail.com)")
+    PiiRedactionFilter().filter(record)
+    message = record.getMessage()
+    assert '300 123 4567' not in message
+    assert '987654321' not in message
+    assert 'juan@mail.com' not in message
+    assert message.startswith("Cita para <num>")
+
+
+def test_dates_and_times_survive_redaction():
+    for text in ("check_availability 2026-03-10T09:00:00", "create_event 2026-03-10T09:00:00-05:00 -> 2026-03-10T09:45:00",
+                 "agenda 2026-03-10 09:00 a 2026-03-10 18:00", "precio 25000, 3 citas"):
+        record = _record(text)
+        PiiRedactionFilter().filter(record)
+        assert record.getMessage() == text
+    record = _record("celular 300-123-4567 el 2026-03-10")
+    PiiRedactionFilter().filter(record)
+    assert record.getMessage() == "celular <num> el 2026-03-10"
+
+
+def test_sampling_drops_info_but_keeps_warnings(monkeypatch):
+    monkeypatch.setattr(logging_config.random, 'random', lambda: 0.99)
+    sampling = SamplingFilter()
+    assert not sampling.filter(_record("hit", **sampled(0.1)))
+    assert sampling.filter(_record("hit", level=logging.WARNING, **sampled(0.1)))
+    assert sampling.filter(_record("sin muestreo"))
+
+
+def test_parse_levels():
+    assert parse_levels("agent=debug, httpx=WARNING,basura") == {'agent': 'DEBUG', 'httpx': 'WARNING'}
+    assert parse_levels(None) == {}
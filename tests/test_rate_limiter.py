@@ -0,0 +1,47 @@
+import os
+import sys
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import rate_limiter
+from services.rate_limiter import RateLimiter, TokenBucket, media_rejection
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.take(now=bucket.updated) and bucket.take(now=bucket.updated)
+    assert not bucket.take(now=bucket.updated)
+    assert bucket.take(now=bucket.updated + 1)
+    assert not bucket.take(cost=2, now=bucket.updated + 1)
+
+
+def test_user_and_global_limits(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    limiter = RateLimiter(user_rate=6, user_burst=2, global_rate=60, global_burst=3)
+
+    assert limiter.check('1') is None and limiter.check('1') is None
+    assert limiter.check('1') == 'user'
+    # Otro cliente no se ve afectado por el spam del primero...
+    assert limiter.check('2') is None
+    # ...hasta que se acaba el bucket global (y el token del cliente se devuelve)
+    assert limiter.check('3') == 'global'
+    assert limiter._users['3'].tokens == 2
+
+    # Un aviso por minuto, el resto en silencio
+    assert limiter.should_notify('1') and not limiter.should_notify('1')
+    now[0] += 61
+    assert limiter.should_notify('1')
+    assert limiter.check('1') is None
+
+
+def test_media_caps_use_telegram_metadata():
+    def message(voice=None, photo=None):
+        return SimpleNamespace(voice=voice, audio=None, photo=photo)
+
+    assert media_rejection(message()) is None
+    assert media_rejection(message(voice=SimpleNamespace(file_size=50_000, duration=20))) is None
+    assert media_rejection(message(voice=SimpleNamespace(file_size=50_000, duration=600))) == 'media_duration'
+    big_photo = SimpleNamespace(file_size=rate_limiter.MAX_MEDIA_BYTES + 1)
+    assert media_rejection(message(photo=[SimpleNamespace(file_size=10), big_photo])) == 'media_size'
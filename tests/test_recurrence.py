@@ -0,0 +1,109 @@
+import os
+import sys
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.appointment_index import AppointmentIndex, CALENDAR_TZ
+from services.recurrence_service import RecurrenceService, LOCAL_FORMAT
+from tests.fakes import FakeGoogle
+
+FIRST = (datetime.datetime.now(CALENDAR_TZ) + datetime.timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+
+def _at(weeks, hour=10):
+    return (FIRST + datetime.timedelta(weeks=weeks)).replace(hour=hour)
+
+
+class FakeAgent:
+    def __init__(self, index):
+        self.index = index
+        self.deleted = []
+
+    def delete_event(self, event_id):
+        self.deleted.append(event_id)
+        self.index.record_deleted(event_id)
+        return True
+
+
+def _service(db, horizon_weeks=6):
+    index = AppointmentIndex(db)
+    return RecurrenceService(db, index, horizon_weeks=horizon_weeks), index
+
+
+def _created(services, since=0):
+    return [e['start']['dateTime'] for e in services.events['primary'][since:]]
+
+
+def test_create_materializes_horizon_in_one_batch_and_skips_conflicts(local_db):
+    recurrences, index = _service(local_db)
+    services = FakeGoogle()
+    # Otro cliente ya tiene la cita de la semana 2; en la semana 4 el dueño bloqueó la hora (sin Ref, fuera del índice)
+    services.blocks['primary'] = [(_at(2), _at(2) + datetime.timedelta(minutes=30)), (_at(4), _at(4, hour=11))]
+
+    result = recurrences.create(services, 'primary', '42', 'Corte - Juan', 'Corte', _at(0).strftime(LOCAL_FORMAT),
+                                (_at(0) + datetime.timedelta(minutes=45)).strftime(LOCAL_FORMAT), 2)
+    assert services.calls.count('batch') == 1
+    assert result['booked'] == [_at(0).strftime(LOCAL_FORMAT)]
+    assert result['conflicts'] == [_at(w).strftime(LOCAL_FORMAT) for w in (2, 4)]
+    assert 'Ref: 42' in services.events['primary'][0]['description']
+    assert len(index.get_upcoming('42')) == 1
+
+    # El job diario no vuelve a crear lo que ya existe
+    recurrences.extend(services, 'primary')
+    assert services.calls.count('batch') == 1
+
+    # Cuando el horizonte avanza, se crea la siguiente instancia
+    recurrences.horizon_weeks = 8
+    recurrences.extend(services, 'primary')
+    assert _created(services, since=1) == [_at(6).isoformat()]
+
+
+def test_skip_and_stop(local_db):
+    recurrences, index = _service(local_db)
+    services = FakeGoogle()
+    recurrences.create(services, 'primary', '42', 'Corte - Juan', 'Corte', _at(0).strftime(LOCAL_FORMAT),
+                       (_at(0) + datetime.timedelta(minutes=45)).strftime(LOCAL_FORMAT), 3)
+    # Cita normal del mismo cliente: no es parte de la serie
+    index.record_created('42', {'id': 'single', 'summary': 'Afeitado - Juan', 'start': {'dateTime': _at(1, 15).isoformat()}})
+    agent = FakeAgent(index)
+
+    assert recurrences.skip(agent, '42', _at(3).date().isoformat()) == {'skipped': _at(3).date().isoformat(), 'cancelled': 1}
+    assert recurrences.skip(agent, '42', _at(6).date().isoformat())['cancelled'] == 0
+    assert recurrences.skip(agent, '42', _at(1).date().isoformat()) is None
+
+    # La fecha saltada no se materializa
+    recurrences.horizon_weeks = 10
+    recurrences.extend(services, 'primary')
+    assert _created(services, since=2) == [_at(9).isoformat()]
+
+    assert recurrences.stop(agent, '42') == {'stopped': 1, 'cancelled': 2}
+    assert [a['event_id'] for a in index.get_upcoming('42')] == ['single']
+    assert recurrences.db.get_active_recurrences('42') == []
+
+
+def test_conflicts_fall_back_to_index_when_calendar_is_down(local_db):
+    recurrences, index = _service(local_db)
+    index.record_created('99', {'id': 'other', 'summary': 'Corte - Ana',
+                                'start': {'dateTime': _at(2).isoformat()},
+                                'end': {'dateTime': (_at(2) + datetime.timedelta(minutes=30)).isoformat()}})
+    services = FakeGoogle()
+    services.down = {'free_busy'}
+
+    result = recurrences.create(services, 'primary', '42', 'Corte - Juan', 'Corte', _at(0).strftime(LOCAL_FORMAT),
+                                (_at(0) + datetime.timedelta(minutes=45)).strftime(LOCAL_FORMAT), 2)
+    assert result['booked'] == [_at(w).strftime(LOCAL_FORMAT) for w in (0, 4)]
+    assert result['conflicts'] == [_at(2).strftime(LOCAL_FORMAT)]
+
+
+def test_skip_and_stop_without_a_series_do_not_count_as_writes(local_db):
+    from agent import BarberAgent
+
+    recurrences, _ = _service(local_db)
+    agent = BarberAgent.__new__(BarberAgent)
+    agent.recurrences, agent.current_user_id, agent._writes = recurrences, '42', 0
+
+    # Nada escrito: el turno todavía se puede reintentar si Gemini falla
+    assert agent.skip_recurring_appointment(_at(1).date().isoformat()).startswith("Error")
+    assert agent.stop_recurring_appointment() == {'stopped': 0, 'cancelled': 0}
+    assert agent._writes == 0
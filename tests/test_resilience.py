@@ -0,0 +1,166 @@
+import os
+import sys
+import datetime
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, Guarded
+from services.appointment_index import AppointmentIndex, CALENDAR_TZ
+from services.booking_queue import BookingQueue
+from tests.fakes import FakeGoogle
+
+TOMORROW = (datetime.datetime.now(CALENDAR_TZ) + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class NotFound(Exception):
+    code = 404
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(resilience.time, 'sleep', lambda seconds: None)
+    resilience._breakers.clear()
+
+
+def _failing(error, calls):
+    def fn():
+        calls.append(1)
+        raise error
+    return fn
+
+
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    circuit = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+    calls = []
+    for _ in range(2):
+        with pytest.raises(Unavailable):
+            circuit.call(_failing(Unavailable(), calls))
+    assert circuit.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        circuit.call(lambda: 'ok')
+
+    # Pasado el reset_timeout deja pasar una sola llamada de prueba
+    now = resilience.time.monotonic()
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now + 31)
+    assert circuit.state == 'half_open'
+    with pytest.raises(Unavailable):
+        circuit.call(_failing(Unavailable(), calls))
+    assert circuit.is_open()
+
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now + 62)
+    assert circuit.call(lambda: 'ok') == 'ok'
+    assert circuit.state == 'closed'
+
+    # Un 404 no cuenta como caída de la dependencia
+    for _ in range(3):
+        with pytest.raises(NotFound):
+            circuit.call(_failing(NotFound(), calls))
+    assert circuit.state == 'closed'
+
+
+def test_call_retries_only_idempotent_transient_errors():
+    calls = []
+    with pytest.raises(Unavailable):
+        resilience.call('retry-test', _failing(Unavailable(), calls), attempts=3)
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(Unavailable):
+        resilience.call('retry-test', _failing(Unavailable(), calls), idempotent=False, attempts=3)
+    assert len(calls) == 1
+
+    calls.clear()
+    with pytest.raises(NotFound):
+        resilience.call('retry-test', _failing(NotFound(), calls), attempts=3)
+    assert len(calls) == 1
+
+    outcomes = iter([TimeoutError('slow'), 'ok'])
+
+    def flaky():
+        value = next(outcomes)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    assert resilience.call('retry-test', flaky) == 'ok'
+
+
+def test_guarded_routes_chained_execute_through_breaker():
+    class Query:
+        def eq(self, *args):
+            return self
+
+        def execute(self):
+            raise TimeoutError('slow')
+
+    class Client:
+        def table(self, name):
+            return Query()
+
+    client = Guarded(Client(), 'guarded-test')
+    for _ in range(resilience.BREAKER_FAILURES):
+        with pytest.raises(TimeoutError):
+            client.table('appointments').eq('event_id', 'x').execute()
+    with pytest.raises(CircuitOpenError):
+        client.table('appointments').eq('event_id', 'x').execute()
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return True
+
+
+def test_queued_bookings_are_created_when_calendar_recovers(local_db):
+    db = local_db
+    index, outbox = AppointmentIndex(db), FakeOutbox()
+    queue = BookingQueue(db, outbox, index)
+    queue.enqueue('1', 'primary', 'Corte - Juan', 'Corte\n\nRef: 1', f"{TOMORROW}T10:00:00", f"{TOMORROW}T10:45:00")
+    queue.enqueue('2', 'primary', 'Corte - Ana', 'Corte\n\nRef: 2', f"{TOMORROW}T11:00:00", f"{TOMORROW}T11:45:00")
+    services = FakeGoogle()
+    services.down = True
+
+    # Calendar sigue caído: nada se crea y las reservas siguen en cola
+    assert queue.flush(services) == 0
+    assert len(db.get_pending_bookings()) == 2
+
+    services.down = False
+    services.blocks['primary'] = [(f"{TOMORROW}T16:00:00Z", f"{TOMORROW}T16:30:00Z")]
+    assert queue.flush(services) == 1
+    assert [e['summary'] for e in services.events['primary']] == ['Corte - Juan']
+    assert [a['event_id'] for a in index.get_upcoming('1')] == ['e1']
+    assert db.get_pending_bookings() == []
+    assert outbox.sent[0][0] == '1' and 'confirmada' in outbox.sent[0][1]
+    assert outbox.sent[1][0] == '2' and 'ya no está disponible' in outbox.sent[1][1]
+
+
+def test_queued_booking_is_logged_once_with_its_event_id(local_db):
+    from agent import BarberAgent
+    from services.booking_ledger import BookingLedger
+
+    ledger = BookingLedger(local_db)
+    queue = BookingQueue(local_db, FakeOutbox(), ledger=ledger)
+    services = FakeGoogle()
+    services.down = True
+    agent = BarberAgent.__new__(BarberAgent)
+    agent.services, agent.barbers, agent.CALENDAR_ID, agent.SPREADSHEET_ID = services, [{'calendar_id': 'primary'}], 'primary', 'sheet'
+    agent.booking_queue, agent.ledger, agent.booking_keys, agent.analytics = queue, ledger, None, None
+    agent.appointment_index = agent.agenda = agent.notify_admin_callback = None
+    agent.is_admin, agent.current_user_id, agent._writes, agent._queued_booking = False, '1', 0, None
+
+    assert agent.create_event('Corte para caballero - Juan', 'Corte', f"{TOMORROW}T10:00:00", f"{TOMORROW}T10:45:00")['status'] == 'queued'
+    # El modelo registra la cita sin ID: no debe quedar una fila 'local-...' aparte
+    result = agent.log_to_sheet('Juan', 'Corte para caballero', '17000', '10:00:00', 'agendado', TOMORROW, '1', '')
+    assert result['status'] == 'queued' and local_db.get_ledger_entries() == []
+
+    services.down = False
+    assert queue.flush(services) == 1
+    assert [(e['id'], e['nombre'], e['estatus']) for e in local_db.get_ledger_entries()] == [('e1', 'Juan', 'agendado')]
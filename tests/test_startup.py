@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database import Database
+from services.startup import warm_up
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_importing_main_skips_heavy_sdks(tmp_path):
+    env = dict(os.environ, DB_DIR=str(tmp_path), TELEGRAM_TOKEN='', SUPABASE_URL='', SUPABASE_KEY='')
+    code = (
+        "import sys, main; "
+        "print('loaded=' + ','.join(m for m in ('google.generativeai', 'googleapiclient.discovery', 'supabase') if m in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip().splitlines()[-1] == 'loaded='
+
+
+def test_database_connects_in_warm_up(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_DIR', str(tmp_path))
+    monkeypatch.delenv('SUPABASE_URL', raising=False)
+    monkeypatch.delenv('SUPABASE_KEY', raising=False)
+
+    db = Database(connect=False)
+    assert not db._connected
+    # SQLite responde sin esperar a la conexión
+    db.set_config_value('k', 'v')
+    assert db._connected  # el primer acceso a db.supabase conecta
+    assert db.get_config_value('k') == 'v'
+
+    lazy = Database(connect=False)
+    warm_up(lazy, modules=())
+    assert lazy._connected and lazy.supabase is None
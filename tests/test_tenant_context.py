@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class MissingView(Exception):
+    code = 'PGRST205'
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client.queries.append(self.table)
+        if self.table == 'tenant_context':
+            if not self.client.has_view:
+                raise MissingView('relation "tenant_context" does not exist')
+            return type('Res', (), {'data': [self.client.row]})()
+        return type('Res', (), {'data': []})()
+
+
+class FakeSupabase:
+    def __init__(self, row, has_view=True):
+        self.row = row
+        self.has_view = has_view
+        self.queries = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+def test_sqlite_context_is_one_cached_read(local_db):
+    db = local_db
+    assert db.get_tenant_context() == {'admin_id': None, 'owner': None, 'credentials': None}
+
+    db.set_admin_id('42', 'kevin', 'Kevin', barberia_name='La 42')
+    context = db.get_tenant_context()
+    assert context['admin_id'] == '42' and context['credentials'] is None
+    assert context['owner']['barberia_name'] == 'La 42' and context['owner']['telegram_id'] == '42'
+    assert db.get_tenant_context() is context
+
+    # Las escrituras invalidan la unidad completa
+    db.save_user_credentials('42', {'token': 't', 'refresh_token': 'r'})
+    db.update_owner_info(owner_phone='+57 300')
+    context = db.get_tenant_context()
+    assert context['credentials'] == {'token': 't', 'refresh_token': 'r'}
+    assert context['owner']['phone'] == '+57 300'
+
+    db.reset_configuration()
+    assert db.get_tenant_context()['admin_id'] is None
+
+
+def test_supabase_view_is_a_single_round_trip(local_db):
+    db = local_db
+    db._supabase = FakeSupabase({
+        'admin_id': '42', 'credentials_json': json.dumps({'token': 't'}), 'owner_telegram_id': '42',
+        'owner_name': 'Kevin', 'owner_username': None, 'barberia_name': 'La 42',
+        'owner_phone': None, 'owner_address': None, 'created_at': '2026-01-01',
+    })
+    context = db.get_tenant_context()
+    db.get_tenant_context()
+    assert db._supabase.queries == ['tenant_context']
+    assert context['credentials'] == {'token': 't'} and context['owner']['name'] == 'Kevin'
+
+
+def test_missing_view_falls_back_to_separate_queries(local_db):
+    db = local_db
+    db._supabase = FakeSupabase(None, has_view=False)
+    assert db.get_tenant_context()['admin_id'] is None
+    db.get_tenant_context()
+    # La vista se intenta una sola vez
+    assert db._supabase.queries.count('tenant_context') == 1
+    assert {'config', 'bot_info'} <= set(db._supabase.queries)
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agent import BarberAgent
+
+
+def _agent(tools):
+    agent = BarberAgent.__new__(BarberAgent)
+    agent.tools = tools
+    return agent
+
+
+def _call(name, **args):
+    return SimpleNamespace(name=name, args=args)
+
+
+def test_independent_calls_run_concurrently():
+    # Cada herramienta espera a la otra: solo termina si corren al mismo tiempo
+    barrier = threading.Barrier(2, timeout=5)
+
+    def check_availability(time_min, time_max):
+        barrier.wait()
+        return {'free': True}
+
+    def my_appointments():
+        barrier.wait()
+        return []
+
+    agent = _agent([check_availability, my_appointments])
+    results = agent._run_tools([_call('check_availability', time_min='a', time_max='b'), _call('my_appointments')])
+    assert results == [{'free': True}, []]
+
+
+def test_dependent_call_waits_for_its_source():
+    logged = []
+
+    def create_event(summary):
+        return {'id': 'evt1', 'summary': summary}
+
+    def log_to_sheet(nombre, event_id):
+        logged.append(event_id)
+        return True
+
+    agent = _agent([create_event, log_to_sheet])
+    # El modelo no conoce el ID todavía: se toma del resultado de create_event
+    results = agent._run_tools([_call('log_to_sheet', nombre='Juan', event_id=''), _call('create_event', summary='Corte')])
+    assert results == [True, {'id': 'evt1', 'summary': 'Corte'}]
+    assert logged == ['evt1']
+
+    def failing_create_event(summary):
+        return "Error: no barber is free at that time."
+    failing_create_event.__name__ = 'create_event'
+
+    agent = _agent([failing_create_event, log_to_sheet])
+    results = agent._run_tools([_call('create_event', summary='Corte'), _call('log_to_sheet', nombre='Juan', event_id='')])
+    assert results[1].startswith('Skipped')
+    assert logged == ['evt1']
+    assert agent._run_tools([_call('unknown')]) == ['Error: unknown tool unknown.']
+
+
+def _booking_tools(logged):
+    created = iter(['new1', 'new2'])
+
+    def create_event(summary):
+        return {'id': next(created), 'summary': summary}
+
+    def log_to_sheet(estatus, event_id, nombre=''):
+        logged.append((nombre or estatus, event_id))
+        return True
+    return [create_event, log_to_sheet]
+
+
+def test_reschedule_keeps_the_id_the_model_passed():
+    logged = []
+    agent = _agent(_booking_tools(logged))
+    agent._run_tools([_call('log_to_sheet', estatus='eliminado', event_id='OLD'), _call('create_event', summary='Corte'),
+                      _call('log_to_sheet', estatus='agendado', event_id='')])
+    assert sorted(logged) == [('agendado', 'new1'), ('eliminado', 'OLD')]
+
+
+def test_each_booking_is_logged_with_its_own_event():
+    logged = []
+    agent = _agent(_booking_tools(logged))
+    results = agent._run_tools([
+        _call('log_to_sheet', estatus='eliminado', event_id='OLD'), _call('create_event', summary='Corte'),
+        _call('create_event', summary='Barba'), _call('log_to_sheet', estatus='agendado', event_id='', nombre='Corte'),
+        _call('log_to_sheet', estatus='agendado', event_id='', nombre='Barba'),
+    ])
+    # El n-ésimo log_to_sheet sin ID va con el n-ésimo create_event
+    assert sorted(logged) == sorted([('eliminado', 'OLD'), ('Corte', results[1]['id']), ('Barba', results[2]['id'])])
+    assert results[1]['id'] != results[2]['id']
+
+
+def test_ambiguous_dependencies_run_without_filling():
+    logged = []
+    agent = _agent(_booking_tools(logged))
+    agent._run_tools([_call('create_event', summary='Corte'), _call('create_event', summary='Barba'),
+                      _call('log_to_sheet', estatus='agendado', event_id='')])
+    assert logged == [('agendado', '')]
@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.tool_results import project, to_model
+
+EVENT = {
+    'kind': 'calendar#event', 'etag': '"123"', 'id': 'evt1', 'status': 'confirmed',
+    'htmlLink': 'https://www.google.com/calendar/event?eid=evt1', 'summary': 'Corte - Juan',
+    'description': 'Corte\n\nRef: 555', 'creator': {'email': 'barberia@example.com', 'self': True},
+    'start': {'dateTime': '2026-01-10T10:00:00-05:00', 'timeZone': 'America/Bogota'},
+    'end': {'dateTime': '2026-01-10T10:45:00-05:00', 'timeZone': 'America/Bogota'},
+    'barber': 'Kevin',
+}
+
+
+def test_events_are_reduced_to_minimal_records():
+    assert project(EVENT) == {'id': 'evt1', 'start': '2026-01-10T10:00:00-05:00', 'end': '2026-01-10T10:45:00-05:00',
+                              'title': 'Corte - Juan', 'status': 'confirmed', 'barber': 'Kevin'}
+    # El dueño conserva la descripción (con el Ref del cliente)
+    assert project(EVENT, customer=False)['description'] == 'Corte\n\nRef: 555'
+    # Listas anidadas (agenda por barbero del dueño)
+    nested = project([{'barber': 'Kevin', 'events': [EVENT]}], customer=False)
+    assert nested[0]['events'][0]['id'] == 'evt1'
+
+
+def test_appointments_hide_telegram_ids_from_customers():
+    row = {'event_id': 'evt1', 'telegram_id': '555', 'start_time': '2026-01-10T15:00:00Z',
+           'end_time': '2026-01-10T15:45:00Z', 'summary': 'Corte - Juan', 'calendar_id': 'primary'}
+    assert project([row]) == [{'id': 'evt1', 'start': '2026-01-10T15:00:00Z', 'end': '2026-01-10T15:45:00Z',
+                               'title': 'Corte - Juan'}]
+    assert project(row, customer=False)['customer'] == '555'
+    # Otros resultados pasan sin cambios
+    assert to_model('check_availability', {'free': True, 'busy': []}) == {'free': True, 'busy': []}
+    assert 'Ref' not in str(to_model('create_event', EVENT))
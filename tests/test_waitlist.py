@@ -0,0 +1,144 @@
+import os
+import sys
+import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.appointment_index import CALENDAR_TZ
+from services.waitlist_service import WaitlistService
+from tests.fakes import FakeGoogle
+
+TOMORROW = (datetime.datetime.now(CALENDAR_TZ) + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return True
+
+
+class FakeAgent:
+    CALENDAR_ID = 'primary'
+
+    def __init__(self):
+        self.busy = False
+        self.queued = False
+        self.created = []
+        self.logged = []
+
+    def free_barber(self, start_time, end_time, barber=''):
+        return None if self.busy else {'name': None}
+
+    def create_event(self, summary, description, start_time, end_time, barber=''):
+        self.created.append((summary, start_time, end_time))
+        return {'status': 'queued', 'id': None} if self.queued else {'id': 'evt1'}
+
+    def log_to_sheet(self, **kwargs):
+        self.logged.append(kwargs)
+
+
+def _waitlist(db):
+    outbox = FakeOutbox()
+    return WaitlistService(db, outbox, hold_minutes=15), outbox
+
+
+def _slot(hour):
+    return f"{TOMORROW}T{hour:02d}:00:00-05:00", f"{TOMORROW}T{hour + 1:02d}:00:00-05:00"
+
+
+def test_match_picks_oldest_covering_window(local_db):
+    waitlist, _ = _waitlist(local_db)
+    first = waitlist.join('1', TOMORROW, '09:00', '12:00', name='Juan')
+    waitlist.join('2', TOMORROW, '14:00', '18:00', name='Pedro')
+    waitlist.join('3', TOMORROW, name='Ana')
+
+    slot = {'day': TOMORROW, 'from': '10:00', 'to': '11:00'}
+    assert waitlist.match(slot)['id'] == first['id']
+    assert waitlist.match({'day': TOMORROW, 'from': '15:00', 'to': '16:00'})['telegram_id'] == '2'
+    assert waitlist.match({'day': TOMORROW, 'from': '11:30', 'to': '12:30'})['telegram_id'] == '3'
+
+    # Una nueva inscripción del mismo cliente reemplaza la anterior
+    waitlist.join('1', TOMORROW, '16:00', '17:00', name='Juan')
+    assert len(waitlist.get_entries('1')) == 1
+    assert waitlist.match(slot)['telegram_id'] == '3'
+
+    # El índice se reconstruye igual desde la BD
+    fresh = WaitlistService(waitlist.db)
+    assert sorted(e['telegram_id'] for e in fresh.get_entries('1') + fresh.get_entries('3')) == ['1', '3']
+
+
+def test_declined_and_expired_offers_move_to_next_candidate(local_db):
+    waitlist, outbox = _waitlist(local_db)
+    waitlist.join('1', TOMORROW, name='Juan')
+    waitlist.join('2', TOMORROW, name='Pedro')
+    waitlist.join('3', TOMORROW, name='Ana')
+
+    assert waitlist.slot_freed(*_slot(10))['telegram_id'] == '1'
+    assert waitlist.pending_offer('1') and outbox.sent[-1][0] == '1'
+
+    waitlist.decline('1')
+    assert waitlist.pending_offer('1') is None
+    assert waitlist.pending_offer('2')
+
+    waitlist._offers['2']['expires_at'] = 0
+    assert waitlist.expire_offers() == 1
+    assert waitlist.pending_offer('3')
+    assert [chat for chat, _ in outbox.sent] == ['1', '2', '2', '3']
+
+    # Nadie más en espera: la oferta se pierde sin error
+    waitlist.decline('3')
+    assert waitlist._offers == {}
+
+
+def test_accept_books_the_slot(local_db):
+    waitlist, _ = _waitlist(local_db)
+    entry = waitlist.join('1', TOMORROW, '09:00', '12:00', service='corte y barba', name='Juan')
+    agent = FakeAgent()
+    start, end = _slot(10)
+
+    waitlist.slot_freed(start, end)
+    agent.busy = True
+    assert "alguien tomó" in waitlist.accept(agent, '1')
+    assert waitlist.get_entries('1')  # sigue en espera
+
+    waitlist.slot_freed(start, end)
+    agent.busy = False
+    assert "Listo" in waitlist.accept(agent, '1')
+    assert agent.created[0][0] == 'Corte y barba - Juan'
+    assert agent.logged[0]['event_id'] == 'evt1' and agent.logged[0]['precio'] == '20000'
+    assert waitlist.get_entries('1') == []
+    assert waitlist.db.get_waiting_entries(TOMORROW) == []
+    assert entry['id'] not in {o['entry']['id'] for o in waitlist._offers.values()}
+
+    # Con Calendar caído la reserva queda en cola: la registra la cola al crearla, no aquí
+    waitlist.join('2', TOMORROW, name='Pedro')
+    waitlist.slot_freed(*_slot(11))
+    agent.queued = True
+    assert "te confirmo" in waitlist.accept(agent, '2')
+    assert len(agent.created) == 2 and len(agent.logged) == 1
+
+
+def test_cancellation_frees_slot_from_index_without_calendar_read(local_db):
+    from agent import BarberAgent
+    from services.appointment_index import AppointmentIndex
+
+    waitlist, outbox = _waitlist(local_db)
+    # Misma hora de inicio: el índice no llega a comparar las entradas
+    waitlist.join('1', TOMORROW, '09:00', '12:00', name='Juan')
+    waitlist.join('2', TOMORROW, '09:00', '12:00', name='Pedro')
+    index = AppointmentIndex(waitlist.db)
+    start, end = _slot(10)
+    index.record_created('9', {'id': 'evt9', 'summary': 'Corte - Ana', 'start': {'dateTime': start}, 'end': {'dateTime': end}})
+
+    services = FakeGoogle([{'id': 'evt9', 'summary': 'Corte - Ana', 'start': {'dateTime': start}, 'end': {'dateTime': end}}])
+
+    agent = BarberAgent.__new__(BarberAgent)
+    agent.services, agent.barbers, agent.CALENDAR_ID = services, [{'calendar_id': 'primary'}], 'primary'
+    agent.appointment_index, agent.waitlist, agent.agenda, agent.ledger, agent._writes = index, waitlist, None, None, 0
+    assert agent.delete_event('evt9') is True
+    assert services.calls == ['delete']  # sin leer el evento
+    assert waitlist.pending_offer('1')['slot']['from'] == '10:00'
+    assert outbox.sent[-1][0] == '1'